@@ -1,25 +1,311 @@
-from flask import Flask, render_template, request, jsonify, send_file, redirect, url_for
+from flask import Flask, Request, render_template, request, jsonify, send_file, redirect, url_for, Response, stream_with_context, g
+from werkzeug.http import parse_content_range_header
+from werkzeug.wsgi import get_input_stream
 from utils.crypto import encrypt_text, decrypt_text
-from utils.file_crypto import FileEncryptor
-from utils.watermark.word import WordWatermark
-from utils.watermark.ppt import PPTWatermark
-from utils.watermark.pdf import PDFWatermark
+from utils.watermark.handlers import HANDLER_SPECS, HandlerRegistry, MeteredHandlers
+from utils.watermark.executor import WatermarkExecutor
+from utils.watermark.registry import WatermarkRegistry, fingerprint, file_sha256
+from utils.watermark.result_cache import ResultCache, HashingSpool, cache_key, content_sha256
+from utils.jobs import JobManager
+from utils.uploads import UploadManager, UploadError, UploadConflictError, UploadTooLargeError
+from utils.zip_stream import iter_zip, unique_name
+from utils.metrics import METRICS
+from utils.profiling import RequestProfiler
 import os
 import base64
+import json
+import shutil
 import tempfile
+import time
+
+class HashingRequest(Request):
+    """上传文件在接收时同步计算 SHA-256，供登记表和结果缓存使用"""
+    # 与 werkzeug 默认值相同：小于该大小的上传文件保存在内存中，否则溢出到磁盘
+    SPOOL_MAX_SIZE = 500 * 1024
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        return HashingSpool(tempfile.SpooledTemporaryFile(max_size=self.SPOOL_MAX_SIZE),
+                            self.SPOOL_MAX_SIZE)
 
 app = Flask(__name__)
+app.request_class = HashingRequest
 UPLOAD_FOLDER = 'uploads'
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024
+# 后台任务：工作线程数与结果保留时间（秒）
+app.config['JOB_FOLDER'] = os.path.join(UPLOAD_FOLDER, 'jobs')
+app.config['JOB_WORKERS'] = int(os.environ.get('JOB_WORKERS', 2))
+app.config['JOB_TTL'] = int(os.environ.get('JOB_TTL', 3600))
+
+# 流式文件加密：请求体大小上限（0 表示不限制，不受 MAX_CONTENT_LENGTH 约束）、每个连接的加解密线程数
+app.config['STREAM_MAX_CONTENT_LENGTH'] = int(os.environ.get('STREAM_MAX_CONTENT_LENGTH', 0))
+app.config['STREAM_CRYPTO_WORKERS'] = int(os.environ.get('STREAM_CRYPTO_WORKERS', 1))
+
+# 分块上传：会话目录、整个文件的大小上限（单个分块仍受 MAX_CONTENT_LENGTH 限制）、未完成会话的保留时间（秒）
+app.config['UPLOAD_SESSION_FOLDER'] = os.path.join(UPLOAD_FOLDER, 'sessions')
+app.config['UPLOAD_MAX_SIZE'] = int(os.environ.get('UPLOAD_MAX_SIZE', 4 * 1024 ** 3))
+app.config['UPLOAD_SESSION_TTL'] = int(os.environ.get('UPLOAD_SESSION_TTL', 24 * 3600))
+
+# 水印处理进程池：进程数（0 表示在请求线程中直接处理）、单任务时限（秒）、进程回收前的任务数
+app.config['WATERMARK_WORKERS'] = int(os.environ.get('WATERMARK_WORKERS', os.cpu_count() or 1))
+app.config['WATERMARK_TIMEOUT'] = float(os.environ.get('WATERMARK_TIMEOUT', 60))
+app.config['WATERMARK_MAX_TASKS'] = int(os.environ.get('WATERMARK_MAX_TASKS', 200))
+
+# 水印登记表（SQLite 文件路径，留空则不登记）
+app.config['WATERMARK_REGISTRY'] = os.environ.get('WATERMARK_REGISTRY', os.path.join(UPLOAD_FOLDER, 'watermarks.db'))
+
+# 提取结果缓存：内存条目数（0 表示不缓存）、磁盘目录（留空则只用内存）和磁盘总大小上限
+app.config['RESULT_CACHE_ENTRIES'] = int(os.environ.get('RESULT_CACHE_ENTRIES', 1024))
+app.config['RESULT_CACHE_DIR'] = os.environ.get('RESULT_CACHE_DIR', '')
+app.config['RESULT_CACHE_MAX_BYTES'] = int(os.environ.get('RESULT_CACHE_MAX_BYTES', 256 * 1024 * 1024))
+
+# 请求性能分析：触发令牌（X-Profile 头或 profile 查询参数）、随机采样率、分析方式（cprofile/sample）
+# 以及结果目录的文件数和总大小上限
+app.config['PROFILE_FOLDER'] = os.environ.get('PROFILE_FOLDER', os.path.join(UPLOAD_FOLDER, 'profiles'))
+app.config['PROFILE_TOKEN'] = os.environ.get('PROFILE_TOKEN', '')
+app.config['PROFILE_SAMPLE_RATE'] = float(os.environ.get('PROFILE_SAMPLE_RATE', 0))
+app.config['PROFILE_MODE'] = os.environ.get('PROFILE_MODE', 'cprofile')
+app.config['PROFILE_MAX_FILES'] = int(os.environ.get('PROFILE_MAX_FILES', 50))
+app.config['PROFILE_MAX_BYTES'] = int(os.environ.get('PROFILE_MAX_BYTES', 100 * 1024 * 1024))
+
+# 支持的水印处理器，各格式的依赖在首次使用时才导入
+if app.config['WATERMARK_WORKERS'] > 0:
+    WATERMARK_EXECUTOR = WatermarkExecutor(
+        HANDLER_SPECS,
+        size=app.config['WATERMARK_WORKERS'],
+        timeout=app.config['WATERMARK_TIMEOUT'],
+        max_tasks=app.config['WATERMARK_MAX_TASKS']
+    )
+    WATERMARK_HANDLERS = MeteredHandlers(WATERMARK_EXECUTOR.handlers())
+else:
+    WATERMARK_EXECUTOR = None
+    WATERMARK_HANDLERS = MeteredHandlers(HandlerRegistry(HANDLER_SPECS))
+
+JOB_MANAGER = JobManager(app.config['JOB_FOLDER'],
+                         max_workers=app.config['JOB_WORKERS'],
+                         ttl=app.config['JOB_TTL'])
+
+UPLOAD_MANAGER = UploadManager(app.config['UPLOAD_SESSION_FOLDER'],
+                               max_size=app.config['UPLOAD_MAX_SIZE'],
+                               ttl=app.config['UPLOAD_SESSION_TTL'])
+
+REGISTRY = WatermarkRegistry(app.config['WATERMARK_REGISTRY']) if app.config['WATERMARK_REGISTRY'] else None
+
+if app.config['RESULT_CACHE_ENTRIES'] > 0:
+    RESULT_CACHE = ResultCache(app.config['RESULT_CACHE_ENTRIES'],
+                               directory=app.config['RESULT_CACHE_DIR'] or None,
+                               max_bytes=app.config['RESULT_CACHE_MAX_BYTES'])
+else:
+    RESULT_CACHE = None
+
+PROFILER = RequestProfiler(app.config['PROFILE_FOLDER'],
+                           token=app.config['PROFILE_TOKEN'],
+                           sample_rate=app.config['PROFILE_SAMPLE_RATE'],
+                           mode=app.config['PROFILE_MODE'],
+                           max_files=app.config['PROFILE_MAX_FILES'],
+                           max_bytes=app.config['PROFILE_MAX_BYTES'])
+# 被分析的请求在本进程内处理水印，否则分析结果中只有等待进程池返回的时间
+PROFILED_HANDLERS = MeteredHandlers(HandlerRegistry(HANDLER_SPECS)) if WATERMARK_EXECUTOR else WATERMARK_HANDLERS
+
+def _handlers():
+    """当前线程使用的水印处理器"""
+    return PROFILED_HANDLERS if PROFILER.active() else WATERMARK_HANDLERS
+
+@app.before_request
+def _start_profiling():
+    # 先于其他钩子注册，分析范围包含表单解析
+    if PROFILER.enabled and PROFILER.wanted(request.headers.get('X-Profile'),
+                                            request.args.get('profile')):
+        g.profile_capture = PROFILER.start()
+
+@app.teardown_request
+def _finish_profiling(error=None):
+    capture = g.pop('profile_capture', None)
+    if capture is None:
+        return
+    ext = ''
+    try:
+        if request.mimetype == 'multipart/form-data':
+            names = [file.filename for file in request.files.values() if file.filename]
+            if names:
+                ext = os.path.splitext(names[0])[1].lower()
+    except Exception:
+        # 如请求体超过大小限制，表单无法解析
+        pass
+    PROFILER.stop(capture, request.endpoint, ext, request.content_length)
+
+@app.before_request
+def _start_request_timer():
+    g.request_started = time.perf_counter()
+    if request.mimetype == 'multipart/form-data':
+        # 提前解析表单，把上传接收与解析的耗时和视图本身分开统计
+        with METRICS.timer('http_stage_seconds', endpoint=request.endpoint or 'unknown', stage='parse_form'):
+            request.files
+
+@app.after_request
+def _record_request(response):
+    started = g.pop('request_started', None)
+    if started is not None:
+        endpoint = request.endpoint or 'unknown'
+        METRICS.observe('http_request_seconds', time.perf_counter() - started, endpoint=endpoint)
+        METRICS.inc('http_requests_total', endpoint=endpoint, status=response.status_code)
+        if request.content_length:
+            METRICS.inc('http_request_bytes_total', request.content_length, endpoint=endpoint)
+    return response
+
+def _register(filename, result, core_data):
+    """把嵌入结果登记到水印登记表，登记失败不影响嵌入本身"""
+    if REGISTRY is None:
+        return
+    try:
+        REGISTRY.record(core_data,
+                        file_hash=file_sha256(result.output),
+                        filename=os.path.basename(filename),
+                        ext=os.path.splitext(filename)[1].lower(),
+                        created=result.timestamp)
+    except Exception as e:
+        print(f"Error registering watermark: {str(e)}")
+
+def _registered(digest):
+    """按文件哈希查询登记表，返回最近一次登记的记录或 None"""
+    if REGISTRY is None:
+        return None
+    try:
+        records = REGISTRY.lookup_hash(digest)
+    except Exception as e:
+        print(f"Error querying watermark registry: {str(e)}")
+        return None
+    return records[-1] if records else None
+
+def _extract(ext, source, digest=None):
+    """提取水印，启用结果缓存时相同内容只解析一次"""
+    handler = _handlers()[ext]
+    # 被分析的请求总是实际解析，分析结果才有意义
+    if RESULT_CACHE is None or PROFILER.active():
+        return handler.extract_watermark(source)
+    key = cache_key(ext, digest or content_sha256(source))
+    return RESULT_CACHE.get_or_compute(key, lambda: handler.extract_watermark(source))
+
+def _wants_async():
+    """表单中 async=1/true 时以后台任务方式处理"""
+    return request.form.get('async', '').lower() in ('1', 'true', 'yes')
+
+def _watermark_one(filename, source, username, content, password=None):
+    """为单个文件嵌入水印，返回 {'filename', 'output'} 或 {'error'}
+
+    source 为路径时 output 是处理后文件的路径，为文件对象时 output 是临时文件对象；
+    未提供 password 时使用用户名作为密钥。
+    """
+    ext = os.path.splitext(filename)[1].lower()
+    if ext not in WATERMARK_HANDLERS:
+        return {'error': f"{filename}: 不支持的文件类型"}
+    try:
+        # 添加水印（隐藏信息）
+        handler = _handlers()[ext]
+        watermark_data = {
+            'content': content,  # 要隐藏的信息
+            'user': username     # 用户名
+        }
+        result = handler.embed_watermark(
+            source,
+            watermark_data,
+            password or username  # 默认使用用户名作为密钥
+        )
+        _register(filename, result, watermark_data)
+        return {'filename': f'processed_{filename}', 'output': result.output}
+    except Exception as e:
+        return {'error': f"{filename}: 处理失败 - {str(e)}"}
+
+def _extract_one(filename, source):
+    """从单个文件（路径或文件对象）中提取隐藏信息，返回 {'filename', 'content'} 或 {'error'}"""
+    ext = os.path.splitext(filename)[1].lower()
+    if ext not in WATERMARK_HANDLERS:
+        return {'error': f"{filename}: 不支持的文件类型"}
+    try:
+        # 上传文件的哈希在接收时已算出
+        digest = content_sha256(source) if REGISTRY is not None or RESULT_CACHE is not None else None
+        
+        # 原样分发的文件可按哈希直接从登记表得到结果，无需解析
+        record = _registered(digest)
+        if record is not None:
+            return {
+                'filename': filename,
+                'content': {'content': record['content'], 'user': record['user']}
+            }
+        
+        # 提取水印
+        hidden_info = _extract(ext, source, digest)
+        if not hidden_info:
+            return {'error': f"{filename}: 未找到隐藏信息"}
+        return {
+            'filename': filename,
+            'content': {
+                'content': hidden_info.get('content', ''),
+                'user': hidden_info.get('user', '')
+            }
+        }
+    except Exception as e:
+        return {'error': f"{filename}: 处理失败 - {str(e)}"}
 
-# 支持的水印处理器
-WATERMARK_HANDLERS = {
-    '.docx': WordWatermark(),
-    '.pptx': PPTWatermark(),
-    '.pdf': PDFWatermark()
-}
+def _watermark_entries(inputs, username, content, workdir):
+    """逐个处理已保存的上传文件并产出 ZIP 条目，最后产出记录每个文件结果的 manifest.json"""
+    manifest = []
+    used = {'manifest.json'}
+    try:
+        for filename, input_path in inputs:
+            watermarked_path = None
+            try:
+                result = _watermark_one(filename, input_path, username, content)
+                if 'output' in result:
+                    watermarked_path = result['output']
+                    entry = unique_name(result['filename'], used)
+                    # iter_zip 写完该条目后才会继续执行，之后即可删除文件
+                    yield entry, watermarked_path
+                    manifest.append({'filename': result['filename'], 'entry': entry})
+                else:
+                    manifest.append(result)
+                
+            except Exception as e:
+                manifest.append({'error': f"{filename}: {str(e)}"})
+            finally:
+                # 清理临时文件
+                for path in (input_path, watermarked_path):
+                    if path and os.path.exists(path):
+                        os.remove(path)
+        
+        yield 'manifest.json', json.dumps(
+            {'result': manifest, 'action': '处理完成'}, ensure_ascii=False, indent=2
+        ).encode('utf-8')
+    finally:
+        # 客户端中途断开时生成器被关闭，同样清理工作目录
+        shutil.rmtree(workdir, ignore_errors=True)
+
+def _submit_job(kind, files, process):
+    """把上传文件保存到任务目录并提交后台处理，立即返回任务 ID"""
+    job = JOB_MANAGER.create(kind, [file.filename for file in files])
+    inputs = []
+    try:
+        with METRICS.timer('http_stage_seconds', endpoint=request.endpoint, stage='upload_save'):
+            for index, file in enumerate(files):
+                name = os.path.basename(file.filename) or 'upload'
+                input_path = os.path.join(job.file_dir(index), name)
+                file.save(input_path)
+                inputs.append((file.filename, input_path))
+    except Exception:
+        # 任务尚未提交，不会被标记为完成，也就不会被按 TTL 清理
+        JOB_MANAGER.discard(job)
+        raise
+    return _job_accepted(job, inputs, process)
+
+def _job_accepted(job, inputs, process):
+    """提交已保存到任务目录的输入文件，返回 202 和任务状态地址"""
+    JOB_MANAGER.start(job, inputs, process)
+    return jsonify({
+        'job_id': job.id,
+        'status_url': url_for('job_status', job_id=job.id),
+        'action': '已提交'
+    }), 202
 
 @app.route('/')
 def index():
@@ -67,53 +353,54 @@ def encrypt_file():
     if not username or not content:
         return jsonify({'result': [{'error': "请提供用户名和要隐藏的信息"}], 'action': '错误'})
     
+    if _wants_async():
+        return _submit_job(
+            'encrypt', files,
+            lambda filename, path: _watermark_one(filename, path, username, content)
+        )
+    
+    if request.form.get('format') == 'zip':
+        # 视图返回后请求中的上传文件会被关闭，先逐个落盘到独立的工作目录
+        workdir = tempfile.mkdtemp(dir=app.config['UPLOAD_FOLDER'])
+        inputs = []
+        try:
+            with METRICS.timer('http_stage_seconds', endpoint='encrypt_file', stage='upload_save'):
+                for index, file in enumerate(files):
+                    file_dir = os.path.join(workdir, str(index))
+                    os.makedirs(file_dir)
+                    input_path = os.path.join(file_dir, os.path.basename(file.filename) or 'upload')
+                    file.save(input_path)
+                    inputs.append((file.filename, input_path))
+        except Exception:
+            shutil.rmtree(workdir, ignore_errors=True)
+            raise
+        
+        # 每处理完一个文件就输出对应的 ZIP 条目，不在内存中累积结果
+        return Response(
+            stream_with_context(iter_zip(_watermark_entries(inputs, username, content, workdir))),
+            mimetype='application/zip',
+            headers={'Content-Disposition': 'attachment; filename=processed_files.zip'}
+        )
+    
     results = []
     for file in files:
         filename = file.filename
-        input_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
         
         try:
-            # 保存上传的文件
-            file.save(input_path)
-            
-            # 获取文件类型并处理
-            ext = os.path.splitext(filename)[1].lower()
-            if ext in WATERMARK_HANDLERS:
-                try:
-                    # 添加水印（隐藏信息）
-                    handler = WATERMARK_HANDLERS[ext]
-                    watermarked_path = handler.embed_watermark(
-                        input_path,
-                        {
-                            'content': content,  # 要隐藏的信息
-                            'user': username     # 用户名
-                        },
-                        username  # 使用用户名作为密钥
-                    )
-                    
-                    # 读取处理后的文件并返回
-                    with open(watermarked_path, 'rb') as f:
-                        file_content = f.read()
-                        results.append({
-                            'filename': f'processed_{filename}',
-                            'content': base64.b64encode(file_content).decode('utf-8')
-                        })
-                    
-                    # 清理处理后的文件
-                    if os.path.exists(watermarked_path):
-                        os.remove(watermarked_path)
-                    
-                except Exception as e:
-                    results.append({'error': f"{filename}: 处理失败 - {str(e)}"})
+            # 上传流直接交给处理器，结果保存在按大小溢出的临时文件中
+            result = _watermark_one(filename, file.stream, username, content)
+            if 'output' in result:
+                with result['output'] as output, \
+                        METRICS.timer('http_stage_seconds', endpoint='encrypt_file', stage='base64'):
+                    results.append({
+                        'filename': result['filename'],
+                        'content': base64.b64encode(output.read()).decode('utf-8')
+                    })
             else:
-                results.append({'error': f"{filename}: 不支持的文件类型"})
+                results.append(result)
             
         except Exception as e:
             results.append({'error': f"{filename}: {str(e)}"})
-        finally:
-            # 清理临时文件
-            if os.path.exists(input_path):
-                os.remove(input_path)
     
     if not results:
         return jsonify({'result': [{'error': "处理失败"}], 'action': '错误'})
@@ -145,28 +432,21 @@ def embed_watermark():
         if not all([content, user, password]):
             return jsonify({'success': False, 'message': '缺少必要参数'})
         
-        temp_path = os.path.join(app.config['UPLOAD_FOLDER'], file.filename)
-        file.save(temp_path)
+        handler = _handlers()[ext]
+        watermark_data = {'content': content, 'user': user}
+        result = handler.embed_watermark(
+            file.stream,
+            watermark_data,
+            password
+        )
+        _register(file.filename, result, watermark_data)
         
-        try:
-            handler = WATERMARK_HANDLERS[ext]
-            watermarked_path = handler.embed_watermark(
-                temp_path,
-                {'content': content, 'user': user},
-                password
-            )
-            
-            return send_file(
-                watermarked_path,
-                as_attachment=True,
-                download_name=os.path.basename(watermarked_path)
-            )
-            
-        finally:
-            if os.path.exists(temp_path):
-                os.remove(temp_path)
-            if os.path.exists(watermarked_path):
-                os.remove(watermarked_path)
+        # 响应结束后 send_file 会关闭临时文件
+        return send_file(
+            result.output,
+            as_attachment=True,
+            download_name=f'processed_{os.path.basename(file.filename)}'
+        )
         
     except Exception as e:
         return jsonify({
@@ -195,30 +475,20 @@ def verify_watermark():
         if not password:
             return jsonify({'success': False, 'message': '未提供密码'})
         
-        # 保存上传的文件
-        temp_path = os.path.join(app.config['UPLOAD_FOLDER'], file.filename)
-        file.save(temp_path)
+        # 验证水印：提取结果可来自缓存，解密和校验每次都用本次提供的密码进行
+        handler = _handlers()[ext]
+        success, result = handler.verify_extracted(_extract(ext, file.stream), password)
         
-        try:
-            # 验证水印
-            handler = WATERMARK_HANDLERS[ext]
-            success, result = handler.verify_watermark(temp_path, password)
-            
-            if success:
-                return jsonify({
-                    'success': True,
-                    'watermark': result
-                })
-            else:
-                return jsonify({
-                    'success': False,
-                    'message': result
-                })
-            
-        finally:
-            # 清理临时文件
-            if os.path.exists(temp_path):
-                os.remove(temp_path)
+        if success:
+            return jsonify({
+                'success': True,
+                'watermark': result
+            })
+        else:
+            return jsonify({
+                'success': False,
+                'message': result
+            })
         
     except Exception as e:
         return jsonify({
@@ -251,64 +521,330 @@ def decrypt_file():
     if not files or files[0].filename == '':
         return jsonify({'result': [{'error': "未选择文件"}], 'action': '错误'})
     
+    if _wants_async():
+        return _submit_job('decrypt', files, _extract_one)
+    
     results = []
     for file in files:
         filename = file.filename
-        input_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
         
         try:
-            # 保存上传的文件
-            file.save(input_path)
-            
-            # 获取文件类型并处理
-            ext = os.path.splitext(filename)[1].lower()
-            if ext in WATERMARK_HANDLERS:
-                try:
-                    # 提取水印
-                    handler = WATERMARK_HANDLERS[ext]
-                    hidden_info = handler.extract_watermark(input_path)
-                    
-                    if hidden_info:
-                        results.append({
-                            'filename': filename,
-                            'content': hidden_info
-                        })
-                    else:
-                        results.append({'error': f"{filename}: 未找到隐藏信息"})
-                    
-                except Exception as e:
-                    results.append({'error': f"{filename}: 处理失败 - {str(e)}"})
-            else:
-                results.append({'error': f"{filename}: 不支持的文件类型"})
-            
+            results.append(_extract_one(filename, file.stream))
         except Exception as e:
             results.append({'error': f"{filename}: {str(e)}"})
-        finally:
-            # 清理临时文件
-            if os.path.exists(input_path):
-                os.remove(input_path)
     
     if not results:
         return jsonify({'result': [{'error': "处理失败"}], 'action': '错误'})
     
-    # 格式化结果
-    formatted_results = []
-    for result in results:
-        if 'error' in result:
-            formatted_results.append(result)
-        else:
-            formatted_results.append({
-                'filename': result['filename'],
-                'content': {
-                    'content': result['content'].get('content', ''),
-                    'user': result['content'].get('user', '')
-                }
-            })
-    
     return jsonify({
-        'result': formatted_results,
+        'result': results,
         'action': '处理完成'
     })
 
+@app.route('/api/trace', methods=['POST'])
+def trace_watermark():
+    """按文件、文件哈希或水印指纹批量查询水印登记表
+
+    上传的文件先按哈希查询，未命中且 parse 不为 0 时再提取水印并按指纹查询；
+    hashes 和 fingerprints 可以是表单中的多个值，也可以是 JSON 请求体中的列表。
+    """
+    if REGISTRY is None:
+        return jsonify({'success': False, 'message': '未启用水印登记表'})
+    
+    try:
+        payload = request.get_json(silent=True) or {}
+        hashes = payload.get('hashes') or request.form.getlist('hashes')
+        fingerprints = payload.get('fingerprints') or request.form.getlist('fingerprints')
+        parse = str(payload.get('parse', request.form.get('parse', '1'))).lower() not in ('0', 'false', 'no')
+        files = [file for file in request.files.getlist('file') if file.filename]
+        
+        # 1. 按文件哈希批量查询
+        file_hashes = [content_sha256(file.stream) for file in files]
+        by_hash = REGISTRY.lookup_hashes(file_hashes + list(hashes))
+        
+        file_results = []
+        for file, file_hash in zip(files, file_hashes):
+            item = {'filename': file.filename, 'file_hash': file_hash,
+                    'matched_by': None, 'records': by_hash.get(file_hash, [])}
+            if item['records']:
+                item['matched_by'] = 'file_hash'
+            elif parse:
+                # 2. 文件被修改过时提取水印，按指纹查询
+                ext = os.path.splitext(file.filename)[1].lower()
+                hidden_info = _extract(ext, file.stream, file_hash) if ext in WATERMARK_HANDLERS else None
+                if hidden_info:
+                    value = fingerprint({'content': hidden_info.get('content', ''),
+                                         'user': hidden_info.get('user', '')})
+                    item['fingerprint'] = value
+                    item['records'] = REGISTRY.lookup_fingerprint(value)
+                    if item['records']:
+                        item['matched_by'] = 'fingerprint'
+            file_results.append(item)
+        
+        by_fingerprint = REGISTRY.lookup_fingerprints(fingerprints)
+        return jsonify({
+            'success': True,
+            'files': file_results,
+            'hashes': {value: by_hash.get(value.lower(), []) for value in hashes},
+            'fingerprints': {value: by_fingerprint.get(value.lower(), []) for value in fingerprints}
+        })
+    
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'message': f'查询失败: {str(e)}'
+        })
+
+# 流式文件加密路由
+def _crypto_stream(operation, filename_prefix):
+    """按分段格式加密或解密请求体，以分块传输的方式边读边返回
+
+    请求体为原始字节，密钥放在 X-Secret 请求头中，filename 查询参数用于下载文件名。
+    生成器先执行到第一段输出，密钥、格式或首段校验的错误可以作为 400 返回；
+    传输开始后才发现的篡改或截断只能中断连接，客户端会收到不完整的分块响应。
+    """
+    # 1. 只在使用时导入，cryptography 的导入开销较大
+    from utils.file_crypto import FileEncryptor, DEFAULT_CHUNK_SIZE
+    
+    secret = request.headers.get('X-Secret', '')
+    if not secret:
+        return jsonify({'success': False, 'message': '未提供密钥'}), 400
+    try:
+        chunk_size = int(request.args.get('chunk_size', DEFAULT_CHUNK_SIZE))
+    except ValueError:
+        return jsonify({'success': False, 'message': '分段大小无效'}), 400
+    
+    # 2. 请求体边读边处理，不经过 request.stream，因此不受 MAX_CONTENT_LENGTH 限制
+    # （request.max_content_length 设为 None 时会回退到全局配置）
+    source = get_input_stream(request.environ,
+                              max_content_length=app.config['STREAM_MAX_CONTENT_LENGTH'] or None)
+    encryptor = FileEncryptor(secret)
+    workers = app.config['STREAM_CRYPTO_WORKERS']
+    if operation == 'encrypt':
+        blocks = encryptor.iter_encrypt(source, chunk_size, workers)
+    else:
+        blocks = encryptor.iter_decrypt(source, workers)
+    
+    # 3. 预先取出第一段，开始响应前暴露参数和格式错误
+    try:
+        first = next(blocks, b'')
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    
+    def generate():
+        written = len(first)
+        try:
+            yield first
+            for block in blocks:
+                written += len(block)
+                yield block
+        except Exception as e:
+            print(f"Error streaming {operation}: {str(e)}")
+            raise
+        finally:
+            METRICS.inc('file_crypto_bytes_out_total', written, operation=operation)
+    
+    headers = {'Cache-Control': 'no-store'}
+    filename = os.path.basename(request.args.get('filename', ''))
+    if filename:
+        headers['Content-Disposition'] = f'attachment; filename="{filename_prefix}{filename}"'
+    # 不设置 Content-Length，由服务器使用分块传输编码
+    return Response(stream_with_context(generate()), mimetype='application/octet-stream', headers=headers)
+
+@app.route('/api/encrypt_stream', methods=['POST'])
+def encrypt_stream():
+    return _crypto_stream('encrypt', 'encrypted_')
+
+@app.route('/api/decrypt_stream', methods=['POST'])
+def decrypt_stream():
+    return _crypto_stream('decrypt', 'decrypted_')
+
+# 分块上传路由
+def _upload_error(e):
+    """把上传异常转换为 JSON 响应：偏移量冲突 409，超出大小 413，其余 400"""
+    body = {'success': False, 'message': str(e)}
+    if isinstance(e, UploadConflictError):
+        body['offset'] = e.offset
+        return jsonify(body), 409
+    if isinstance(e, UploadTooLargeError):
+        return jsonify(body), 413
+    return jsonify(body), 400
+
+def _upload_status(session, status=200):
+    state = session.to_dict()
+    state['upload_url'] = url_for('upload_chunk', upload_id=session.id)
+    response = jsonify(state)
+    response.status_code = status
+    response.headers['Upload-Offset'] = str(state['offset'])
+    if session.size is not None:
+        response.headers['Upload-Length'] = str(session.size)
+    response.headers['Cache-Control'] = 'no-store'
+    return response
+
+@app.route('/uploads', methods=['POST'])
+def create_upload():
+    """创建上传会话：filename 为文件名，size 为文件总大小（可选）"""
+    payload = request.get_json(silent=True) or request.form
+    try:
+        size = payload.get('size')
+        size = int(size) if size not in (None, '') else None
+    except (TypeError, ValueError):
+        return jsonify({'success': False, 'message': '文件大小无效'}), 400
+    try:
+        session = UPLOAD_MANAGER.create(payload.get('filename'), size)
+    except UploadError as e:
+        return _upload_error(e)
+    return _upload_status(session, 201)
+
+@app.route('/uploads/<upload_id>', methods=['GET'])
+def upload_status(upload_id):
+    """查询已接收的偏移量（HEAD 请求只返回 Upload-Offset 等头部）"""
+    session = UPLOAD_MANAGER.get(upload_id)
+    if session is None:
+        return jsonify({'success': False, 'message': '上传不存在或已过期'}), 404
+    return _upload_status(session)
+
+@app.route('/uploads/<upload_id>', methods=['PUT'])
+def upload_chunk(upload_id):
+    """追加一个分块，请求头 Content-Range: bytes <起始>-<结束>/<总大小或 *>，请求体为原始字节"""
+    session = UPLOAD_MANAGER.get(upload_id)
+    if session is None:
+        return jsonify({'success': False, 'message': '上传不存在或已过期'}), 404
+    
+    content_range = parse_content_range_header(request.headers.get('Content-Range'))
+    if content_range is None or content_range.units != 'bytes':
+        return jsonify({'success': False, 'message': '缺少或无效的 Content-Range'}), 400
+    length = content_range.stop - content_range.start
+    if request.content_length is not None and request.content_length != length:
+        return jsonify({'success': False, 'message': '请求体长度与 Content-Range 不一致'}), 400
+    
+    try:
+        # 直接从请求流读取并追加到会话文件，不经过表单解析
+        UPLOAD_MANAGER.append(session, content_range.start, request.stream,
+                              length=length, total=content_range.length)
+    except UploadError as e:
+        return _upload_error(e)
+    return _upload_status(session)
+
+@app.route('/uploads/<upload_id>', methods=['DELETE'])
+def delete_upload(upload_id):
+    session = UPLOAD_MANAGER.get(upload_id)
+    if session is None:
+        return jsonify({'success': False, 'message': '上传不存在或已过期'}), 404
+    UPLOAD_MANAGER.discard(session)
+    return jsonify({'success': True})
+
+@app.route('/uploads/<upload_id>/finalize', methods=['POST'])
+def finalize_upload(upload_id):
+    """上传完成后按 action 处理文件
+
+    embed：嵌入水印并返回文件（需要 content、user、password）；
+    extract：提取隐藏信息，返回格式与 /decrypt_file 相同；
+    verify：验证水印（需要 password）。
+    embed 和 extract 可用 async=1 提交为后台任务。
+    """
+    session = UPLOAD_MANAGER.get(upload_id)
+    if session is None:
+        return jsonify({'success': False, 'message': '上传不存在或已过期'}), 404
+    
+    payload = request.get_json(silent=True) or request.form
+    action = payload.get('action', 'embed')
+    filename = session.filename
+    ext = os.path.splitext(filename)[1].lower()
+    if action not in ('embed', 'extract', 'verify'):
+        return jsonify({'success': False, 'message': '不支持的操作'}), 400
+    if ext not in WATERMARK_HANDLERS:
+        return jsonify({'success': False, 'message': '不支持的文件类型'}), 400
+    
+    content = payload.get('content')
+    user = payload.get('user')
+    password = payload.get('password')
+    if action == 'embed' and not all([content, user, password]):
+        return jsonify({'success': False, 'message': '缺少必要参数'}), 400
+    if action == 'verify' and not password:
+        return jsonify({'success': False, 'message': '未提供密码'}), 400
+    
+    if str(payload.get('async', '')).lower() in ('1', 'true', 'yes') and action != 'verify':
+        # 先确认上传完整再创建任务，提前 finalize 不会留下永远不会完成的任务
+        try:
+            path = UPLOAD_MANAGER.finish(session)
+        except UploadError as e:
+            return _upload_error(e)
+        job = JOB_MANAGER.create('encrypt' if action == 'embed' else 'decrypt', [filename])
+        try:
+            input_path = os.path.join(job.file_dir(0), os.path.basename(path))
+            os.replace(path, input_path)
+        except OSError:
+            JOB_MANAGER.discard(job)
+            raise
+        finally:
+            UPLOAD_MANAGER.discard(session)
+        path = input_path
+        if action == 'embed':
+            process = lambda name, input_path: _watermark_one(name, input_path, user, content, password)
+        else:
+            process = _extract_one
+        return _job_accepted(job, [(filename, path)], process)
+    
+    try:
+        path = UPLOAD_MANAGER.finish(session)
+    except UploadError as e:
+        return _upload_error(e)
+    
+    cleanup = True
+    try:
+        if action == 'extract':
+            return jsonify({'result': [_extract_one(filename, path)], 'action': '处理完成'})
+        
+        if action == 'verify':
+            success, result = _handlers()[ext].verify_extracted(_extract(ext, path), password)
+            if success:
+                return jsonify({'success': True, 'watermark': result})
+            return jsonify({'success': False, 'message': result})
+        
+        result = _watermark_one(filename, path, user, content, password)
+        if 'error' in result:
+            return jsonify({'success': False, 'message': result['error']})
+        response = send_file(result['output'], as_attachment=True, download_name=result['filename'])
+        # 文件发送完毕后再删除会话目录；直通的 file_wrapper 响应不会调用 call_on_close 注册的函数
+        response.direct_passthrough = False
+        response.call_on_close(lambda: UPLOAD_MANAGER.discard(session))
+        cleanup = False
+        return response
+    
+    except Exception as e:
+        return jsonify({'success': False, 'message': f'处理失败: {str(e)}'})
+    finally:
+        if cleanup:
+            UPLOAD_MANAGER.discard(session)
+
+# 监控指标
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    return Response(METRICS.render(), mimetype='text/plain; version=0.0.4; charset=utf-8')
+
+# 后台任务路由
+@app.route('/jobs/<job_id>', methods=['GET'])
+def job_status(job_id):
+    job = JOB_MANAGER.get(job_id)
+    if job is None:
+        return jsonify({'success': False, 'message': '任务不存在或已过期'}), 404
+    
+    state = job.to_dict()
+    for index, result in enumerate(state['results']):
+        # 已完成的水印文件附上下载地址
+        if result and 'output' in (job.results[index] or {}):
+            result['download'] = url_for('job_result', job_id=job_id, index=index)
+    return jsonify(state)
+
+@app.route('/jobs/<job_id>/files/<int:index>', methods=['GET'])
+def job_result(job_id, index):
+    found = JOB_MANAGER.result_file(job_id, index)
+    if found is None:
+        return jsonify({'success': False, 'message': '结果不存在或尚未完成'}), 404
+    
+    path, filename = found
+    return send_file(path, as_attachment=True, download_name=filename)
+
 if __name__ == '__main__':
     app.run(debug=True) 
\ No newline at end of file
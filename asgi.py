@@ -0,0 +1,311 @@
+"""ASGI 入口：在 asyncio 事件循环上提供与 app.py 相同的全部路由
+
+慢速客户端的上传和下载由事件循环以非阻塞方式收发，只有真正处理请求时才占用线程：
+1. 请求体先在事件循环中接收并缓存（小于 ASGI_SPOOL_MEMORY 时在内存中，否则写入临时文件），
+   接收完毕后才把 Flask 应用交给线程池执行；超过 MAX_CONTENT_LENGTH 的请求体不会被缓存，直接返回 413；
+2. 响应体由线程池逐块生成，事件循环按客户端的接收速度逐块发送；
+3. 水印处理在 WATERMARK_WORKERS 进程池中执行，PBKDF2 和 AES 运算会释放 GIL，
+   线程池中的线程只在 CPU 运算期间被占用，少量进程即可维持大量慢速连接。
+
+流式加解密接口（/api/encrypt_stream、/api/decrypt_stream）需要边收边发，不缓存请求体，
+处理线程直接从连接中按需读取。
+
+用法:
+    uvicorn asgi:application --workers 4
+    python asgi.py --host 0.0.0.0 --port 8000
+"""
+import argparse
+import asyncio
+import contextvars
+import os
+import sys
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from app import app, JOB_MANAGER, WATERMARK_EXECUTOR
+
+# 执行 Flask 视图的线程数、请求体在内存中缓存的上限（字节）
+ASGI_THREADS = int(os.environ.get('ASGI_THREADS', 32))
+ASGI_SPOOL_MEMORY = int(os.environ.get('ASGI_SPOOL_MEMORY', 1024 * 1024))
+
+# 边读请求体边返回响应的接口，不预先缓存请求体
+STREAMING_PATHS = ('/api/encrypt_stream', '/api/decrypt_stream')
+
+
+class ClientDisconnected(OSError):
+    """客户端在请求体接收完之前断开连接"""
+
+
+class _ReceiveStream:
+    """供处理线程读取的请求体：按需从事件循环的 receive() 取下一段消息"""
+
+    def __init__(self, receive, loop):
+        self._receive = receive
+        self._loop = loop
+        self._buffer = bytearray()
+        self._more = True
+
+    def _fill(self):
+        message = asyncio.run_coroutine_threadsafe(self._receive(), self._loop).result()
+        if message['type'] == 'http.disconnect':
+            raise ClientDisconnected("客户端已断开连接")
+        self._buffer += message.get('body', b'')
+        self._more = message.get('more_body', False)
+
+    def read(self, size=-1):
+        while self._more and (size is None or size < 0 or len(self._buffer) < size):
+            self._fill()
+        if size is None or size < 0:
+            size = len(self._buffer)
+        data = bytes(self._buffer[:size])
+        del self._buffer[:size]
+        return data
+
+    def readline(self, size=-1):
+        while self._more and b'\n' not in self._buffer and (size < 0 or len(self._buffer) < size):
+            self._fill()
+        end = self._buffer.find(b'\n') + 1 or len(self._buffer)
+        if size >= 0:
+            end = min(end, size)
+        data = bytes(self._buffer[:end])
+        del self._buffer[:end]
+        return data
+
+    def __iter__(self):
+        while line := self.readline():
+            yield line
+
+
+class WSGIAdapter:
+    """把 WSGI 应用包装为 ASGI 应用，WSGI 调用在线程池中执行"""
+
+    def __init__(self, wsgi_app, threads=ASGI_THREADS, spool_memory=ASGI_SPOOL_MEMORY,
+                 max_content_length=None, streaming_paths=STREAMING_PATHS, on_shutdown=None):
+        self.wsgi_app = wsgi_app
+        self.spool_memory = spool_memory
+        self.max_content_length = max_content_length
+        self.streaming_paths = tuple(streaming_paths)
+        self.on_shutdown = on_shutdown
+        self.executor = ThreadPoolExecutor(max_workers=threads, thread_name_prefix='asgi')
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self._lifespan(receive, send)
+        elif scope['type'] == 'http':
+            await self._http(scope, receive, send)
+        else:
+            raise ValueError(f"不支持的 ASGI 连接类型: {scope['type']}")
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                if self.on_shutdown is not None:
+                    await asyncio.get_running_loop().run_in_executor(self.executor, self.on_shutdown)
+                self.executor.shutdown(wait=False)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def _http(self, scope, receive, send):
+        loop = asyncio.get_running_loop()
+        environ = self._environ(scope)
+        spool = None
+        try:
+            # 1. 接收请求体：普通接口先完整缓存，流式接口由处理线程按需读取
+            if scope['path'] in self.streaming_paths:
+                environ['wsgi.input'] = _ReceiveStream(receive, loop)
+                if 'CONTENT_LENGTH' not in environ:
+                    environ['wsgi.input_terminated'] = True
+            else:
+                try:
+                    spool = await self._spool_body(receive, environ)
+                except ClientDisconnected:
+                    return
+                if spool is None:
+                    await self._send_simple(send, 413, b'Request Entity Too Large')
+                    return
+                environ['wsgi.input'] = spool
+
+            # 2. 在线程池中调用 WSGI 应用并逐块发送响应
+            await self._run(environ, send, loop)
+        finally:
+            if spool is not None:
+                spool.close()
+
+    async def _spool_body(self, receive, environ):
+        """接收完整的请求体，超过大小上限时返回 None"""
+        limit = self.max_content_length
+        declared = environ.get('CONTENT_LENGTH')
+        if limit is not None and declared and int(declared) > limit:
+            return None
+
+        spool = tempfile.SpooledTemporaryFile(max_size=self.spool_memory)
+        size = 0
+        more = True
+        try:
+            while more:
+                message = await receive()
+                if message['type'] == 'http.disconnect':
+                    raise ClientDisconnected("客户端已断开连接")
+                body = message.get('body', b'')
+                size += len(body)
+                if limit is not None and size > limit:
+                    spool.close()
+                    return None
+                if body:
+                    spool.write(body)
+                more = message.get('more_body', False)
+        except BaseException:
+            spool.close()
+            raise
+        spool.seek(0)
+        # 分块传输的请求体接收完后长度已知
+        environ['CONTENT_LENGTH'] = str(size)
+        environ.pop('HTTP_TRANSFER_ENCODING', None)
+        return spool
+
+    async def _run(self, environ, send, loop):
+        response = {}
+        # 同一请求的各次调用可能落在不同线程上，在同一个上下文中执行，
+        # stream_with_context 等依赖 contextvars 的生成器才能跨线程继续
+        context = contextvars.copy_context()
+
+        def call(func, *args):
+            return loop.run_in_executor(self.executor, context.run, func, *args)
+
+        def start_response(status, headers, exc_info=None):
+            if exc_info and response.get('sent'):
+                raise exc_info[1].with_traceback(exc_info[2])
+            response['status'] = int(status.split(' ', 1)[0])
+            response['headers'] = [(name.lower().encode('latin-1'), value.encode('latin-1'))
+                                   for name, value in headers]
+            return response.setdefault('written', []).append
+
+        def next_chunk(iterator):
+            # 跳过空块，减少线程与事件循环之间的切换
+            for chunk in iterator:
+                if chunk:
+                    return chunk
+            return None
+
+        async def start():
+            if not response.get('sent'):
+                response['sent'] = True
+                await send({'type': 'http.response.start',
+                            'status': response['status'],
+                            'headers': response['headers']})
+
+        try:
+            result = await call(self.wsgi_app, environ, start_response)
+        except Exception as e:
+            print(f"Error handling request: {str(e)}")
+            await self._send_simple(send, 500, b'Internal Server Error')
+            return
+
+        try:
+            iterator = iter(result)
+            while True:
+                chunk = await call(next_chunk, iterator)
+                written = response.get('written')
+                if written:
+                    # 兼容通过 start_response 返回的 write() 输出的数据
+                    body = b''.join(written)
+                    written.clear()
+                    await start()
+                    await send({'type': 'http.response.body', 'body': body, 'more_body': True})
+                if chunk is None:
+                    break
+                await start()
+                await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+            await start()
+            await send({'type': 'http.response.body', 'body': b'', 'more_body': False})
+        except Exception as e:
+            print(f"Error streaming response: {str(e)}")
+            if not response.get('sent'):
+                await self._send_simple(send, 500, b'Internal Server Error')
+            else:
+                # 响应头已发出，只能中断连接
+                raise
+        finally:
+            # close() 会触发 call_on_close 注册的清理（如删除上传会话、结束 stream_with_context）
+            close = getattr(result, 'close', None)
+            if close is not None:
+                await call(close)
+
+    @staticmethod
+    async def _send_simple(send, status, body):
+        await send({'type': 'http.response.start', 'status': status,
+                    'headers': [(b'content-type', b'text/plain; charset=utf-8'),
+                                (b'content-length', str(len(body)).encode())]})
+        await send({'type': 'http.response.body', 'body': body})
+
+    @staticmethod
+    def _environ(scope):
+        """按 PEP 3333 由 ASGI 连接信息构造 WSGI environ（请求体由调用方设置）"""
+        raw_path = scope.get('raw_path')
+        if raw_path:
+            path_info = raw_path.split(b'?', 1)[0].decode('latin-1')
+        else:
+            path_info = scope['path'].encode('utf-8').decode('latin-1')
+        root_path = scope.get('root_path', '').encode('utf-8').decode('latin-1')
+        if root_path and path_info.startswith(root_path):
+            path_info = path_info[len(root_path):]
+
+        server = scope.get('server') or ('localhost', 80)
+        client = scope.get('client')
+        environ = {
+            'REQUEST_METHOD': scope['method'],
+            'SCRIPT_NAME': root_path,
+            'PATH_INFO': path_info,
+            'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+            'SERVER_NAME': server[0],
+            'SERVER_PORT': str(server[1] or 80),
+            'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+            'REMOTE_ADDR': client[0] if client else '',
+            'REMOTE_PORT': str(client[1]) if client else '',
+            'wsgi.version': (1, 0),
+            'wsgi.url_scheme': scope.get('scheme', 'http'),
+            'wsgi.errors': sys.stderr,
+            'wsgi.multithread': True,
+            'wsgi.multiprocess': True,
+            'wsgi.run_once': False,
+            'asgi.scope': scope,
+        }
+        for name, value in scope.get('headers', []):
+            name = name.decode('latin-1').upper().replace('-', '_')
+            value = value.decode('latin-1')
+            if name == 'CONTENT_TYPE' or name == 'CONTENT_LENGTH':
+                key = name
+            else:
+                key = f'HTTP_{name}'
+            # 重复的请求头按 RFC 7230 合并
+            environ[key] = f'{environ[key]},{value}' if key in environ else value
+        return environ
+
+
+def _shutdown():
+    JOB_MANAGER.shutdown(wait=False)
+    if WATERMARK_EXECUTOR is not None:
+        WATERMARK_EXECUTOR.shutdown()
+
+
+application = WSGIAdapter(app, max_content_length=app.config['MAX_CONTENT_LENGTH'],
+                          on_shutdown=_shutdown)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='使用 uvicorn 运行 ASGI 服务')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    args = parser.parse_args()
+    try:
+        import uvicorn
+    except ImportError:
+        print("未安装 uvicorn，请先执行 pip install uvicorn，或使用其他 ASGI 服务器加载 asgi:application")
+        sys.exit(1)
+    uvicorn.run(application, host=args.host, port=args.port)
+
+
+if __name__ == '__main__':
+    main()
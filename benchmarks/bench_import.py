@@ -0,0 +1,81 @@
+"""冷启动导入耗时：在全新的解释器中多次导入 app，超过目标值时以非零状态退出
+
+用法: python -m benchmarks.bench_import --runs 10 --target-ms 400
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# 子进程中执行：测量 import app 以及每种格式首次取用处理器的耗时
+PROBE = r'''
+import json, sys, time
+start = time.perf_counter()
+import app
+imported = time.perf_counter() - start
+heavy = sorted(m for m in ('docx', 'pptx', 'PyPDF2', 'reportlab', 'cryptography') if m in sys.modules)
+first_use = {}
+if sys.argv[1] == '1':
+    from utils.watermark.handlers import HandlerRegistry
+    registry = HandlerRegistry()
+    for ext in registry:
+        start = time.perf_counter()
+        registry[ext]
+        first_use[ext] = time.perf_counter() - start
+print(json.dumps({'import': imported, 'heavy_modules': heavy, 'first_use': first_use}))
+'''
+
+
+def _probe(first_use):
+    env = dict(os.environ, PYTHONDONTWRITEBYTECODE='1')
+    output = subprocess.run(
+        [sys.executable, '-c', PROBE, '1' if first_use else '0'],
+        cwd=ROOT, env=env, check=True, capture_output=True, text=True
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=10)
+    parser.add_argument('--target-ms', type=float, default=400,
+                        help='import app 耗时中位数的上限（毫秒）')
+    parser.add_argument('--json', action='store_true', help='输出 JSON')
+    args = parser.parse_args()
+
+    # 第一次运行预热磁盘缓存，不计入结果
+    _probe(False)
+    samples = [_probe(i == 0) for i in range(args.runs)]
+    imports = [s['import'] * 1000 for s in samples]
+    report = {
+        'runs': args.runs,
+        'import_ms': {
+            'median': statistics.median(imports),
+            'min': min(imports),
+            'max': max(imports),
+        },
+        'target_ms': args.target_ms,
+        'heavy_modules_at_import': samples[0]['heavy_modules'],
+        'first_use_ms': {ext: t * 1000 for ext, t in samples[0]['first_use'].items()},
+    }
+    report['ok'] = report['import_ms']['median'] <= args.target_ms
+
+    if args.json:
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+    else:
+        stats = report['import_ms']
+        print(f"import app: 中位数 {stats['median']:.1f} ms  "
+              f"(最小 {stats['min']:.1f} / 最大 {stats['max']:.1f}, {args.runs} 次)")
+        print(f"导入时已加载的重量级模块: {', '.join(report['heavy_modules_at_import']) or '无'}")
+        for ext, ms in report['first_use_ms'].items():
+            print(f"首次使用 {ext:<6} 处理器: {ms:.1f} ms")
+        print(f"目标 {args.target_ms:.0f} ms: {'通过' if report['ok'] else '未通过'}")
+    sys.exit(0 if report['ok'] else 1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,121 @@
+"""零宽字符编解码微基准：对比原逐字符实现与 utils.zero_width 查表实现
+
+用法: python -m benchmarks.bench_zero_width --sizes 1000 10000 100000 300000
+"""
+import argparse
+import base64
+import json
+import random
+import string
+import time
+
+from utils import zero_width
+
+ZWSP = zero_width.ZERO_WIDTH_SPACE
+ZWJ = zero_width.ZERO_WIDTH_JOINER
+OCTAL = dict(zip('01234567', zero_width.OCTAL_ALPHABET))
+
+
+# ---- 原实现（仅用于对比与输出一致性校验） ----
+
+def legacy_encode_bits(secret):
+    binary = '11111111' + ''.join(format(ord(c), '08b') for c in secret) + '11111111'
+    result = ''
+    for bit in binary:
+        result += ZWSP if bit == '0' else ZWJ
+    return result
+
+
+def legacy_decode_bits(text):
+    chars = [c for c in text if c in [ZWSP, ZWJ]]
+    binary = ''
+    for c in chars:
+        binary += '0' if c == ZWSP else '1'
+    data = binary[binary.find('11111111') + 8:binary.rfind('11111111')]
+    secret = ''
+    for i in range(0, len(data), 8):
+        secret += chr(int(data[i:i + 8].ljust(8, '0'), 2))
+    return secret
+
+
+def legacy_encode_octal(payload):
+    result = ''
+    for digit in ''.join(format(ord(c), '08o') for c in payload):
+        result += OCTAL[digit]
+    return result
+
+
+def legacy_decode_octal(text):
+    reverse = {v: k for k, v in OCTAL.items()}
+    oct_str = ''.join(reverse[c] for c in text if c in reverse)
+    data = ''
+    for i in range(0, len(oct_str), 8):
+        group = oct_str[i:i + 8]
+        if len(group) == 8:
+            data += chr(int(group, 8))
+    return data
+
+
+def legacy_interleave(text):
+    chars = list(text)
+    for i in range(len(chars)):
+        if i % 2 == 0:
+            chars.insert(i, ZWSP)
+    return ''.join(chars)
+
+
+# ---- 新实现 ----
+
+def new_encode_bits(secret):
+    binary = '11111111' + zero_width.text_to_bits(secret) + '11111111'
+    return zero_width.encode_bits(binary)
+
+
+def new_decode_bits(text):
+    binary = zero_width.decode_bits(text)
+    data = binary[binary.find('11111111') + 8:binary.rfind('11111111')]
+    return zero_width.bits_to_bytes(data).decode('latin-1')
+
+
+CASES = [
+    ('bits 编码', legacy_encode_bits, new_encode_bits, lambda s: s),
+    ('bits 解码', legacy_decode_bits, new_decode_bits, lambda s: 'cover' + legacy_encode_bits(s)),
+    ('octal 编码', legacy_encode_octal, lambda p: zero_width.encode_octal(p.encode()),
+     lambda s: base64.b64encode(json.dumps({'data': s}).encode()).decode()),
+    ('octal 解码', legacy_decode_octal, lambda t: zero_width.decode_octal(t).decode(),
+     lambda s: legacy_encode_octal(base64.b64encode(s.encode()).decode())),
+    ('interleave', legacy_interleave, zero_width.interleave, lambda s: s),
+]
+
+
+def _time(func, arg):
+    start = time.perf_counter()
+    result = func(arg)
+    return time.perf_counter() - start, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000])
+    parser.add_argument('--skip-legacy-above', type=int, default=100000,
+                        help='超过该长度时不再运行原实现')
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    print(f"{'用例':<12} {'长度':>8} {'原实现 ms':>12} {'新实现 ms':>12} {'加速':>8}")
+    for size in args.sizes:
+        secret = ''.join(rng.choice(string.ascii_letters) for _ in range(size))
+        for name, legacy, new, prepare in CASES:
+            arg = prepare(secret)
+            new_time, new_result = _time(new, arg)
+            if size <= args.skip_legacy_above:
+                legacy_time, legacy_result = _time(legacy, arg)
+                assert legacy_result == new_result, f"{name} 输出不一致"
+                print(f"{name:<12} {size:>8} {legacy_time * 1000:>12.2f} "
+                      f"{new_time * 1000:>12.2f} {legacy_time / new_time:>7.1f}x")
+            else:
+                print(f"{name:<12} {size:>8} {'-':>12} {new_time * 1000:>12.2f} {'-':>8}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,544 @@
+"""Flask 接口负载测试：在本机启动服务（或进程内线程），按给定并发和速率回放请求
+
+报告各接口的延迟分布（p50/p90/p99 与直方图）、吞吐量、错误率，以及服务端进程树的 CPU 和 RSS。
+
+用法:
+    python -m benchmarks.loadtest --mix embed=3 verify=1 encrypt_file=1 encrypt=2 \\
+        --concurrency 8 --duration 30
+    python -m benchmarks.loadtest --synthetic --media-mb 2 --rate 20 --requests 500 \\
+        --server-env WATERMARK_WORKERS=0
+    python -m benchmarks.loadtest --inprocess --json
+"""
+import argparse
+import bisect
+import glob
+import http.client
+import itertools
+import json
+import logging
+import math
+import os
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from urllib.parse import urlencode, urlsplit
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+WATERMARK_EXTS = ('.docx', '.pptx', '.pdf')
+PASSWORD = 'loadtest'
+CLK_TCK = os.sysconf('SC_CLK_TCK')
+PAGE_SIZE = os.sysconf('SC_PAGE_SIZE')
+
+# 直方图桶上限（毫秒），按 1-2-5 递增
+BUCKETS_MS = [b * 10 ** e for e in range(0, 6) for b in (1, 2, 5)]
+
+
+# ---- 请求构造 ----
+
+def _multipart(fields, files):
+    """构造 multipart/form-data 请求体，files 为 [(字段名, 文件名, 内容)]"""
+    boundary = uuid.uuid4().hex
+    parts = []
+    for name, value in fields.items():
+        parts.append(f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n'
+                     .encode() + str(value).encode('utf-8') + b'\r\n')
+    for name, filename, content in files:
+        parts.append(f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"; '
+                     f'filename="{filename}"\r\nContent-Type: application/octet-stream\r\n\r\n'
+                     .encode() + content + b'\r\n')
+    parts.append(f'--{boundary}--\r\n'.encode())
+    return b''.join(parts), f'multipart/form-data; boundary={boundary}'
+
+
+class Scenario:
+    """一种请求：接口路径与请求体生成方式"""
+
+    def __init__(self, name, path, build):
+        self.name = name
+        self.path = path
+        self.build = build
+
+
+def _scenarios(documents, watermarked):
+    """documents / watermarked 为 [(文件名, 内容)]，每次请求从中随机选择一个"""
+
+    def embed(rng):
+        filename, content = rng.choice(documents)
+        return _multipart({'content': 'load test', 'user': 'bench', 'password': PASSWORD},
+                          [('file', filename, content)])
+
+    def verify(rng):
+        filename, content = rng.choice(watermarked)
+        return _multipart({'password': PASSWORD}, [('file', filename, content)])
+
+    def encrypt_file(rng):
+        filename, content = rng.choice(documents)
+        return _multipart({'username': 'bench', 'content': 'load test'},
+                          [('file', filename, content)])
+
+    def encrypt(rng):
+        body = urlencode({'text': 'load test cover text ' * 8, 'secret': 'secret message'})
+        return body.encode(), 'application/x-www-form-urlencoded'
+
+    return {
+        'embed': Scenario('embed', '/api/embed_watermark', embed),
+        'verify': Scenario('verify', '/api/verify_watermark', verify),
+        'encrypt_file': Scenario('encrypt_file', '/encrypt_file', encrypt_file),
+        'encrypt': Scenario('encrypt', '/encrypt', encrypt),
+    }
+
+
+def _load_documents(args, workdir):
+    """读取 Test_files 中的样本，或生成指定大小的合成文档"""
+    if args.synthetic:
+        from benchmarks.synthetic import make_docx, make_pptx, make_pdf
+        paths = [
+            make_docx(os.path.join(workdir, 'synthetic.docx'), args.paragraphs, args.media_mb),
+            make_pptx(os.path.join(workdir, 'synthetic.pptx'), args.slides, args.media_mb),
+            make_pdf(os.path.join(workdir, 'synthetic.pdf'), args.pages, args.media_mb),
+        ]
+    else:
+        paths = [path for pattern in args.files for path in sorted(glob.glob(pattern))]
+    documents = []
+    for path in paths:
+        if os.path.splitext(path)[1].lower() in WATERMARK_EXTS:
+            with open(path, 'rb') as f:
+                documents.append((os.path.basename(path), f.read()))
+    if not documents:
+        raise SystemExit('没有可用的 .docx/.pptx/.pdf 样本')
+    return documents
+
+
+def _request(base, method, path, body=None, content_type=None, timeout=120):
+    """发送一个请求，返回 (状态码, 响应头, 响应体)"""
+    url = urlsplit(base)
+    conn = http.client.HTTPConnection(url.hostname, url.port, timeout=timeout)
+    try:
+        headers = {'Content-Type': content_type} if content_type else {}
+        conn.request(method, path, body=body, headers=headers)
+        response = conn.getresponse()
+        return response.status, dict(response.getheaders()), response.read()
+    finally:
+        conn.close()
+
+
+def _prepare_watermarked(base, documents):
+    """通过 /api/embed_watermark 预先生成 verify 场景使用的带水印文档"""
+    watermarked = []
+    for filename, content in documents:
+        body, content_type = _multipart(
+            {'content': 'load test', 'user': 'bench', 'password': PASSWORD},
+            [('file', filename, content)])
+        status, headers, data = _request(base, 'POST', '/api/embed_watermark', body, content_type)
+        if status == 200 and 'json' not in headers.get('Content-Type', ''):
+            watermarked.append((f'processed_{filename}', data))
+    return watermarked
+
+
+def _verify_unavailable(base, watermarked):
+    """verify 场景能否成功：返回无法测试的原因，可以测试时返回 None
+
+    验证全部失败时测到的只是失败路径的延迟，不能作为 verify 的延迟分布报告。
+    """
+    if not watermarked:
+        return '预先嵌入水印全部失败，没有可验证的文档'
+    filename, content = watermarked[0]
+    body, content_type = _multipart({'password': PASSWORD}, [('file', filename, content)])
+    status, headers, data = _request(base, 'POST', '/api/verify_watermark', body, content_type)
+    try:
+        payload = json.loads(data)
+    except ValueError:
+        payload = {}
+    if status != 200 or payload.get('success') is not True:
+        return f"验证请求未成功（HTTP {status}）：{payload.get('message', '无法解析响应')}"
+    return None
+
+
+# ---- 服务端 ----
+
+def _quiet_access_log():
+    # 每个请求一行的访问日志会显著拖慢服务端并淹没报告
+    logging.getLogger('werkzeug').setLevel(logging.WARNING)
+
+
+def _serve(port, threaded, processes):
+    """子进程入口：启动 werkzeug 服务并把实际端口写到标准输出"""
+    sys.path.insert(0, ROOT)
+    from werkzeug.serving import make_server
+    import app as application
+
+    _quiet_access_log()
+    server = make_server('127.0.0.1', port, application.app,
+                         threaded=threaded, processes=processes)
+    print(f'PORT {server.server_port}', flush=True)
+    server.serve_forever()
+
+
+class ServerProcess:
+    """在子进程中运行的服务，可按进程树统计 CPU 和 RSS"""
+
+    def __init__(self, args):
+        env = dict(os.environ)
+        for item in args.server_env:
+            key, _, value = item.partition('=')
+            env[key] = value
+        command = [sys.executable, '-m', 'benchmarks.loadtest', '--serve',
+                   '--server-processes', str(args.server_processes)]
+        if not args.threaded:
+            command.append('--no-threaded')
+        self.process = subprocess.Popen(command, cwd=ROOT, env=env, text=True,
+                                        stdout=subprocess.PIPE)
+        line = self.process.stdout.readline()
+        if not line.startswith('PORT '):
+            self.stop()
+            raise SystemExit('服务启动失败')
+        self.base = f'http://127.0.0.1:{int(line.split()[1])}'
+        self.pid = self.process.pid
+        # 继续读取标准输出，避免处理器的调试信息写满管道导致服务阻塞
+        threading.Thread(target=self._drain, daemon=True).start()
+
+    def _drain(self):
+        for _ in self.process.stdout:
+            pass
+
+    def stop(self):
+        self.process.terminate()
+        try:
+            self.process.wait(10)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+
+
+class InProcessServer:
+    """在当前进程的线程中运行服务；CPU 和 RSS 统计会包含负载生成本身"""
+
+    def __init__(self, args):
+        from werkzeug.serving import make_server
+        import app as application
+
+        _quiet_access_log()
+        self.server = make_server('127.0.0.1', 0, application.app, threaded=args.threaded)
+        self.base = f'http://127.0.0.1:{self.server.server_port}'
+        self.pid = os.getpid()
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def stop(self):
+        self.server.shutdown()
+
+
+def _process_tree(pid):
+    """pid 及其所有子孙进程（包括水印处理进程池）"""
+    pids = [pid]
+    index = 0
+    while index < len(pids):
+        current = pids[index]
+        index += 1
+        for children in glob.glob(f'/proc/{current}/task/*/children'):
+            try:
+                with open(children) as f:
+                    pids.extend(int(child) for child in f.read().split())
+            except OSError:
+                continue
+    return pids
+
+
+def _sample_tree(pid):
+    """返回 (累计 CPU 秒数, 当前 RSS 字节数)"""
+    cpu = 0.0
+    rss = 0
+    for current in _process_tree(pid):
+        try:
+            with open(f'/proc/{current}/stat') as f:
+                fields = f.read().rsplit(')', 1)[1].split()
+            with open(f'/proc/{current}/statm') as f:
+                rss += int(f.read().split()[1]) * PAGE_SIZE
+        except OSError:
+            continue
+        # utime 和 stime 是 ')' 之后的第 12、13 个字段
+        cpu += (int(fields[11]) + int(fields[12])) / CLK_TCK
+    return cpu, rss
+
+
+class ResourceMonitor:
+    """周期性采样服务端进程树；已退出的子进程的 CPU 时间可能无法计入"""
+
+    def __init__(self, pid, interval=0.2):
+        self.pid = pid
+        self.interval = interval
+        self.samples = []
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.samples.append((time.perf_counter(),) + _sample_tree(self.pid))
+            self._stop.wait(self.interval)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        self.samples.append((time.perf_counter(),) + _sample_tree(self.pid))
+
+    def summary(self):
+        if len(self.samples) < 2:
+            return {}
+        (t0, cpu0, _), (t1, cpu1, _) = self.samples[0], self.samples[-1]
+        rss = [sample[2] for sample in self.samples]
+        return {
+            'cpu_seconds': cpu1 - cpu0,
+            'cpu_percent': (cpu1 - cpu0) / (t1 - t0) * 100 if t1 > t0 else None,
+            'rss_start_mb': rss[0] / 1e6,
+            'rss_peak_mb': max(rss) / 1e6,
+            'rss_end_mb': rss[-1] / 1e6,
+        }
+
+
+# ---- 负载生成 ----
+
+class Recorder:
+    """线程安全地收集每个请求的结果"""
+
+    def __init__(self):
+        self.records = []
+        self._lock = threading.Lock()
+
+    def add(self, scenario, latency, status, ok):
+        with self._lock:
+            self.records.append((scenario, latency, status, ok))
+
+
+def _is_success(status, headers, data):
+    """HTTP 200 且 JSON 响应中没有 success=False 或逐文件错误"""
+    if status != 200:
+        return False
+    if 'json' not in headers.get('Content-Type', ''):
+        return True
+    try:
+        payload = json.loads(data)
+    except ValueError:
+        return False
+    if payload.get('success') is False:
+        return False
+    results = payload.get('result')
+    if isinstance(results, list):
+        return all('error' not in item for item in results)
+    return True
+
+
+def _run_load(base, scenarios, weights, args):
+    recorder = Recorder()
+    names = list(weights)
+    cumulative = list(itertools.accumulate(weights[name] for name in names))
+    counter = itertools.count()
+    start = time.perf_counter()
+    deadline = start + args.duration if args.duration else None
+
+    def worker(seed):
+        rng = random.Random(seed)
+        while True:
+            index = next(counter)
+            if args.requests and index >= args.requests:
+                return
+            if args.rate:
+                # 固定速率：第 index 个请求不早于 start + index / rate 发出
+                delay = start + index / args.rate - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+            if deadline and time.perf_counter() >= deadline:
+                return
+            name = names[bisect.bisect_right(cumulative, rng.random() * cumulative[-1])]
+            scenario = scenarios[name]
+            body, content_type = scenario.build(rng)
+            sent = time.perf_counter()
+            try:
+                status, headers, data = _request(base, 'POST', scenario.path, body, content_type,
+                                                 timeout=args.timeout)
+                ok = _is_success(status, headers, data)
+            except Exception:
+                status, ok = None, False
+            recorder.add(name, time.perf_counter() - sent, status, ok)
+
+    threads = [threading.Thread(target=worker, args=(args.seed + i,), daemon=True)
+               for i in range(args.concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return recorder.records, time.perf_counter() - start
+
+
+def _percentile(sorted_values, fraction):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, max(0, math.ceil(fraction * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+def _latency_stats(latencies):
+    values = sorted(latency * 1000 for latency in latencies)
+    histogram = {}
+    for value in values:
+        bucket = next((b for b in BUCKETS_MS if value <= b), math.inf)
+        histogram[bucket] = histogram.get(bucket, 0) + 1
+    return {
+        'count': len(values),
+        'mean_ms': statistics.fmean(values) if values else None,
+        'p50_ms': _percentile(values, 0.50),
+        'p90_ms': _percentile(values, 0.90),
+        'p99_ms': _percentile(values, 0.99),
+        'max_ms': values[-1] if values else None,
+        'histogram_ms': {('inf' if b == math.inf else str(b)): n
+                         for b, n in sorted(histogram.items())},
+    }
+
+
+def _report(records, elapsed, server_stats, args, weights):
+    report = {
+        'config': {
+            'concurrency': args.concurrency, 'rate': args.rate, 'duration': args.duration,
+            'requests': args.requests, 'mix': weights, 'threaded': args.threaded,
+            'server_processes': args.server_processes, 'server_env': args.server_env,
+            'inprocess': args.inprocess, 'synthetic': args.synthetic,
+        },
+        'elapsed_s': elapsed,
+        'requests': len(records),
+        'throughput_rps': len(records) / elapsed if elapsed else None,
+        'error_rate': (sum(1 for r in records if not r[3]) / len(records)) if records else None,
+        'overall': _latency_stats([r[1] for r in records]),
+        'scenarios': {},
+        'server': server_stats,
+    }
+    for name in weights:
+        subset = [r for r in records if r[0] == name]
+        if not subset:
+            continue
+        stats = _latency_stats([r[1] for r in subset])
+        stats['errors'] = sum(1 for r in subset if not r[3])
+        stats['status'] = {str(k): v for k, v in sorted(
+            ((status, sum(1 for r in subset if r[2] == status)) for status in {r[2] for r in subset}),
+            key=lambda item: str(item[0]))}
+        report['scenarios'][name] = stats
+    return report
+
+
+def _print_report(report):
+    for name, reason in report.get('dropped', {}).items():
+        print(f"未测试 {name}：{reason}")
+    print(f"请求数 {report['requests']}，耗时 {report['elapsed_s']:.1f} s，"
+          f"吞吐量 {report['throughput_rps']:.1f} req/s，错误率 {report['error_rate'] * 100:.1f}%")
+    print(f"\n{'接口':<14} {'请求':>6} {'错误':>6} {'p50 ms':>9} {'p90 ms':>9} {'p99 ms':>9} {'max ms':>9}")
+    rows = list(report['scenarios'].items()) + [('全部', dict(report['overall'], errors=None))]
+    for name, stats in rows:
+        errors = '' if stats['errors'] is None else stats['errors']
+        print(f"{name:<14} {stats['count']:>6} {errors:>6} {stats['p50_ms']:>9.1f} "
+              f"{stats['p90_ms']:>9.1f} {stats['p99_ms']:>9.1f} {stats['max_ms']:>9.1f}")
+
+    print('\n延迟分布 (ms)')
+    histogram = report['overall']['histogram_ms']
+    peak = max(histogram.values()) if histogram else 1
+    for bucket, count in histogram.items():
+        bar = '#' * max(1, round(count / peak * 40))
+        print(f"  <= {bucket:>7} {count:>7} {bar}")
+
+    server = report['server']
+    if server:
+        print(f"\n服务端: CPU {server['cpu_seconds']:.1f} s ({server['cpu_percent']:.0f}%)，"
+              f"RSS {server['rss_start_mb']:.0f} -> 峰值 {server['rss_peak_mb']:.0f} MB")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--mix', nargs='+', default=['embed=3', 'verify=1', 'encrypt_file=1', 'encrypt=2'],
+                        help='场景权重，可选 embed、verify、encrypt_file、encrypt')
+    parser.add_argument('--concurrency', type=int, default=4, help='并发连接数')
+    parser.add_argument('--rate', type=float, help='目标请求速率 (req/s)，不指定时尽快发送')
+    parser.add_argument('--duration', type=float, help='持续时间（秒）')
+    parser.add_argument('--requests', type=int, help='请求总数（未指定持续时间时默认 200）')
+    parser.add_argument('--timeout', type=float, default=120, help='单个请求超时（秒）')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--files', nargs='+', default=[os.path.join(ROOT, 'Test_files', '*')],
+                        help='样本文件（glob），默认使用 Test_files/')
+    parser.add_argument('--synthetic', action='store_true', help='改用合成文档')
+    parser.add_argument('--paragraphs', type=int, default=200)
+    parser.add_argument('--slides', type=int, default=30)
+    parser.add_argument('--pages', type=int, default=50)
+    parser.add_argument('--media-mb', type=float, default=1)
+    parser.add_argument('--url', help='测试已运行的服务，不启动服务也不统计服务端资源')
+    parser.add_argument('--inprocess', action='store_true', help='在当前进程的线程中启动服务')
+    parser.add_argument('--no-threaded', dest='threaded', action='store_false',
+                        help='服务端不使用多线程')
+    parser.add_argument('--server-processes', type=int, default=1,
+                        help='服务端进程数（大于 1 时需配合 --no-threaded）')
+    parser.add_argument('--server-env', nargs='*', default=[], metavar='KEY=VALUE',
+                        help='启动服务时设置的环境变量，如 WATERMARK_WORKERS=0')
+    parser.add_argument('--json', action='store_true', help='输出 JSON')
+    parser.add_argument('--serve', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('--port', type=int, default=0, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        _serve(args.port, args.threaded, args.server_processes)
+        return
+
+    if not args.duration and not args.requests:
+        args.requests = 200
+    weights = {}
+    for item in args.mix:
+        name, _, weight = item.partition('=')
+        weights[name] = float(weight or 1)
+
+    server = None
+    dropped = {}
+    with tempfile.TemporaryDirectory(prefix='watermark-load-') as workdir:
+        documents = _load_documents(args, workdir)
+        if args.url:
+            base = args.url.rstrip('/')
+        else:
+            server = InProcessServer(args) if args.inprocess else ServerProcess(args)
+            base = server.base
+
+        try:
+            unknown = set(weights) - set(_scenarios(documents, documents))
+            if unknown:
+                parser.error(f"未知场景: {', '.join(sorted(unknown))}")
+            
+            watermarked = []
+            if 'verify' in weights:
+                watermarked = _prepare_watermarked(base, documents)
+                reason = _verify_unavailable(base, watermarked)
+                if reason:
+                    # 不把全部失败的请求当作延迟分布报告
+                    del weights['verify']
+                    dropped['verify'] = reason
+                    print(f"已从场景中移除 verify：{reason}", file=sys.stderr)
+                    if not weights:
+                        raise SystemExit('没有可运行的场景')
+            scenarios = _scenarios(documents, watermarked)
+
+            monitor = ResourceMonitor(server.pid).start() if server else None
+            records, elapsed = _run_load(base, scenarios, weights, args)
+            if monitor:
+                monitor.stop()
+        finally:
+            if server:
+                server.stop()
+
+    report = _report(records, elapsed, monitor.summary() if monitor else {}, args, weights)
+    report['dropped'] = dropped
+    if args.json:
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+    else:
+        _print_report(report)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,277 @@
+"""水印处理器、编解码与密钥派生的基准测试套件
+
+每个用例在独立的子进程中运行，分别统计耗时、吞吐量和峰值 RSS；
+结果可写入 JSON，并与之前某次提交的结果对比。
+
+用法:
+    python -m benchmarks.run --paragraphs 500 --slides 50 --pages 200 --media-mb 5 --output bench.json
+    python -m benchmarks.run --only docx pdf.extract --compare bench.json
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PASSWORD = 'benchmark-password'
+WATERMARK = {'content': 'benchmark watermark', 'user': 'bench'}
+FORMATS = ('docx', 'pptx', 'pdf')
+
+CASES = (
+    [f'{fmt}.{op}' for fmt in FORMATS for op in ('embed', 'extract', 'verify')]
+    + ['crypto.encrypt_data', 'crypto.decrypt_data', 'crypto.decrypt_data.cold',
+       'zero_width.encode', 'text.encrypt']
+)
+
+
+# ---- 子进程：执行单个用例 ----
+
+def _current_rss():
+    """当前常驻内存（字节）"""
+    with open('/proc/self/statm') as f:
+        return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+
+
+def _peak_rss():
+    """峰值常驻内存（字节）
+
+    ru_maxrss 在 fork 后 exec 时会保留父进程的值，优先读取 exec 时重置的 VmHWM。
+    """
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    # Linux 上 ru_maxrss 的单位为 KB
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def _read(fixtures, name):
+    with open(os.path.join(fixtures, name), 'rb') as f:
+        return f.read()
+
+
+def _prepare(case, fixtures, payload_kb):
+    """导入依赖并加载输入，返回 (被测函数, 每次处理的字节数)"""
+    group, op = case.split('.', 1)
+
+    if group in FORMATS:
+        from utils.watermark.handlers import HandlerRegistry
+        handler = HandlerRegistry()[f'.{group}']
+        if op == 'embed':
+            data = _read(fixtures, f'source.{group}')
+            return lambda: handler.embed_watermark(data, WATERMARK, PASSWORD), len(data)
+        data = _read(fixtures, f'watermarked.{group}')
+        if op == 'extract':
+            return lambda: handler.extract_watermark(data), len(data)
+        return lambda: handler.verify_watermark(data, PASSWORD), len(data)
+
+    text = 'x' * (payload_kb * 1024)
+    if group == 'crypto':
+        from utils.watermark.crypto import WatermarkCrypto
+        crypto = WatermarkCrypto()
+        data = {'content': text, 'user': 'bench'}
+        if op == 'encrypt_data':
+            return lambda: crypto.encrypt_data(data, PASSWORD), len(text)
+        package = crypto.encrypt_data(data, PASSWORD)
+        if op == 'decrypt_data':
+            return lambda: crypto.decrypt_data(package, PASSWORD), len(text)
+
+        def cold():
+            # 清空派生密钥缓存，测量包含 PBKDF2 的完整路径
+            crypto.key_cache.clear()
+            crypto.decrypt_data(package, PASSWORD)
+        return cold, len(text)
+
+    if group == 'zero_width':
+        from utils.watermark.crypto import WatermarkCrypto
+        crypto = WatermarkCrypto()
+        return lambda: crypto.encode_to_zero_width(text), len(text)
+
+    from utils.crypto import encrypt_text
+    return lambda: encrypt_text('cover text', text), len(text)
+
+
+def _run_case(case, fixtures, repeat, payload_kb):
+    func, size = _prepare(case, fixtures, payload_kb)
+    rss_ready = _current_rss()
+
+    # 首次调用单独计时（包含延迟导入和缓存填充）
+    start = time.perf_counter()
+    func()
+    first = time.perf_counter() - start
+
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+
+    return {
+        'bytes': size,
+        'first_s': first,
+        'times_s': times,
+        'rss_ready': rss_ready,
+        'rss_peak': _peak_rss(),
+    }
+
+
+# ---- 父进程：生成样本、调度用例、汇总结果 ----
+
+def _make_fixtures(workdir, args):
+    """生成合成文档及其加水印后的版本"""
+    from benchmarks.synthetic import make_docx, make_pptx, make_pdf
+    from utils.watermark.handlers import HandlerRegistry
+
+    makers = {
+        'docx': lambda path: make_docx(path, args.paragraphs, args.media_mb),
+        'pptx': lambda path: make_pptx(path, args.slides, args.media_mb),
+        'pdf': lambda path: make_pdf(path, args.pages, args.media_mb),
+    }
+    registry = HandlerRegistry()
+    for fmt in FORMATS:
+        source = os.path.join(workdir, f'source.{fmt}')
+        makers[fmt](source)
+        with open(source, 'rb') as f:
+            result = registry[f'.{fmt}'].embed_watermark(f.read(), WATERMARK, PASSWORD)
+        with open(os.path.join(workdir, f'watermarked.{fmt}'), 'wb') as f:
+            f.write(result.output)
+
+
+def _spawn(case, fixtures, args):
+    command = [sys.executable, '-m', 'benchmarks.run', '--worker', case,
+               '--fixtures', fixtures, '--repeat', str(args.repeat),
+               '--payload-kb', str(args.payload_kb)]
+    completed = subprocess.run(command, cwd=ROOT, capture_output=True, text=True)
+    if completed.returncode != 0:
+        return {'error': completed.stderr.strip().splitlines()[-1:]}
+    # 处理器会打印调试信息，结果在最后一行
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+
+def _summarize(raw):
+    if 'error' in raw:
+        return raw
+    times = raw['times_s']
+    median = statistics.median(times)
+    return {
+        'median_ms': median * 1000,
+        'min_ms': min(times) * 1000,
+        'first_ms': raw['first_s'] * 1000,
+        'throughput_mb_s': raw['bytes'] / median / 1e6 if median else None,
+        'input_bytes': raw['bytes'],
+        'rss_peak_mb': raw['rss_peak'] / 1e6,
+        'rss_delta_mb': max(raw['rss_peak'] - raw['rss_ready'], 0) / 1e6,
+        'samples_ms': [t * 1000 for t in times],
+    }
+
+
+def _git_commit():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=ROOT, check=True,
+                                capture_output=True, text=True).stdout.strip()
+        dirty = bool(subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'],
+                                    cwd=ROOT, capture_output=True, text=True).stdout.strip())
+        return commit, dirty
+    except (OSError, subprocess.CalledProcessError):
+        return None, None
+
+
+def _select(only):
+    if not only:
+        return list(CASES)
+    return [case for case in CASES
+            if any(case == prefix or case.startswith(prefix + '.') for prefix in only)]
+
+
+def _print_table(results, baseline):
+    header = f"{'用例':<26} {'中位数 ms':>10} {'最小 ms':>10} {'MB/s':>9} {'峰值RSS MB':>11} {'ΔRSS MB':>9}"
+    if baseline:
+        header += f" {'对比':>8}"
+    print(header)
+    for case, item in results.items():
+        if 'error' in item:
+            print(f"{case:<26} 失败: {' '.join(item['error'])}")
+            continue
+        line = (f"{case:<26} {item['median_ms']:>10.2f} {item['min_ms']:>10.2f} "
+                f"{item['throughput_mb_s'] or 0:>9.2f} {item['rss_peak_mb']:>11.1f} "
+                f"{item['rss_delta_mb']:>9.1f}")
+        old = baseline.get(case) if baseline else None
+        if old and 'median_ms' in old:
+            # 大于 1 表示比基线快
+            line += f" {old['median_ms'] / item['median_ms']:>7.2f}x"
+        print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--paragraphs', type=int, default=200, help='DOCX 段落数')
+    parser.add_argument('--slides', type=int, default=30, help='PPTX 幻灯片数')
+    parser.add_argument('--pages', type=int, default=100, help='PDF 页数')
+    parser.add_argument('--media-mb', type=float, default=2, help='每个文档嵌入的图片大小 (MB)')
+    parser.add_argument('--payload-kb', type=int, default=4, help='加密与零宽编码用例的数据大小 (KB)')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--only', nargs='+', help='只运行指定的用例或用例组，如 docx pdf.extract crypto')
+    parser.add_argument('--output', help='把结果写入 JSON 文件')
+    parser.add_argument('--compare', help='与之前保存的 JSON 结果对比')
+    parser.add_argument('--worker', help=argparse.SUPPRESS)
+    parser.add_argument('--fixtures', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        print(json.dumps(_run_case(args.worker, args.fixtures, args.repeat, args.payload_kb)))
+        return
+
+    cases = _select(args.only)
+    if not cases:
+        parser.error(f"没有匹配的用例，可选: {', '.join(CASES)}")
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)['results']
+
+    results = {}
+    with tempfile.TemporaryDirectory(prefix='watermark-bench-') as fixtures:
+        if any(case.split('.')[0] in FORMATS for case in cases):
+            print('生成样本文档...', file=sys.stderr)
+            _make_fixtures(fixtures, args)
+        for case in cases:
+            print(f'运行 {case}...', file=sys.stderr)
+            results[case] = _summarize(_spawn(case, fixtures, args))
+
+    _print_table(results, baseline)
+
+    if args.output:
+        commit, dirty = _git_commit()
+        report = {
+            'meta': {
+                'commit': commit,
+                'dirty': dirty,
+                'timestamp': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+                'python': platform.python_version(),
+                'platform': platform.platform(),
+                'cpu_count': os.cpu_count(),
+                'params': {
+                    'paragraphs': args.paragraphs, 'slides': args.slides, 'pages': args.pages,
+                    'media_mb': args.media_mb, 'payload_kb': args.payload_kb, 'repeat': args.repeat,
+                },
+            },
+            'results': results,
+        }
+        with open(args.output, 'w') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f'结果已写入 {args.output}', file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,86 @@
+"""基准测试用的合成文档生成"""
+import io
+import os
+import struct
+import zlib
+
+
+def make_png(size_bytes):
+    """生成约 size_bytes 大小的随机像素 PNG（数据不可压缩，接近真实照片）"""
+    width = 1024
+    height = max(1, size_bytes // (width * 3))
+    row = width * 3
+    noise = os.urandom(row * height)
+    raw = b''.join(b'\x00' + noise[y * row:(y + 1) * row] for y in range(height))
+
+    def chunk(kind, data):
+        body = kind + data
+        return struct.pack('>I', len(data)) + body + struct.pack('>I', zlib.crc32(body))
+
+    header = struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0)
+    return (b'\x89PNG\r\n\x1a\n' + chunk(b'IHDR', header)
+            + chunk(b'IDAT', zlib.compress(raw, 1)) + chunk(b'IEND', b''))
+
+
+def _media_blocks(media_mb, block_mb=4):
+    """将 media_mb 拆分为若干张不超过 block_mb 的图片"""
+    remaining = int(media_mb * 1024 * 1024)
+    while remaining > 0:
+        size = min(remaining, block_mb * 1024 * 1024)
+        yield io.BytesIO(make_png(size))
+        remaining -= size
+
+
+def make_docx(path, paragraphs=200, media_mb=0):
+    """生成包含 paragraphs 个段落和约 media_mb MB 图片的 DOCX"""
+    from docx import Document
+    from docx.shared import Inches
+
+    doc = Document()
+    for i in range(paragraphs):
+        doc.add_paragraph(f'第 {i} 段 合成测试文本 lorem ipsum dolor sit amet ' * 4)
+    for image in _media_blocks(media_mb):
+        doc.add_picture(image, width=Inches(4))
+    doc.save(path)
+    return path
+
+
+def make_pptx(path, slides=100, media_mb=0):
+    """生成包含 slides 张幻灯片和约 media_mb MB 图片的 PPTX"""
+    from pptx import Presentation
+    from pptx.util import Inches
+
+    prs = Presentation()
+    layout = prs.slide_layouts[1]
+    for i in range(slides):
+        slide = prs.slides.add_slide(layout)
+        slide.shapes.title.text = f'合成幻灯片 {i}'
+        slide.placeholders[1].text = '合成测试文本 lorem ipsum dolor sit amet ' * 8
+    for i, image in enumerate(_media_blocks(media_mb)):
+        slide = prs.slides[i % len(prs.slides)] if slides else prs.slides.add_slide(layout)
+        slide.shapes.add_picture(image, Inches(1), Inches(1), width=Inches(4))
+    prs.save(path)
+    return path
+
+
+def make_pdf(path, pages=100, media_mb=0):
+    """生成包含 pages 页文字和约 media_mb MB 图片的 PDF"""
+    from reportlab.lib.pagesizes import A4
+    from reportlab.lib.utils import ImageReader
+    from reportlab.pdfgen import canvas
+
+    pdf = canvas.Canvas(path, pagesize=A4)
+    images = _media_blocks(media_mb)
+    for i in range(max(pages, 1)):
+        pdf.drawString(72, 800, f'Synthetic page {i}')
+        for line in range(40):
+            pdf.drawString(72, 780 - line * 18, 'lorem ipsum dolor sit amet ' * 3)
+        image = next(images, None)
+        if image is not None:
+            pdf.drawImage(ImageReader(image), 72, 72, width=300, height=200)
+        pdf.showPage()
+    for image in images:
+        pdf.drawImage(ImageReader(image), 72, 72, width=300, height=200)
+        pdf.showPage()
+    pdf.save()
+    return path
@@ -1,9 +1,15 @@
 # 零宽字符编码
-ZERO_WIDTH_SPACE = '\u200b'  # 零宽空格
-ZERO_WIDTH_NON_JOINER = '\u200c'  # 零宽非连接符
-ZERO_WIDTH_JOINER = '\u200d'  # 零宽连接符
+from .zero_width import ZERO_WIDTH_SPACE, ZERO_WIDTH_NON_JOINER, ZERO_WIDTH_JOINER
+from . import zero_width
 
-def encrypt_text(text, secret):
+# 文本隐藏格式版本
+# 1: 每个零宽字符 1 位，8 个 1 作为首尾标记，仅支持单字节字符
+# 2: UTF-8 字节，每个零宽字符 4 位，帧结构为 MAGIC | 版本 | 长度(varint) | 数据
+TEXT_FORMAT_LEGACY = 1
+TEXT_FORMAT_V2 = 2
+FRAME_MAGIC = 0xE9  # 两个半字节都不会出现在版本 1 的编码中
+
+def encrypt_text(text, secret, version=TEXT_FORMAT_V2):
     """文本加密函数"""
     try:
         if isinstance(text, bytes):
@@ -11,24 +17,24 @@ def encrypt_text(text, secret):
         if isinstance(secret, bytes):
             secret = secret.decode('utf-8')
         
+        if version == TEXT_FORMAT_V2:
+            zero_width_secret = _encode_frame(secret.encode('utf-8'))
+            result = text + zero_width_secret
+            print(f"Original text length: {len(text)}")
+            print(f"Zero-width characters: {len(zero_width_secret)}")
+            return result
+        
         # 将密钥转换为二进制字符串
-        binary_secret = ''.join(format(ord(c), '08b') for c in secret)
+        binary_secret = zero_width.text_to_bits(secret)
         
         # 添加固定的开始和结束标记
         marker = '11111111'  # 8个1作为标记
         final_binary = marker + binary_secret + marker
         
-        print(f"Binary secret: {binary_secret}")
-        print(f"Final binary: {final_binary}")
         print(f"Binary length: {len(final_binary)}")
         
         # 使用零宽字符替换二进制位
-        zero_width_secret = ''
-        for bit in final_binary:
-            if bit == '0':
-                zero_width_secret += ZERO_WIDTH_SPACE
-            else:
-                zero_width_secret += ZERO_WIDTH_JOINER
+        zero_width_secret = zero_width.encode_bits(final_binary, ZERO_WIDTH_SPACE, ZERO_WIDTH_JOINER)
         
         result = text + zero_width_secret
         print(f"Original text length: {len(text)}")
@@ -45,28 +51,22 @@ def decrypt_text(text):
         if isinstance(text, bytes):
             text = text.decode('utf-8')
         
-        # 提取零宽字符
-        zero_width_chars = []
-        for c in text:
-            if c in [ZERO_WIDTH_SPACE, ZERO_WIDTH_JOINER]:
-                zero_width_chars.append(c)
+        # 优先按版本 2 的长度前缀帧解析
+        payload = _decode_frame(text)
+        if payload is not None:
+            secret = payload.decode('utf-8')
+            print(f"Decrypted secret length: {len(secret)}")
+            return secret
         
-        print(f"Found {len(zero_width_chars)} zero-width characters")
+        # 提取零宽字符并转换回二进制字符串
+        binary_secret = zero_width.decode_bits(text, ZERO_WIDTH_SPACE, ZERO_WIDTH_JOINER)
         
-        if not zero_width_chars:
+        print(f"Found {len(binary_secret)} zero-width characters")
+        
+        if not binary_secret:
             print("No zero-width characters found")
             return ""
         
-        # 转换回二进制字符串
-        binary_secret = ''
-        for c in zero_width_chars:
-            if c == ZERO_WIDTH_SPACE:
-                binary_secret += '0'
-            elif c == ZERO_WIDTH_JOINER:
-                binary_secret += '1'
-        
-        print(f"Full binary string: {binary_secret}")
-        
         # 查找开始和结束标记
         marker = '11111111'
         start_pos = binary_secret.find(marker)
@@ -81,30 +81,52 @@ def decrypt_text(text):
         
         # 提取实际的二进制数据（不包括标记）
         binary_data = binary_secret[start_pos + 8:end_pos]
-        print(f"Extracted binary data: {binary_data}")
         print(f"Binary data length: {len(binary_data)}")
         
-        # 确保二进制数据长度是8的倍数
-        if len(binary_data) % 8 != 0:
-            missing_bits = 8 - (len(binary_data) % 8)
-            binary_data = binary_data + '0' * missing_bits
-            print(f"Padded binary data: {binary_data}")
-            print(f"New binary data length: {len(binary_data)}")
-        
-        # 转换为字符
-        secret = ''
-        for i in range(0, len(binary_data), 8):
-            byte = binary_data[i:i+8]
-            try:
-                char_code = int(byte, 2)
-                secret += chr(char_code)
-                print(f"Converted byte {byte} to character {chr(char_code)}")
-            except ValueError as e:
-                print(f"Error converting binary to character: {str(e)}")
-                continue
+        # 转换为字符（不足8位的部分在末尾补0）
+        secret = zero_width.bits_to_bytes(binary_data).decode('latin-1')
         
-        print(f"Decrypted secret: {secret}")
+        print(f"Decrypted secret length: {len(secret)}")
         return secret
     except Exception as e:
         print(f"Decryption error: {str(e)}")
-        return "" 
\ No newline at end of file
+        return ""
+
+def _encode_frame(payload):
+    """将数据封装为版本 2 的帧并编码为零宽字符"""
+    length = len(payload)
+    varint = bytearray()
+    while True:
+        byte = length & 0x7F
+        length >>= 7
+        if length:
+            varint.append(byte | 0x80)
+        else:
+            varint.append(byte)
+            break
+    header = bytes([FRAME_MAGIC, TEXT_FORMAT_V2]) + bytes(varint)
+    return zero_width.encode_nibbles(header + payload)
+
+def _decode_frame(text):
+    """查找并解析版本 2 的帧，未找到时返回 None"""
+    digits = zero_width.nibble_digits(text)
+    signature = '%02x%02x' % (FRAME_MAGIC, TEXT_FORMAT_V2)
+    pos = digits.find(signature)
+    while pos != -1:
+        # 解析 varint 长度（最多 5 个字节）
+        cursor = pos + len(signature)
+        length = 0
+        for shift in range(0, 35, 7):
+            byte_digits = digits[cursor:cursor + 2]
+            if len(byte_digits) < 2:
+                break
+            byte = int(byte_digits, 16)
+            cursor += 2
+            length |= (byte & 0x7F) << shift
+            if not byte & 0x80:
+                end = cursor + 2 * length
+                if end <= len(digits):
+                    return bytes.fromhex(digits[cursor:end])
+                break
+        pos = digits.find(signature, pos + 1)
+    return None
@@ -1,6 +1,79 @@
 from cryptography.fernet import Fernet
+from cryptography.exceptions import InvalidTag
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+from cryptography.hazmat.primitives.kdf.hkdf import HKDF
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 import os
 import base64
+import struct
+
+# 分段加密容器格式
+# 文件头: MAGIC(4) | 版本(1) | 分段明文大小(4, 大端) | 盐(16)
+# 分段:   AES-256-GCM(明文分段) = 密文 + 16 字节认证标签
+# 每个分段的 nonce 由分段序号和末段标志组成，文件头作为附加认证数据，
+# 因此分段被截断、重排、替换或在末尾追加数据都会导致认证失败
+STREAM_MAGIC = b'FENC'
+STREAM_VERSION = 1
+STREAM_HEADER = struct.Struct('>4sBI16s')
+STREAM_TAG_SIZE = 16
+DEFAULT_CHUNK_SIZE = 64 * 1024
+MAX_CHUNK_SIZE = 16 * 1024 * 1024
+
+
+def _read_exact(stream, size):
+    """读取 size 字节，只有到达流末尾时才返回更短的数据"""
+    data = stream.read(size)
+    if not data or len(data) == size:
+        return data or b''
+    # 管道、套接字等可能出现短读，继续读满
+    parts = [data]
+    remaining = size - len(data)
+    while remaining:
+        data = stream.read(remaining)
+        if not data:
+            break
+        parts.append(data)
+        remaining -= len(data)
+    return b''.join(parts)
+
+
+def _iter_segments(stream, size):
+    """按固定大小切分流，产出 (序号, 数据, 是否末段)；预读一段以判断末段"""
+    index = 0
+    segment = _read_exact(stream, size)
+    while True:
+        next_segment = _read_exact(stream, size) if len(segment) == size else b''
+        last = not next_segment
+        yield index, segment, last
+        if last:
+            return
+        segment = next_segment
+        index += 1
+
+
+def _map_ordered(func, items, workers):
+    """在线程池中并行处理各分段并按原顺序产出结果，同时在途的分段数受限"""
+    if workers <= 1:
+        for item in items:
+            yield func(item)
+        return
+
+    # AES-GCM 运算期间会释放 GIL，线程池即可利用多核
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        pending = deque()
+        try:
+            for item in items:
+                pending.append(pool.submit(func, item))
+                if len(pending) >= workers * 2:
+                    yield pending.popleft().result()
+            while pending:
+                yield pending.popleft().result()
+        finally:
+            for future in pending:
+                future.cancel()
+
 
 class FileEncryptor:
     def __init__(self, key=None):
@@ -11,13 +84,19 @@ class FileEncryptor:
             self.key = Fernet.generate_key()
         self.cipher_suite = Fernet(self.key)
 
-    def encrypt_file(self, input_path, output_path=None):
-        """加密文件"""
+    def encrypt_file(self, input_path, output_path=None, chunked=False,
+                     chunk_size=DEFAULT_CHUNK_SIZE, workers=1):
+        """加密文件，chunked 为 True 时使用分段流式格式，workers 为并行线程数"""
         if output_path is None:
             filename, ext = os.path.splitext(input_path)
             output_path = f"{filename}_encrypted{ext}"
 
         try:
+            if chunked:
+                with open(input_path, 'rb') as src, open(output_path, 'wb') as dst:
+                    self.encrypt_stream(src, dst, chunk_size, workers)
+                return output_path
+
             # 读取原文件
             with open(input_path, 'rb') as file:
                 file_data = file.read()
@@ -34,13 +113,27 @@ class FileEncryptor:
         except Exception as e:
             raise Exception(f"加密文件时出错: {str(e)}")
 
-    def decrypt_file(self, input_path, output_path=None):
-        """解密文件"""
+    def decrypt_file(self, input_path, output_path=None, workers=1):
+        """解密文件，自动识别分段流式格式，workers 为并行线程数"""
         if output_path is None:
             filename, ext = os.path.splitext(input_path)
             output_path = f"{filename}_decrypted{ext}"
 
         try:
+            with open(input_path, 'rb') as file:
+                chunked = file.read(len(STREAM_MAGIC)) == STREAM_MAGIC
+
+            if chunked:
+                try:
+                    with open(input_path, 'rb') as src, open(output_path, 'wb') as dst:
+                        self.decrypt_stream(src, dst, workers)
+                except Exception:
+                    # 认证失败时不保留已写出的部分明文
+                    if os.path.exists(output_path):
+                        os.remove(output_path)
+                    raise
+                return output_path
+
             # 读取加密文件
             with open(input_path, 'rb') as file:
                 encrypted_data = file.read()
@@ -55,4 +148,76 @@ class FileEncryptor:
             return output_path
 
         except Exception as e:
-            raise Exception(f"解密文件时出错: {str(e)}") 
\ No newline at end of file
+            raise Exception(f"解密文件时出错: {str(e)}")
+
+    def encrypt_stream(self, src, dst, chunk_size=DEFAULT_CHUNK_SIZE, workers=1):
+        """从可读对象流式加密到可写对象，返回写出的字节数"""
+        written = 0
+        for block in self.iter_encrypt(src, chunk_size, workers):
+            dst.write(block)
+            written += len(block)
+        return written
+
+    def decrypt_stream(self, src, dst, workers=1):
+        """从可读对象流式解密到可写对象，返回写出的字节数"""
+        written = 0
+        for block in self.iter_decrypt(src, workers):
+            dst.write(block)
+            written += len(block)
+        return written
+
+    def iter_encrypt(self, src, chunk_size=DEFAULT_CHUNK_SIZE, workers=1):
+        """逐段加密，依次产出文件头和各个密文分段"""
+        if not 0 < chunk_size <= MAX_CHUNK_SIZE:
+            raise ValueError(f"分段大小必须在 1 到 {MAX_CHUNK_SIZE} 字节之间")
+
+        salt = os.urandom(16)
+        header = STREAM_HEADER.pack(STREAM_MAGIC, STREAM_VERSION, chunk_size, salt)
+        cipher = self._stream_cipher(salt)
+        yield header
+
+        def encrypt_segment(item):
+            index, chunk, last = item
+            return cipher.encrypt(self._chunk_nonce(index, last), chunk, header)
+
+        yield from _map_ordered(encrypt_segment, _iter_segments(src, chunk_size), workers)
+
+    def iter_decrypt(self, src, workers=1):
+        """逐段解密并校验，依次产出明文分段"""
+        header = _read_exact(src, STREAM_HEADER.size)
+        if len(header) < STREAM_HEADER.size:
+            raise ValueError("不是有效的分段加密文件")
+        magic, version, chunk_size, salt = STREAM_HEADER.unpack(header)
+        if magic != STREAM_MAGIC:
+            raise ValueError("不是有效的分段加密文件")
+        if version != STREAM_VERSION:
+            raise ValueError(f"不支持的分段格式版本: {version}")
+        if not 0 < chunk_size <= MAX_CHUNK_SIZE:
+            raise ValueError(f"无效的分段大小: {chunk_size}")
+
+        cipher = self._stream_cipher(salt)
+
+        def decrypt_segment(item):
+            index, segment, last = item
+            try:
+                return cipher.decrypt(self._chunk_nonce(index, last), segment, header)
+            except InvalidTag:
+                raise ValueError(f"第 {index} 个分段校验失败，文件可能被篡改或截断")
+
+        segments = _iter_segments(src, chunk_size + STREAM_TAG_SIZE)
+        yield from _map_ordered(decrypt_segment, segments, workers)
+
+    def _stream_cipher(self, salt):
+        """由主密钥和文件盐派生本文件专用的 AES-GCM 密钥"""
+        hkdf = HKDF(
+            algorithm=hashes.SHA256(),
+            length=32,
+            salt=salt,
+            info=b'file-crypto stream v1',
+        )
+        return AESGCM(hkdf.derive(base64.urlsafe_b64decode(self.key)))
+
+    @staticmethod
+    def _chunk_nonce(index, last):
+        """分段 nonce: 11 字节序号 + 1 字节末段标志"""
+        return index.to_bytes(11, 'big') + (b'\x01' if last else b'\x00')
@@ -3,8 +3,8 @@ import tempfile
 from docx import Document
 from pptx import Presentation
 from PyPDF2 import PdfReader, PdfWriter
-import win32com.client
 from .crypto import encrypt_text, decrypt_text
+from . import zero_width
 
 def process_docx(file_path, mode='encrypt', secret=''):
     """处理 DOCX 文件"""
@@ -36,7 +36,7 @@ def process_docx(file_path, mode='encrypt', secret=''):
             for para in doc.paragraphs:
                 if para.text.strip():
                     print(f"Processing paragraph: {para.text}")
-                    has_zero_width = any(c in para.text for c in ['\u200b', '\u200d'])
+                    has_zero_width = zero_width.contains_any(para.text)
                     if has_zero_width:
                         try:
                             decrypted = decrypt_text(para.text)
@@ -86,6 +86,8 @@ def process_ppt(file_path, mode='encrypt', secret=''):
     temp_pptx = os.path.join(temp_dir, 'temp.pptx')
     
     try:
+        # 仅 Windows 上可用，推迟到处理 .ppt 时才导入
+        import win32com.client
         powerpoint = win32com.client.Dispatch('PowerPoint.Application')
         ppt = powerpoint.Presentations.Open(file_path)
         ppt.SaveAs(temp_pptx, 24)  # 24 是 .pptx 格式的文件格式代码
@@ -0,0 +1,167 @@
+"""后台批处理任务：文件在有界线程池中处理，结果保存在本地目录并按 TTL 清理"""
+import os
+import shutil
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+JOB_PENDING = 'pending'
+JOB_RUNNING = 'running'
+JOB_DONE = 'done'
+
+
+class Job:
+    """一个批处理任务及其进度计数"""
+
+    def __init__(self, kind, root, filenames):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.workdir = os.path.join(root, self.id)
+        self.filenames = list(filenames)
+        self.results = [None] * len(self.filenames)
+        self.completed = 0
+        self.failed = 0
+        self.created = time.time()
+        self.finished = None
+        self._lock = threading.Lock()
+
+    @property
+    def total(self):
+        return len(self.filenames)
+
+    @property
+    def status(self):
+        with self._lock:
+            return self._status()
+
+    def _status(self):
+        if self.finished is not None:
+            return JOB_DONE
+        return JOB_RUNNING if self.completed or self.failed else JOB_PENDING
+
+    def file_dir(self, index):
+        """第 index 个文件的工作目录，避免同名文件互相覆盖"""
+        return os.path.join(self.workdir, str(index))
+
+    def _record(self, index, result):
+        with self._lock:
+            self.results[index] = result
+            if 'error' in result:
+                self.failed += 1
+            else:
+                self.completed += 1
+            if self.completed + self.failed == self.total:
+                self.finished = time.time()
+
+    def to_dict(self):
+        """任务状态的快照（不含本地路径）"""
+        with self._lock:
+            results = [
+                None if r is None else {k: v for k, v in r.items() if k != 'output'}
+                for r in self.results
+            ]
+            return {
+                'job_id': self.id,
+                'kind': self.kind,
+                'status': self._status(),
+                'total': self.total,
+                'completed': self.completed,
+                'failed': self.failed,
+                'created': self.created,
+                'finished': self.finished,
+                'results': results,
+            }
+
+
+class JobManager:
+    """有界工作线程池 + 本地结果存储
+
+    每个文件作为一个独立任务提交到同一线程池，max_workers 限制所有任务合计的并发数；
+    结果文件保存在 root/<job_id>/<index>/ 下，任务完成 ttl 秒后连同目录一起删除。
+    """
+
+    def __init__(self, root, max_workers=2, ttl=3600):
+        self.root = os.path.abspath(root)
+        self.ttl = ttl
+        self.max_workers = max_workers
+        self._jobs = {}
+        self._lock = threading.Lock()
+        self._executor = None
+        os.makedirs(root, exist_ok=True)
+
+    def _pool(self):
+        # 首次提交时才创建线程池，避免导入 app 时启动线程
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers,
+                                                    thread_name_prefix='job')
+            return self._executor
+
+    def create(self, kind, filenames):
+        """创建任务及其工作目录，调用方随后把上传文件保存到 job.file_dir(i) 中"""
+        self.purge_expired()
+        job = Job(kind, self.root, filenames)
+        for index in range(job.total):
+            os.makedirs(job.file_dir(index), exist_ok=True)
+        with self._lock:
+            self._jobs[job.id] = job
+        return job
+
+    def start(self, job, inputs, process):
+        """提交任务中的所有文件；process(filename, input_path) 返回结果字典，失败时包含 'error'"""
+        pool = self._pool()
+        for index, (filename, input_path) in enumerate(inputs):
+            pool.submit(self._run, job, index, filename, input_path, process)
+        return job
+
+    def _run(self, job, index, filename, input_path, process):
+        try:
+            result = process(filename, input_path)
+        except Exception as e:
+            result = {'error': f"{filename}: 处理失败 - {str(e)}"}
+        finally:
+            # 输入文件处理后即可删除，只保留结果
+            if os.path.exists(input_path):
+                os.remove(input_path)
+        job._record(index, result)
+
+    def discard(self, job):
+        """删除尚未提交的任务及其目录，用于保存输入文件失败等情况"""
+        with self._lock:
+            self._jobs.pop(job.id, None)
+        shutil.rmtree(job.workdir, ignore_errors=True)
+
+    def get(self, job_id):
+        """按 ID 查找任务，已过期或不存在时返回 None"""
+        self.purge_expired()
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def result_file(self, job_id, index):
+        """返回已完成文件的 (本地路径, 下载文件名)，不存在时返回 None"""
+        job = self.get(job_id)
+        if job is None or not 0 <= index < job.total:
+            return None
+        result = job.results[index]
+        if not result or 'output' not in result or not os.path.exists(result['output']):
+            return None
+        return result['output'], result['filename']
+
+    def purge_expired(self):
+        """删除完成时间超过 ttl 的任务及其结果目录"""
+        deadline = time.time() - self.ttl
+        with self._lock:
+            expired = [job for job in self._jobs.values()
+                       if job.finished is not None and job.finished < deadline]
+            for job in expired:
+                del self._jobs[job.id]
+        for job in expired:
+            shutil.rmtree(job.workdir, ignore_errors=True)
+        return len(expired)
+
+    def shutdown(self, wait=True):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=wait)
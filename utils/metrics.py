@@ -0,0 +1,196 @@
+"""进程内指标：计数器和直方图，按 Prometheus 文本格式导出
+
+记录时只在锁内累加数值，不保存单个样本，格式化工作全部推迟到抓取时进行；
+水印工作进程中记录的指标通过 drain() 取出，随任务结果发回父进程后用 merge() 合并。
+"""
+import bisect
+import os
+import threading
+import time
+
+# 耗时直方图的桶上限（秒）
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+# 文件大小直方图的桶上限（字节），1 KB 到 64 MB
+SIZE_BUCKETS = tuple(1024 * 4 ** i for i in range(9))
+
+COUNTER = 'counter'
+HISTOGRAM = 'histogram'
+
+
+def payload_size(payload):
+    """bytes、路径或可定位文件对象的大小（字节），无法确定时返回 None"""
+    try:
+        if isinstance(payload, (bytes, bytearray, memoryview)):
+            return len(payload)
+        if isinstance(payload, (str, os.PathLike)):
+            return os.path.getsize(payload)
+        if hasattr(payload, 'seek') and hasattr(payload, 'tell'):
+            position = payload.tell()
+            size = payload.seek(0, 2)
+            payload.seek(position)
+            return size
+    except (OSError, ValueError):
+        pass
+    return None
+
+
+def _label_key(labels):
+    # 标签值统一转为字符串，导出时排序不会因 None 等类型混杂而出错
+    return tuple(sorted((name, str(value)) for name, value in labels.items()))
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(key, extra=None):
+    items = list(key) + ([extra] if extra else [])
+    if not items:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in items) + '}'
+
+
+def _format_number(value):
+    if value == float('inf'):
+        return '+Inf'
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Timer:
+    """记录 with 块耗时到直方图"""
+    __slots__ = ('_registry', '_name', '_labels', '_start')
+
+    def __init__(self, registry, name, labels):
+        self._registry = registry
+        self._name = name
+        self._labels = labels
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._registry.observe(self._name, time.perf_counter() - self._start, **self._labels)
+        return False
+
+
+class MetricsRegistry:
+    """线程安全的指标集合，指标需先用 counter()/histogram() 声明"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # 名称 -> (类型, 说明, 桶上限)
+        self._meta = {}
+        # (名称, 标签) -> 数值
+        self._counters = {}
+        # (名称, 标签) -> [各桶计数（最后一个为 +Inf）, 总和]
+        self._histograms = {}
+
+    def counter(self, name, help):
+        self._meta[name] = (COUNTER, help, None)
+
+    def histogram(self, name, help, buckets=DEFAULT_BUCKETS):
+        self._meta[name] = (HISTOGRAM, help, tuple(buckets))
+
+    def inc(self, name, value=1, **labels):
+        key = (name, _label_key(labels))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name, value, **labels):
+        buckets = self._meta[name][2]
+        index = bisect.bisect_left(buckets, value)
+        key = (name, _label_key(labels))
+        with self._lock:
+            entry = self._histograms.get(key)
+            if entry is None:
+                entry = self._histograms[key] = [[0] * (len(buckets) + 1), 0.0]
+            entry[0][index] += 1
+            entry[1] += value
+
+    def timer(self, name, **labels):
+        """with METRICS.timer(name, **labels): ... 记录耗时"""
+        return _Timer(self, name, labels)
+
+    def drain(self):
+        """取出并清空已记录的数值，用于从工作进程发回父进程"""
+        with self._lock:
+            counters, self._counters = self._counters, {}
+            histograms, self._histograms = self._histograms, {}
+        return {'counters': counters, 'histograms': histograms}
+
+    def merge(self, data):
+        """合并 drain() 的结果"""
+        if not data:
+            return
+        with self._lock:
+            for key, value in data['counters'].items():
+                self._counters[key] = self._counters.get(key, 0) + value
+            for key, (counts, total) in data['histograms'].items():
+                entry = self._histograms.get(key)
+                if entry is None:
+                    self._histograms[key] = [list(counts), total]
+                    continue
+                for index, count in enumerate(counts):
+                    entry[0][index] += count
+                entry[1] += total
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+
+    def render(self):
+        """按 Prometheus 文本格式（0.0.4）导出全部指标"""
+        with self._lock:
+            counters = dict(self._counters)
+            histograms = {key: (list(counts), total)
+                          for key, (counts, total) in self._histograms.items()}
+
+        lines = []
+        for name in sorted(self._meta):
+            kind, help, buckets = self._meta[name]
+            lines.append(f'# HELP {name} {help}')
+            lines.append(f'# TYPE {name} {kind}')
+            if kind == COUNTER:
+                for (metric, labels), value in sorted(counters.items()):
+                    if metric == name:
+                        lines.append(f'{name}{_format_labels(labels)} {_format_number(value)}')
+                continue
+            for (metric, labels), (counts, total) in sorted(histograms.items()):
+                if metric != name:
+                    continue
+                cumulative = 0
+                for bound, count in zip(buckets + (float('inf'),), counts):
+                    cumulative += count
+                    le = ('le', _format_number(bound))
+                    lines.append(f'{name}_bucket{_format_labels(labels, le)} {cumulative}')
+                lines.append(f'{name}_sum{_format_labels(labels)} {_format_number(total)}')
+                lines.append(f'{name}_count{_format_labels(labels)} {cumulative}')
+        return '\n'.join(lines) + '\n'
+
+
+METRICS = MetricsRegistry()
+
+# 水印处理器内部
+METRICS.histogram('watermark_stage_seconds', '水印处理器各阶段耗时（秒），按处理器、操作和阶段区分')
+METRICS.histogram('watermark_kdf_seconds', 'PBKDF2 密钥派生耗时（秒）')
+METRICS.counter('watermark_key_cache_total', '派生密钥缓存的查询次数，按是否命中区分')
+METRICS.counter('watermark_result_cache_total', '提取结果缓存的查询次数，按命中层级、合并等待或未命中区分')
+
+# 水印处理器调用（包括进程池的传输开销）
+METRICS.histogram('watermark_operation_seconds', '水印操作总耗时（秒），按扩展名、操作和结果区分')
+METRICS.histogram('watermark_input_bytes', '水印操作的输入文件大小（字节）', SIZE_BUCKETS)
+METRICS.counter('watermark_bytes_in_total', '水印操作读取的字节数')
+METRICS.counter('watermark_bytes_out_total', '嵌入水印后输出的字节数')
+
+# 流式文件加密
+METRICS.counter('file_crypto_bytes_out_total', '流式文件加密接口输出的字节数，按加密或解密区分')
+
+# HTTP 请求
+METRICS.histogram('http_request_seconds', 'HTTP 请求处理耗时（秒），不含流式响应的传输时间')
+METRICS.counter('http_requests_total', 'HTTP 请求数，按端点和状态码区分')
+METRICS.counter('http_request_bytes_total', 'HTTP 请求体字节数')
+METRICS.histogram('http_stage_seconds', '请求处理中水印操作以外的阶段耗时（秒），如上传落盘和 Base64 编码')
@@ -0,0 +1,180 @@
+"""按需对单个请求做性能分析，结果写入有容量上限的轮转目录
+
+请求携带可信的头部或查询参数（值等于配置的令牌），或按采样率随机选中时，
+在 cProfile（输出 .prof）或采样分析器（输出可直接生成火焰图的 .collapsed 折叠栈）下运行。
+同一时刻只分析一个请求，其余请求照常处理。
+"""
+import cProfile
+import hmac
+import os
+import random
+import re
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+
+MODE_CPROFILE = 'cprofile'
+MODE_SAMPLE = 'sample'
+PROFILE_SUFFIXES = ('.prof', '.collapsed')
+
+
+class _CProfileCapture:
+    def __init__(self):
+        self._profile = cProfile.Profile()
+
+    def start(self):
+        self._profile.enable()
+
+    def stop(self):
+        self._profile.disable()
+
+    def dump(self, path):
+        self._profile.dump_stats(path)
+
+
+class _SamplingCapture:
+    """后台线程定期读取目标线程的调用栈，按折叠栈格式计数"""
+
+    def __init__(self, interval):
+        self.interval = interval
+        self._thread_id = threading.get_ident()
+        self._stacks = Counter()
+        self._stop = threading.Event()
+        self._sampler = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        self._sampler.start()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self._thread_id)
+            if frame is None:
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f'{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})')
+                frame = frame.f_back
+            self._stacks[';'.join(reversed(stack))] += 1
+
+    def stop(self):
+        self._stop.set()
+        self._sampler.join()
+
+    def dump(self, path):
+        with open(path, 'w', encoding='utf-8') as f:
+            for stack, count in self._stacks.most_common():
+                f.write(f'{stack} {count}\n')
+
+
+class RequestProfiler:
+    """决定是否分析请求、管理当前分析并写出结果
+
+    token 为空时不接受头部和查询参数触发；sample_rate 为 0 时不随机采样。
+    """
+
+    def __init__(self, directory, token=None, sample_rate=0.0, mode=MODE_CPROFILE,
+                 interval=0.005, max_files=50, max_bytes=100 * 1024 * 1024):
+        self.directory = os.path.abspath(directory)
+        self.token = token or None
+        self.sample_rate = sample_rate
+        self.mode = mode
+        self.interval = interval
+        self.max_files = max_files
+        self.max_bytes = max_bytes
+        # 同一时刻只允许一个分析，cProfile 也无法在多个线程中同时启用
+        self._busy = threading.Lock()
+        self._local = threading.local()
+
+    @property
+    def enabled(self):
+        return bool(self.token) or self.sample_rate > 0
+
+    def wanted(self, header_value=None, query_value=None):
+        """请求是否需要分析：令牌匹配或被随机采样选中"""
+        if self.token:
+            for value in (header_value, query_value):
+                if value and hmac.compare_digest(value.encode(), self.token.encode()):
+                    return True
+        return self.sample_rate > 0 and random.random() < self.sample_rate
+
+    def start(self, mode=None):
+        """开始分析当前线程，已有分析在进行时返回 None"""
+        if not self._busy.acquire(blocking=False):
+            return None
+        try:
+            mode = mode or self.mode
+            if mode == MODE_SAMPLE:
+                capture = _SamplingCapture(self.interval)
+            else:
+                capture = _CProfileCapture()
+            capture.start()
+        except Exception as e:
+            self._busy.release()
+            print(f"Error starting profiler: {str(e)}")
+            return None
+        capture.started = time.perf_counter()
+        self._local.capture = capture
+        return capture
+
+    def active(self):
+        """当前线程是否正在被分析"""
+        return getattr(self._local, 'capture', None) is not None
+
+    def stop(self, capture, route, ext='', size=None):
+        """结束分析并写出结果文件，返回文件路径；写入失败时返回 None"""
+        try:
+            capture.stop()
+            elapsed_ms = (time.perf_counter() - capture.started) * 1000
+        finally:
+            self._local.capture = None
+            self._busy.release()
+
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            suffix = '.collapsed' if isinstance(capture, _SamplingCapture) else '.prof'
+            path = os.path.join(self.directory, self._filename(route, ext, size, elapsed_ms) + suffix)
+            capture.dump(path)
+            self._rotate()
+            return path
+        except Exception as e:
+            print(f"Error writing profile: {str(e)}")
+            return None
+
+    @staticmethod
+    def _filename(route, ext, size, elapsed_ms):
+        """时间_路由_扩展名_请求大小_耗时_随机后缀，只保留文件名安全的字符"""
+        parts = [
+            time.strftime('%Y%m%dT%H%M%S'),
+            route or 'unknown',
+            (ext or 'none').lstrip('.'),
+            f'{size}B' if size is not None else 'unknownB',
+            f'{elapsed_ms:.0f}ms',
+            uuid.uuid4().hex[:8],
+        ]
+        return '_'.join(re.sub(r'[^A-Za-z0-9.-]+', '-', part) for part in parts)
+
+    def _rotate(self):
+        """按修改时间删除最旧的文件，直到数量和总大小都不超过上限"""
+        entries = []
+        for name in os.listdir(self.directory):
+            if not name.endswith(PROFILE_SUFFIXES):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+
+        entries.sort()
+        total = sum(size for _, size, _ in entries)
+        while entries and (len(entries) > self.max_files or total > self.max_bytes):
+            _, size, path = entries.pop(0)
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            total -= size
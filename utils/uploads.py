@@ -0,0 +1,203 @@
+"""可续传的分块上传：创建会话、按字节范围追加、完成后交给处理流程
+
+每个会话在 root/<upload_id>/ 下保存会话信息（session.json）和追加写入的数据文件，
+数据文件的当前大小就是已接收的偏移量，因此连接中断或服务重启后客户端查询偏移量即可从断点继续。
+单个分块仍受 MAX_CONTENT_LENGTH 限制，整个文件的大小只受 max_size 限制。
+"""
+import json
+import os
+import re
+import shutil
+import threading
+import time
+import uuid
+
+COPY_CHUNK_SIZE = 1024 * 1024
+_ID_PATTERN = re.compile(r'^[0-9a-f]{32}$')
+
+
+class UploadError(Exception):
+    """请求无效（如缺少字段、范围不合法）"""
+
+
+class UploadConflictError(UploadError):
+    """起始位置与已接收的偏移量不一致，或会话正被其他请求写入"""
+
+    def __init__(self, message, offset):
+        super().__init__(message)
+        self.offset = offset
+
+
+class UploadTooLargeError(UploadError):
+    """超过声明的文件大小或上传大小上限"""
+
+
+class UploadSession:
+    """一个上传会话；偏移量以数据文件的实际大小为准"""
+
+    def __init__(self, root, upload_id, filename, size, created):
+        self.id = upload_id
+        self.dir = os.path.join(root, upload_id)
+        self.filename = filename
+        self.size = size
+        self.created = created
+
+    @property
+    def data_path(self):
+        return os.path.join(self.dir, 'data')
+
+    @property
+    def offset(self):
+        try:
+            return os.path.getsize(self.data_path)
+        except OSError:
+            return 0
+
+    @property
+    def complete(self):
+        return self.size is not None and self.offset == self.size
+
+    def to_dict(self):
+        return {
+            'upload_id': self.id,
+            'filename': self.filename,
+            'size': self.size,
+            'offset': self.offset,
+            'complete': self.complete,
+            'created': self.created,
+        }
+
+
+class UploadManager:
+    """管理上传会话，超过 ttl 秒未写入的会话在创建新会话时清理"""
+
+    def __init__(self, root, max_size=4 * 1024 ** 3, ttl=24 * 3600):
+        self.root = os.path.abspath(root)
+        self.max_size = max_size
+        self.ttl = ttl
+        # 进程内每个会话同一时刻只允许一个写入请求
+        self._writing = set()
+        self._lock = threading.Lock()
+        os.makedirs(self.root, exist_ok=True)
+
+    def create(self, filename, size=None):
+        """创建会话，size 为文件总大小（未知时在完成时以已接收的字节数为准）"""
+        filename = os.path.basename(filename or '')
+        if not filename:
+            raise UploadError("缺少文件名")
+        if size is not None:
+            if size < 0:
+                raise UploadError("文件大小无效")
+            if size > self.max_size:
+                raise UploadTooLargeError(f"文件大小超过上限 {self.max_size} 字节")
+
+        self.purge_expired()
+        session = UploadSession(self.root, uuid.uuid4().hex, filename, size, time.time())
+        os.makedirs(session.dir)
+        open(session.data_path, 'wb').close()
+        with open(os.path.join(session.dir, 'session.json'), 'w', encoding='utf-8') as f:
+            json.dump({'filename': filename, 'size': size, 'created': session.created},
+                      f, ensure_ascii=False)
+        return session
+
+    def get(self, upload_id):
+        """按 ID 读取会话，不存在或 ID 格式不正确时返回 None"""
+        if not _ID_PATTERN.match(upload_id or ''):
+            return None
+        try:
+            with open(os.path.join(self.root, upload_id, 'session.json'), encoding='utf-8') as f:
+                info = json.load(f)
+        except (OSError, ValueError):
+            return None
+        return UploadSession(self.root, upload_id, info['filename'], info['size'], info['created'])
+
+    def append(self, session, start, stream, length=None, total=None):
+        """从 stream 读取最多 length 字节追加到 start 处，返回新的偏移量
+
+        start 必须等于当前偏移量；连接中途断开时已写入的部分会保留，客户端从新的偏移量继续。
+        """
+        if total is not None:
+            if session.size is None:
+                # 首个分块才声明总大小时补记到会话中
+                self._set_size(session, total)
+            elif total != session.size:
+                raise UploadError(f"总大小 {total} 与会话声明的 {session.size} 不一致")
+
+        with self._lock:
+            if session.id in self._writing:
+                raise UploadConflictError("该上传正被其他请求写入", session.offset)
+            self._writing.add(session.id)
+        try:
+            offset = session.offset
+            if start != offset:
+                raise UploadConflictError(f"起始位置 {start} 与已接收的 {offset} 字节不一致", offset)
+            limit = session.size if session.size is not None else self.max_size
+            if length is not None and offset + length > limit:
+                raise UploadTooLargeError("分块超出文件大小")
+
+            remaining = length
+            with open(session.data_path, 'ab') as f:
+                while remaining is None or remaining > 0:
+                    data = stream.read(COPY_CHUNK_SIZE if remaining is None
+                                       else min(COPY_CHUNK_SIZE, remaining))
+                    if not data:
+                        break
+                    if offset + len(data) > limit:
+                        raise UploadTooLargeError("分块超出文件大小")
+                    f.write(data)
+                    # 每块写入后刷新，连接中断时偏移量与已落盘的数据一致
+                    f.flush()
+                    offset += len(data)
+                    if remaining is not None:
+                        remaining -= len(data)
+            return offset
+        finally:
+            with self._lock:
+                self._writing.discard(session.id)
+
+    def _set_size(self, session, size):
+        if size > self.max_size:
+            raise UploadTooLargeError(f"文件大小超过上限 {self.max_size} 字节")
+        session.size = size
+        with open(os.path.join(session.dir, 'session.json'), 'w', encoding='utf-8') as f:
+            json.dump({'filename': session.filename, 'size': size, 'created': session.created},
+                      f, ensure_ascii=False)
+
+    def finish(self, session, dest_dir=None):
+        """确认已接收全部数据，把数据文件移动为 dest_dir 下的原文件名并返回路径
+
+        dest_dir 默认为会话目录下的 files/，处理器的输出文件也会写在这里，不会与会话自身的文件重名。
+        """
+        if session.size is None:
+            self._set_size(session, session.offset)
+        if not session.complete:
+            raise UploadConflictError(
+                f"上传未完成：已接收 {session.offset} / {session.size} 字节", session.offset
+            )
+        dest_dir = dest_dir or os.path.join(session.dir, 'files')
+        os.makedirs(dest_dir, exist_ok=True)
+        path = os.path.join(dest_dir, session.filename)
+        os.replace(session.data_path, path)
+        return path
+
+    def discard(self, session):
+        shutil.rmtree(session.dir, ignore_errors=True)
+
+    def purge_expired(self):
+        """删除超过 ttl 秒未修改的会话目录"""
+        deadline = time.time() - self.ttl
+        removed = 0
+        for name in os.listdir(self.root):
+            path = os.path.join(self.root, name)
+            if not _ID_PATTERN.match(name):
+                continue
+            try:
+                # 目录本身的修改时间覆盖刚创建、尚无文件的会话
+                modified = max([os.path.getmtime(path)] +
+                               [os.path.getmtime(os.path.join(path, entry)) for entry in os.listdir(path)])
+            except OSError:
+                continue
+            if modified < deadline:
+                shutil.rmtree(path, ignore_errors=True)
+                removed += 1
+        return removed
@@ -1,20 +1,67 @@
 from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from io import BytesIO
+import os
 import time
 import socket
+import tempfile
 from .crypto import WatermarkCrypto
+from ..metrics import METRICS
+from .. import zero_width
+
+_host_ip = None
+
+
+def host_ip():
+    """本机 IP，首次使用时解析并缓存；解析失败时返回回环地址且不缓存"""
+    global _host_ip
+    if _host_ip is None:
+        try:
+            _host_ip = socket.gethostbyname(socket.gethostname())
+        except OSError as e:
+            print(f"Error resolving host ip: {str(e)}")
+            return '127.0.0.1'
+    return _host_ip
+
+
+class EmbedResult:
+    """一次嵌入操作的结果：输出、嵌入位置、各阶段耗时（秒）、嵌入时间戳和水印指纹"""
+    __slots__ = ('output', 'locations', 'timings', 'timestamp', 'fingerprint')
+
+    def __init__(self, output, locations, timings, timestamp, fingerprint=None):
+        self.output = output
+        self.locations = locations
+        self.timings = timings
+        self.timestamp = timestamp
+        self.fingerprint = fingerprint
+
+    def __repr__(self):
+        return (f'EmbedResult(output={self.output!r}, locations={self.locations!r}, '
+                f'timings={self.timings!r}, timestamp={self.timestamp!r}, '
+                f'fingerprint={self.fingerprint!r})')
+
 
 class WatermarkBase(ABC):
+    # 非路径输入的处理结果先缓存在内存中，超过该大小后溢出到磁盘临时文件
+    SPOOL_MAX_SIZE = 8 * 1024 * 1024
+
+    # 处理器实例在多个线程间共享，实例属性只保存初始化后不再修改的配置；
+    # 嵌入位置、耗时等单次调用的数据都保存在局部变量中，通过 EmbedResult 返回
+
     def __init__(self):
-        self.timestamp = time.time()
-        self.ip = socket.gethostbyname(socket.gethostname())
         self.crypto = WatermarkCrypto()
+
+    @property
+    def ip(self):
+        # 主机名解析可能很慢，推迟到首次生成水印时进行
+        return host_ip()
     
     def generate_watermark(self, content, user_info, password):
         """生成水印信息"""
         watermark_data = {
             'content': content,
             'user': user_info,
-            'timestamp': self.timestamp,
+            'timestamp': time.time(),
             'ip': self.ip,
             'type': self.__class__.__name__
         }
@@ -35,11 +82,19 @@ class WatermarkBase(ABC):
         try:
             # 提取水印
             watermark_data = self.extract_watermark(file_path)
+        except Exception as e:
+            return False, f"水印验证失败: {str(e)}"
+        return self.verify_extracted(watermark_data, password)
+
+    def verify_extracted(self, watermark_data, password):
+        """验证已提取的水印数据，用于提取结果来自缓存的情况"""
+        try:
             if not watermark_data:
                 return False, "未找到水印"
             
             # 解密水印
-            decrypted_data = self.crypto.decrypt_data(watermark_data, password)
+            with self._timed(None, 'decrypt', 'verify'):
+                decrypted_data = self.crypto.decrypt_data(watermark_data, password)
             
             # 验证文件类型
             if decrypted_data.get('type') != self.__class__.__name__:
@@ -50,6 +105,67 @@ class WatermarkBase(ABC):
         except Exception as e:
             return False, f"水印验证失败: {str(e)}"
     
+    def _hide_in_property(self, text):
+        """将信息隐藏在属性值中"""
+        # 在前一半字符前插入零宽空格混淆数据
+        return zero_width.interleave(text)
+
+    def _reveal_from_property(self, text):
+        """从属性值中提取信息"""
+        return zero_width.strip(text)
+
+    @contextmanager
+    def _timed(self, timings, stage, operation='embed'):
+        """记录 with 块的耗时到 timings[stage]（timings 可为 None）和阶段耗时指标"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            if timings is not None:
+                timings[stage] = elapsed
+            METRICS.observe('watermark_stage_seconds', elapsed,
+                            handler=type(self).__name__, operation=operation, stage=stage)
+
+    @staticmethod
+    def _is_path(source):
+        return isinstance(source, (str, os.PathLike))
+
+    @staticmethod
+    def _as_input(source):
+        """bytes 包装为 BytesIO，文件对象回到开头，路径原样返回"""
+        if isinstance(source, (bytes, bytearray, memoryview)):
+            return BytesIO(source)
+        if hasattr(source, 'seek'):
+            source.seek(0)
+        return source
+
+    def _open_output(self, source):
+        """路径输入时返回同目录下的 processed_ 路径，否则返回按大小溢出的临时文件"""
+        if self._is_path(source):
+            return os.path.join(os.path.dirname(source),
+                                f'processed_{os.path.basename(source)}')
+        return tempfile.SpooledTemporaryFile(max_size=self.SPOOL_MAX_SIZE)
+
+    def _reset_output(self, output):
+        """回退到完整重写前丢弃已写入的部分输出"""
+        if self._is_path(output):
+            if os.path.exists(output):
+                os.remove(output)
+        else:
+            output.seek(0)
+            output.truncate()
+
+    def _finish_output(self, source, output):
+        """按输入类型返回结果：路径返回路径，bytes 返回 bytes，文件对象返回定位到开头的临时文件"""
+        if self._is_path(output):
+            return output
+        output.seek(0)
+        if isinstance(source, (bytes, bytearray, memoryview)):
+            with output:
+                return output.read()
+        return output
+
     @abstractmethod
     def embed_watermark(self, file_path, watermark_data):
         """嵌入水印"""
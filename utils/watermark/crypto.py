@@ -6,9 +6,13 @@ import base64
 import os
 import json
 import zlib
+from .key_cache import derived_key_cache
+from ..metrics import METRICS
+from .. import zero_width
 
 class WatermarkCrypto:
     def __init__(self):
+        # 与 utils.zero_width.OCTAL_ALPHABET 一致
         self.ZERO_WIDTH_CHARS = {
             '0': '\u200b',  # 零宽空格
             '1': '\u200c',  # 零宽非连接符
@@ -21,6 +25,8 @@ class WatermarkCrypto:
         }
         self.SALT_LENGTH = 16
         self.IV_LENGTH = 16
+        self.KDF_ITERATIONS = 100000
+        self.key_cache = derived_key_cache
 
     def _calculate_checksum(self, data):
         """计算校验和"""
@@ -88,34 +94,37 @@ class WatermarkCrypto:
             raise ValueError(f"解密失败: {str(e)}")
 
     def generate_key(self, password, salt=None):
-        """生成加密密钥"""
+        """生成加密密钥，已知盐时优先使用派生密钥缓存"""
         if salt is None:
+            # 新生成的盐不会再次出现，无需缓存
             salt = os.urandom(self.SALT_LENGTH)
+            return base64.urlsafe_b64encode(self._derive_key(password, salt)), salt
         
+        derived = self.key_cache.get_or_derive(
+            password, salt, self.KDF_ITERATIONS,
+            lambda: self._derive_key(password, salt)
+        )
+        return base64.urlsafe_b64encode(derived), salt
+
+    def _derive_key(self, password, salt):
+        """执行 PBKDF2 密钥派生"""
         kdf = PBKDF2HMAC(
             algorithm=hashes.SHA256(),
             length=32,
             salt=salt,
-            iterations=100000,
+            iterations=self.KDF_ITERATIONS,
         )
-        key = base64.urlsafe_b64encode(kdf.derive(password.encode()))
-        return key, salt
+        with METRICS.timer('watermark_kdf_seconds'):
+            return kdf.derive(password.encode())
 
     def encode_to_zero_width(self, data):
         """将数据编码为零宽字符"""
         try:
             # 1. 将数据转换为base64
-            base64_data = base64.b64encode(json.dumps(data).encode()).decode()
-            
-            # 2. 转换为8进制字符串
-            oct_str = ''.join(format(ord(c), '08o') for c in base64_data)
-            
-            # 3. 使用零宽字符编码
-            result = ''
-            for digit in oct_str:
-                result += self.ZERO_WIDTH_CHARS[digit]
+            base64_data = base64.b64encode(json.dumps(data).encode())
             
-            return result
+            # 2. 每个字节按8位八进制查表转换为零宽字符
+            return zero_width.encode_octal(base64_data)
         except Exception as e:
             print(f"Encoding error: {str(e)}")
             raise
@@ -124,30 +133,16 @@ class WatermarkCrypto:
         """从零宽字符解码数据"""
         try:
             # 1. 提取零宽字符
-            zero_width_chars = []
-            reverse_map = {v: k for k, v in self.ZERO_WIDTH_CHARS.items()}
-            
-            for char in text:
-                if char in reverse_map:
-                    zero_width_chars.append(reverse_map[char])
-            
-            if not zero_width_chars:
+            if not zero_width.count_octal(text):
                 return None
             
-            # 2. 转换回8进制字符串
-            oct_str = ''.join(zero_width_chars)
-            
-            # 3. 转换为原始字符串
-            base64_data = ''
-            for i in range(0, len(oct_str), 8):
-                oct_group = oct_str[i:i+8]
-                if len(oct_group) == 8:
-                    base64_data += chr(int(oct_group, 8))
+            # 2. 按8位八进制分组还原为base64数据
+            base64_data = zero_width.decode_octal(text)
             
-            # 4. 解码base64数据
+            # 3. 解码base64数据
             decoded_data = base64.b64decode(base64_data).decode()
             return json.loads(decoded_data)
             
         except Exception as e:
             print(f"Decoding error: {str(e)}")
-            return None 
\ No newline at end of file
+            return None
\ No newline at end of file
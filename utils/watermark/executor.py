@@ -0,0 +1,317 @@
+"""在常驻进程池中执行水印处理，避免大文件解析占用请求线程的 GIL
+
+每个工作进程通过独立的 Pipe 接收任务，同一时刻只处理一个任务：
+任务超时时直接终止该进程，处理达到 max_tasks 次后回收重建以限制内存增长。
+"""
+import io
+import multiprocessing
+import os
+import queue
+import shutil
+import tempfile
+import threading
+from io import BytesIO
+from .handlers import HandlerRegistry
+from ..metrics import METRICS
+
+
+class WatermarkTaskError(Exception):
+    """工作进程异常退出或无法返回结果"""
+
+
+class WatermarkTimeoutError(WatermarkTaskError):
+    """任务超过时限，执行它的工作进程已被终止"""
+
+
+def _worker_main(conn, handler_specs):
+    """工作进程主循环：预先导入并创建处理器，逐个执行 (扩展名, 方法名, 参数) 任务
+
+    每个结果附带本次任务期间记录的指标增量，由父进程合并。
+    """
+    handlers = HandlerRegistry(handler_specs).preload()
+    while True:
+        try:
+            task = conn.recv()
+        except (EOFError, OSError):
+            break
+        if task is None:
+            break
+
+        ext, method, args, kwargs = task
+        try:
+            result = (True, getattr(handlers[ext], method)(*args, **kwargs))
+        except Exception as e:
+            result = (False, e)
+
+        metrics = METRICS.drain()
+        try:
+            conn.send(result + (metrics,))
+        except Exception as e:
+            # 结果或异常无法序列化时只返回错误描述
+            conn.send((False, WatermarkTaskError(f"无法返回处理结果: {str(e)}"), metrics))
+    conn.close()
+
+
+class _Worker:
+    """一个工作进程及其任务管道"""
+
+    def __init__(self, context, handler_specs):
+        self.conn, child_conn = context.Pipe()
+        self.process = context.Process(target=_worker_main,
+                                       args=(child_conn, handler_specs),
+                                       daemon=True)
+        self.process.start()
+        child_conn.close()
+        self.tasks = 0
+
+    def run(self, task, timeout):
+        self.tasks += 1
+        self.conn.send(task)
+        if not self.conn.poll(timeout):
+            raise WatermarkTimeoutError(f"任务超过 {timeout} 秒未完成")
+        return self.conn.recv()
+
+    def stop(self, timeout=5):
+        """通知进程退出，超时后强制终止"""
+        try:
+            self.conn.send(None)
+        except (OSError, ValueError):
+            pass
+        self.process.join(timeout)
+        self.kill()
+
+    def kill(self):
+        if self.process.is_alive():
+            self.process.kill()
+            self.process.join()
+        self.conn.close()
+
+
+class WatermarkExecutor:
+    """按需启动的常驻进程池，工作进程数不超过 size
+
+    handler_specs 与 handlers.HANDLER_SPECS 格式相同，每个工作进程启动时导入并各创建一个实例，
+    父进程无需导入任何文档处理库。
+    """
+
+    def __init__(self, handler_specs, size=None, timeout=60, max_tasks=200):
+        self.handler_specs = dict(handler_specs)
+        self.size = size or os.cpu_count() or 1
+        self.timeout = timeout
+        self.max_tasks = max_tasks
+        # spawn 避免在已启动线程的 Flask 进程中 fork
+        self._context = multiprocessing.get_context('spawn')
+        self._idle = queue.LifoQueue()
+        self._started = 0
+        self._lock = threading.Lock()
+        self._closed = False
+
+    def start(self):
+        """预先启动全部工作进程"""
+        workers = []
+        with self._lock:
+            while self._started < self.size:
+                workers.append(_Worker(self._context, self.handler_specs))
+                self._started += 1
+        for worker in workers:
+            self._idle.put(worker)
+
+    def _checkout(self):
+        # 优先复用空闲进程，不足 size 个时再启动新进程，否则等待其他任务归还
+        while True:
+            try:
+                return self._idle.get_nowait()
+            except queue.Empty:
+                pass
+            with self._lock:
+                if self._closed:
+                    raise WatermarkTaskError("进程池已关闭")
+                spawn = self._started < self.size
+                if spawn:
+                    self._started += 1
+            if spawn:
+                try:
+                    return _Worker(self._context, self.handler_specs)
+                except Exception:
+                    with self._lock:
+                        self._started -= 1
+                    raise
+            try:
+                # 定期醒来重新检查，避免替代进程启动失败后一直等待
+                return self._idle.get(timeout=1)
+            except queue.Empty:
+                continue
+
+    def _checkin(self, worker, healthy):
+        if healthy and not self._closed and worker.tasks < self.max_tasks:
+            self._idle.put(worker)
+            return
+        # 超时、异常退出或达到任务上限的进程不再复用，在后台停止并启动替代进程
+        threading.Thread(target=self._replace, args=(worker, healthy), daemon=True).start()
+
+    def _replace(self, worker, healthy):
+        if healthy:
+            worker.stop()
+        else:
+            worker.kill()
+        
+        replacement = None
+        if not self._closed:
+            try:
+                replacement = _Worker(self._context, self.handler_specs)
+            except Exception as e:
+                print(f"Error starting watermark worker: {str(e)}")
+        
+        if replacement is not None and not self._closed:
+            self._idle.put(replacement)
+            return
+        if replacement is not None:
+            replacement.stop()
+        with self._lock:
+            self._started -= 1
+
+    def call(self, ext, method, *args, **kwargs):
+        """在工作进程中执行 handler.method(*args, **kwargs) 并返回结果"""
+        if ext not in self.handler_specs:
+            raise ValueError(f"不支持的文件类型: {ext}")
+
+        worker = self._checkout()
+        healthy = False
+        try:
+            ok, result, metrics = worker.run((ext, method, args, kwargs), self.timeout)
+            healthy = True
+        except WatermarkTaskError:
+            raise
+        except (EOFError, OSError) as e:
+            raise WatermarkTaskError(f"工作进程异常退出: {str(e)}")
+        finally:
+            self._checkin(worker, healthy)
+
+        METRICS.merge(metrics)
+        if not ok:
+            raise result
+        return result
+
+    def handlers(self):
+        """返回与 WATERMARK_HANDLERS 接口一致的代理字典"""
+        return {ext: PooledHandler(self, ext) for ext in self.handler_specs}
+
+    def shutdown(self):
+        """停止所有空闲进程；执行中的进程在归还时停止"""
+        with self._lock:
+            self._closed = True
+        while True:
+            try:
+                worker = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            worker.stop()
+            with self._lock:
+                self._started -= 1
+
+
+COPY_CHUNK_SIZE = 1024 * 1024
+
+
+class _SpilledOutput(io.FileIO):
+    """工作进程写到临时路径的输出文件，关闭时删除"""
+
+    def close(self):
+        try:
+            super().close()
+        finally:
+            try:
+                os.remove(self.name)
+            except OSError:
+                pass
+
+
+def _on_disk(source):
+    """文件对象的数据是否已在磁盘上：上传缓存对象自行报告（on_disk），其他对象以 name 是否为实际文件为准"""
+    on_disk = getattr(source, 'on_disk', None)
+    if isinstance(on_disk, bool):
+        return on_disk
+    name = getattr(source, 'name', None)
+    return isinstance(name, str) and os.path.isfile(name)
+
+
+def _portable(source, suffix=''):
+    """把输入转换为可跨进程传递的形式，返回 (输入, 类型)
+
+    类型为 'path'（调用方传入的路径）、'bytes'、'memory'（内存中的文件对象，以 bytes 传递）
+    或 'spilled'（磁盘上的文件对象，分块复制到临时路径后传递路径，调用方负责删除）。
+    """
+    if isinstance(source, (str, os.PathLike)):
+        # 工作进程的当前目录可能不同，传递绝对路径
+        return os.path.abspath(source), 'path'
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return bytes(source), 'bytes'
+    source.seek(0)
+    if not _on_disk(source):
+        return source.read(), 'memory'
+
+    # 大文件不读入内存再序列化，复制到临时文件后只传递路径
+    fd, path = tempfile.mkstemp(suffix=suffix, prefix='watermark_')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            shutil.copyfileobj(source, f, COPY_CHUNK_SIZE)
+    except Exception:
+        os.remove(path)
+        raise
+    finally:
+        source.seek(0)
+    return path, 'spilled'
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+class PooledHandler:
+    """把处理器方法转发到进程池执行的代理，输入输出约定与处理器本身一致"""
+
+    def __init__(self, executor, ext):
+        self._executor = executor
+        self._ext = ext
+
+    def embed_watermark(self, file_path, watermark_data, password, **kwargs):
+        source, kind = _portable(file_path, self._ext)
+        try:
+            result = self._executor.call(self._ext, 'embed_watermark',
+                                         source, watermark_data, password, **kwargs)
+        except Exception:
+            if kind == 'spilled':
+                # 处理器对路径输入写出 processed_ 文件，失败时可能留下部分输出
+                _remove(os.path.join(os.path.dirname(source), f'processed_{os.path.basename(source)}'))
+            raise
+        finally:
+            if kind == 'spilled':
+                _remove(source)
+        if kind == 'memory':
+            result.output = BytesIO(result.output)
+        elif kind == 'spilled':
+            # 输出由工作进程写到临时路径，以文件对象返回，关闭后删除
+            result.output = _SpilledOutput(result.output)
+        return result
+
+    def extract_watermark(self, file_path, **kwargs):
+        source, kind = _portable(file_path, self._ext)
+        try:
+            return self._executor.call(self._ext, 'extract_watermark', source, **kwargs)
+        finally:
+            if kind == 'spilled':
+                _remove(source)
+
+    def verify_watermark(self, file_path, password):
+        source, kind = _portable(file_path, self._ext)
+        try:
+            return self._executor.call(self._ext, 'verify_watermark', source, password)
+        finally:
+            if kind == 'spilled':
+                _remove(source)
+
+    def verify_extracted(self, watermark_data, password):
+        return self._executor.call(self._ext, 'verify_extracted', watermark_data, password)
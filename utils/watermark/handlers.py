@@ -0,0 +1,138 @@
+"""按扩展名延迟导入并创建水印处理器
+
+python-docx、python-pptx、PyPDF2、reportlab 和 cryptography 的导入开销都较大，
+注册表只记录模块名和类名，某个格式第一次被使用时才导入对应模块并创建处理器。
+"""
+import importlib
+import threading
+import time
+from collections.abc import Mapping
+from ..metrics import METRICS, payload_size
+
+# 扩展名 -> (相对于 utils.watermark 的模块名, 处理器类名)
+HANDLER_SPECS = {
+    '.docx': ('.word', 'WordWatermark'),
+    '.pptx': ('.ppt', 'PPTWatermark'),
+    '.pdf': ('.pdf', 'PDFWatermark'),
+}
+
+_PACKAGE = __name__.rpartition('.')[0]
+
+
+def load_handler_class(spec):
+    """导入 (模块名, 类名) 对应的处理器类"""
+    module_name, class_name = spec
+    module = importlib.import_module(module_name, _PACKAGE)
+    return getattr(module, class_name)
+
+
+class HandlerRegistry(Mapping):
+    """只读的 {扩展名: 处理器实例} 映射，处理器在首次访问时创建并缓存
+
+    判断扩展名是否受支持（in、keys、len）不会触发任何导入。
+    """
+
+    def __init__(self, specs=None):
+        self._specs = dict(HANDLER_SPECS if specs is None else specs)
+        self._handlers = {}
+        self._lock = threading.Lock()
+
+    def __getitem__(self, ext):
+        handler = self._handlers.get(ext)
+        if handler is not None:
+            return handler
+        spec = self._specs[ext]
+        with self._lock:
+            # 其他线程可能已在等待锁期间完成创建
+            handler = self._handlers.get(ext)
+            if handler is None:
+                handler = load_handler_class(spec)()
+                self._handlers[ext] = handler
+        return handler
+
+    def __contains__(self, ext):
+        return ext in self._specs
+
+    def __iter__(self):
+        return iter(self._specs)
+
+    def __len__(self):
+        return len(self._specs)
+
+    def loaded(self):
+        """已创建处理器的扩展名"""
+        return list(self._handlers)
+
+    def preload(self):
+        """立即导入并创建全部处理器（如进程池预热时）"""
+        for ext in self._specs:
+            self[ext]
+        return self
+
+
+class MeteredHandler:
+    """记录操作耗时、结果和输入输出字节数的处理器代理，接口与处理器一致"""
+
+    def __init__(self, handler, ext):
+        self._handler = handler
+        self._ext = ext
+
+    def _call(self, operation, method, source, *args, **kwargs):
+        size = payload_size(source)
+        if size is not None:
+            METRICS.inc('watermark_bytes_in_total', size, ext=self._ext, operation=operation)
+            METRICS.observe('watermark_input_bytes', size, ext=self._ext, operation=operation)
+        
+        outcome = 'error'
+        start = time.perf_counter()
+        try:
+            result = getattr(self._handler, method)(source, *args, **kwargs)
+            if operation == 'extract':
+                outcome = 'ok' if result else 'not_found'
+            elif operation == 'verify':
+                outcome = 'ok' if result[0] else 'failed'
+            else:
+                outcome = 'ok'
+            return result
+        finally:
+            METRICS.observe('watermark_operation_seconds', time.perf_counter() - start,
+                            ext=self._ext, operation=operation, outcome=outcome)
+
+    def embed_watermark(self, file_path, watermark_data, password, **kwargs):
+        result = self._call('embed', 'embed_watermark', file_path, watermark_data, password, **kwargs)
+        size = payload_size(result.output)
+        if size is not None:
+            METRICS.inc('watermark_bytes_out_total', size, ext=self._ext)
+        return result
+
+    def extract_watermark(self, file_path, **kwargs):
+        return self._call('extract', 'extract_watermark', file_path, **kwargs)
+
+    def verify_watermark(self, file_path, password):
+        return self._call('verify', 'verify_watermark', file_path, password)
+
+    def verify_extracted(self, watermark_data, password):
+        return self._call('verify', 'verify_extracted', watermark_data, password)
+
+
+class MeteredHandlers(Mapping):
+    """为 {扩展名: 处理器} 映射中的处理器加上指标记录，判断是否支持某扩展名时不创建处理器"""
+
+    def __init__(self, handlers):
+        self._handlers = handlers
+        self._metered = {}
+
+    def __getitem__(self, ext):
+        metered = self._metered.get(ext)
+        if metered is None:
+            metered = self._metered.setdefault(ext, MeteredHandler(self._handlers[ext], ext))
+        return metered
+
+    def __contains__(self, ext):
+        return ext in self._handlers
+
+    def __iter__(self):
+        return iter(self._handlers)
+
+    def __len__(self):
+        return len(self._handlers)
@@ -0,0 +1,99 @@
+import hashlib
+import hmac
+import os
+import threading
+import time
+from collections import OrderedDict
+from ..metrics import METRICS
+
+
+class DerivedKeyCache:
+    """PBKDF2 派生密钥的进程内缓存，线程安全，按容量 LRU 淘汰并带过期时间"""
+
+    def __init__(self, max_entries=256, ttl=600):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        # 进程内随机密钥，缓存键中不出现口令本身或其可离线穷举的普通摘要
+        self._pepper = os.urandom(32)
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get_or_derive(self, password, salt, iterations, derive):
+        """命中则直接返回缓存的密钥，否则调用 derive() 派生并写入缓存"""
+        cache_key = self._cache_key(password, salt, iterations)
+        now = time.monotonic()
+
+        with self._lock:
+            entry = self._entries.get(cache_key)
+            if entry is not None:
+                value, expires_at = entry
+                if expires_at > now:
+                    self._entries.move_to_end(cache_key)
+                    self.hits += 1
+                    METRICS.inc('watermark_key_cache_total', result='hit')
+                    return bytes(value)
+                self._evict(cache_key)
+            self.misses += 1
+        METRICS.inc('watermark_key_cache_total', result='miss')
+
+        # 在锁外执行耗时的密钥派生，避免阻塞其他线程
+        derived = bytes(derive())
+
+        with self._lock:
+            old = self._entries.pop(cache_key, None)
+            if old is not None:
+                self._zeroize(old[0])
+            self._entries[cache_key] = (bytearray(derived), time.monotonic() + self.ttl)
+            while len(self._entries) > self.max_entries:
+                self._evict(next(iter(self._entries)))
+
+        return derived
+
+    def purge_expired(self):
+        """清理所有已过期的条目"""
+        now = time.monotonic()
+        with self._lock:
+            expired = [k for k, (_, expires_at) in self._entries.items() if expires_at <= now]
+            for cache_key in expired:
+                self._evict(cache_key)
+        return len(expired)
+
+    def clear(self):
+        """清空缓存并擦除所有密钥"""
+        with self._lock:
+            for value, _ in self._entries.values():
+                self._zeroize(value)
+            self._entries.clear()
+
+    def stats(self):
+        """返回命中、未命中、淘汰次数及当前条目数"""
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'size': len(self._entries),
+            }
+
+    def _cache_key(self, password, salt, iterations):
+        if isinstance(password, str):
+            password = password.encode()
+        digest = hmac.new(self._pepper, password, hashlib.sha256).digest()
+        return digest, bytes(salt), iterations
+
+    def _evict(self, cache_key):
+        value, _ = self._entries.pop(cache_key)
+        self._zeroize(value)
+        self.evictions += 1
+
+    @staticmethod
+    def _zeroize(value):
+        # 尽力擦除缓存中保存的副本；已返回给调用方的 bytes 无法擦除
+        value[:] = bytes(len(value))
+
+
+# 所有 WatermarkCrypto 实例共享的缓存
+derived_key_cache = DerivedKeyCache()
@@ -0,0 +1,347 @@
+"""OOXML 包补丁器
+
+只解析和重写需要修改的部件，其余 ZIP 成员按原始压缩字节原样复制，
+不解压也不重新压缩，耗时只取决于被修改部件的大小。
+"""
+import os
+import posixpath
+import struct
+import time
+import zipfile
+import zlib
+from lxml import etree
+
+CONTENT_TYPES_NS = 'http://schemas.openxmlformats.org/package/2006/content-types'
+RELATIONSHIPS_NS = 'http://schemas.openxmlformats.org/package/2006/relationships'
+RT_OFFICE_DOCUMENT = 'http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument'
+CT_RELATIONSHIPS = 'application/vnd.openxmlformats-package.relationships+xml'
+
+_CONTENT_TYPES_PART = '/[Content_Types].xml'
+_COPY_CHUNK = 1024 * 1024
+_ZIP32_LIMIT = 0xFFFFFFFF
+
+_LOCAL_HEADER = struct.Struct('<4s5H3L2H')
+_CENTRAL_HEADER = struct.Struct('<4s6H3L5H2L')
+_END_RECORD = struct.Struct('<4s4H2LH')
+
+# 与 python-docx / python-pptx 序列化部件时使用的解析和输出方式保持一致
+_parser = etree.XMLParser(remove_blank_text=True, resolve_entities=False)
+
+
+class OOXMLPatchError(Exception):
+    """包结构不受补丁器支持（如 ZIP64、加密成员），调用方应回退到完整解析路径"""
+
+
+def serialize_xml(element):
+    """按 python-docx 的方式序列化 XML 部件"""
+    return etree.tostring(element, encoding='UTF-8', standalone=True)
+
+
+class OOXMLPatcher:
+    def __init__(self, source):
+        """打开 OOXML 包，source 可以是路径或可随机访问的二进制文件对象"""
+        if isinstance(source, (str, os.PathLike)):
+            self._fp = open(source, 'rb')
+            self._owns_fp = True
+        else:
+            self._fp = source
+            self._owns_fp = False
+
+        try:
+            self._zip = zipfile.ZipFile(self._fp)
+        except zipfile.BadZipFile as e:
+            self.close()
+            raise OOXMLPatchError(f"不是有效的 OOXML 包: {str(e)}")
+
+        self._infos = self._zip.infolist()
+        if len(self._infos) >= 0xFFFF:
+            self.close()
+            raise OOXMLPatchError("成员数量需要 ZIP64")
+        for info in self._infos:
+            if info.flag_bits & 0x1:
+                self.close()
+                raise OOXMLPatchError(f"成员已加密: {info.filename}")
+            if max(info.file_size, info.compress_size, info.header_offset) >= _ZIP32_LIMIT:
+                self.close()
+                raise OOXMLPatchError(f"成员需要 ZIP64: {info.filename}")
+
+        self._names = {info.filename for info in self._infos}
+        self._modified = {}
+        self._xml_cache = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        """关闭源文件"""
+        if self._owns_fp and self._fp:
+            self._fp.close()
+        self._fp = None
+
+    # ---- 部件读写 ----
+
+    @staticmethod
+    def _member(partname):
+        return partname.lstrip('/')
+
+    def exists(self, partname):
+        """判断部件是否存在"""
+        member = self._member(partname)
+        return member in self._modified or member in self._names
+
+    def partnames(self):
+        """返回所有部件名（以 / 开头）"""
+        names = [info.filename for info in self._infos if not info.filename.endswith('/')]
+        names += [name for name in self._modified if name not in self._names]
+        return ['/' + name for name in names]
+
+    def read(self, partname):
+        """读取部件内容"""
+        member = self._member(partname)
+        if member in self._modified:
+            return self._modified[member]
+        if member not in self._names:
+            raise KeyError(partname)
+        return self._zip.read(member)
+
+    def write(self, partname, data):
+        """替换或新增部件"""
+        member = self._member(partname)
+        self._modified[member] = data
+        self._xml_cache.pop(member, None)
+
+    def parse_xml(self, partname):
+        """解析 XML 部件，修改后需调用 write_xml 才会写回"""
+        member = self._member(partname)
+        if member not in self._xml_cache:
+            self._xml_cache[member] = etree.fromstring(self.read(partname), _parser)
+        return self._xml_cache[member]
+
+    def write_xml(self, partname, element):
+        """序列化并写回 XML 部件"""
+        self.write(partname, serialize_xml(element))
+        self._xml_cache[self._member(partname)] = element
+
+    # ---- 关系 ----
+
+    @staticmethod
+    def rels_partname(partname):
+        """返回部件对应的关系部件名，包级关系使用 '/'"""
+        directory, filename = posixpath.split(partname)
+        return posixpath.join(directory, '_rels', f'{filename}.rels')
+
+    def _rels_root(self, source):
+        rels_name = self.rels_partname(source)
+        if self.exists(rels_name):
+            return self.parse_xml(rels_name)
+        root = etree.Element(f'{{{RELATIONSHIPS_NS}}}Relationships', nsmap={None: RELATIONSHIPS_NS})
+        self._xml_cache[self._member(rels_name)] = root
+        return root
+
+    def related_partnames(self, source, reltype):
+        """返回 source 部件中指定类型关系指向的部件名（按关系顺序）"""
+        base = posixpath.dirname(source)
+        targets = []
+        for rel in self._rels_root(source):
+            if rel.get('Type') == reltype and rel.get('TargetMode') != 'External':
+                targets.append(posixpath.normpath(posixpath.join(base, rel.get('Target'))))
+        return targets
+
+    def relationship_targets(self, source):
+        """返回 source 部件中 rId 到目标部件名的映射（不含外部链接）"""
+        base = posixpath.dirname(source)
+        return {
+            rel.get('Id'): posixpath.normpath(posixpath.join(base, rel.get('Target')))
+            for rel in self._rels_root(source)
+            if rel.get('TargetMode') != 'External'
+        }
+
+    def add_relationship(self, source, reltype, target):
+        """在 source 部件中新增指向 target 的关系并返回 rId"""
+        root = self._rels_root(source)
+        used = {rel.get('Id') for rel in root}
+        # 与 python-docx 相同：取第一个未使用的 rIdN
+        for n in range(1, len(used) + 2):
+            rel_id = f'rId{n}'
+            if rel_id not in used:
+                break
+
+        rel = etree.SubElement(root, f'{{{RELATIONSHIPS_NS}}}Relationship')
+        rel.set('Id', rel_id)
+        rel.set('Type', reltype)
+        rel.set('Target', posixpath.relpath(target, posixpath.dirname(source)))
+
+        self.write_xml(self.rels_partname(source), root)
+        self.ensure_content_type(self.rels_partname(source), CT_RELATIONSHIPS)
+        return rel_id
+
+    def main_document_partname(self):
+        """返回包的主文档部件名"""
+        targets = self.related_partnames('/', RT_OFFICE_DOCUMENT)
+        if not targets:
+            raise OOXMLPatchError("未找到主文档部件")
+        return targets[0]
+
+    # ---- 内容类型 ----
+
+    def ensure_content_type(self, partname, content_type):
+        """确保部件声明了指定的内容类型"""
+        root = self.parse_xml(_CONTENT_TYPES_PART)
+        ext = posixpath.splitext(partname)[1][1:].lower()
+
+        for override in root.iterfind(f'{{{CONTENT_TYPES_NS}}}Override'):
+            if override.get('PartName', '').lower() == partname.lower():
+                if override.get('ContentType') != content_type:
+                    override.set('ContentType', content_type)
+                    self.write_xml(_CONTENT_TYPES_PART, root)
+                return
+        for default in root.iterfind(f'{{{CONTENT_TYPES_NS}}}Default'):
+            if default.get('Extension', '').lower() == ext and default.get('ContentType') == content_type:
+                return
+
+        override = etree.SubElement(root, f'{{{CONTENT_TYPES_NS}}}Override')
+        override.set('PartName', partname)
+        override.set('ContentType', content_type)
+        self.write_xml(_CONTENT_TYPES_PART, root)
+
+    def next_partname(self, template):
+        """按模板（如 '/customXml/item%d.xml'）返回第一个未被使用的部件名"""
+        n = 1
+        while self.exists(template % n):
+            n += 1
+        return template % n
+
+    # ---- 保存 ----
+
+    def save(self, dest):
+        """写出补丁后的包，dest 可以是路径或可写的二进制文件对象"""
+        if isinstance(dest, (str, os.PathLike)):
+            with open(dest, 'wb') as out:
+                try:
+                    self._write_package(out)
+                except Exception:
+                    out.close()
+                    os.remove(dest)
+                    raise
+        else:
+            self._write_package(dest)
+
+    def _write_package(self, out):
+        writer = _ZipWriter(out)
+        for info in self._infos:
+            if info.filename in self._modified:
+                writer.add_bytes(info.filename, self._modified[info.filename], info)
+            else:
+                writer.copy_raw(self._fp, info)
+        for name, data in self._modified.items():
+            if name not in self._names:
+                writer.add_bytes(name, data)
+        writer.finish()
+
+
+class _ZipWriter:
+    """最小化的 ZIP 写入器，支持按原始压缩字节复制成员"""
+
+    def __init__(self, out):
+        self._out = out
+        self._offset = 0
+        self._central = []
+
+    def _write(self, data):
+        self._out.write(data)
+        self._offset += len(data)
+        if self._offset >= _ZIP32_LIMIT:
+            raise OOXMLPatchError("输出大小需要 ZIP64")
+
+    @staticmethod
+    def _encode_name(name, flags):
+        if flags & 0x800:
+            return name.encode('utf-8'), flags
+        try:
+            return name.encode('ascii'), flags
+        except UnicodeEncodeError:
+            return name.encode('utf-8'), flags | 0x800
+
+    @staticmethod
+    def _dos_time(date_time):
+        year, month, day, hour, minute, second = date_time
+        dosdate = (max(year, 1980) - 1980) << 9 | month << 5 | day
+        dostime = hour << 11 | minute << 5 | second // 2
+        return dostime, dosdate
+
+    def _add_entry(self, name, flags, method, date_time, crc, compress_size, file_size,
+                   external_attr, create_version, write_data):
+        # 不使用数据描述符，CRC 和大小直接写入本地文件头
+        flags &= ~0x08
+        name_bytes, flags = self._encode_name(name, flags)
+        dostime, dosdate = self._dos_time(date_time)
+        header_offset = self._offset
+
+        self._write(_LOCAL_HEADER.pack(
+            b'PK\x03\x04', 20, flags, method, dostime, dosdate,
+            crc, compress_size, file_size, len(name_bytes), 0
+        ))
+        self._write(name_bytes)
+        write_data()
+
+        self._central.append(_CENTRAL_HEADER.pack(
+            b'PK\x01\x02', create_version, 20, flags, method, dostime, dosdate,
+            crc, compress_size, file_size, len(name_bytes), 0, 0, 0, 0,
+            external_attr, header_offset
+        ) + name_bytes)
+
+    def copy_raw(self, fp, info):
+        """复制成员的原始压缩数据"""
+        fp.seek(info.header_offset)
+        header = fp.read(30)
+        if len(header) < 30 or header[:4] != b'PK\x03\x04':
+            raise OOXMLPatchError(f"本地文件头损坏: {info.filename}")
+        name_len, extra_len = struct.unpack('<HH', header[26:30])
+        fp.seek(info.header_offset + 30 + name_len + extra_len)
+
+        def write_data():
+            remaining = info.compress_size
+            while remaining:
+                chunk = fp.read(min(_COPY_CHUNK, remaining))
+                if not chunk:
+                    raise OOXMLPatchError(f"成员数据不完整: {info.filename}")
+                self._write(chunk)
+                remaining -= len(chunk)
+
+        self._add_entry(
+            info.filename, info.flag_bits, info.compress_type, info.date_time,
+            info.CRC, info.compress_size, info.file_size, info.external_attr,
+            info.create_system << 8 | info.create_version, write_data
+        )
+
+    def add_bytes(self, name, data, info=None):
+        """以 deflate 压缩写入新的成员数据，info 为被替换的原成员"""
+        compressor = zlib.compressobj(6, zlib.DEFLATED, -15)
+        compressed = compressor.compress(data) + compressor.flush()
+        if info is not None:
+            flags = info.flag_bits & 0x800
+            date_time, external_attr = info.date_time, info.external_attr
+            create_version = info.create_system << 8 | info.create_version
+        else:
+            flags = 0
+            date_time, external_attr = time.localtime()[:6], 0o600 << 16
+            create_version = 3 << 8 | 20
+
+        self._add_entry(
+            name, flags, zipfile.ZIP_DEFLATED, date_time, zlib.crc32(data),
+            len(compressed), len(data), external_attr, create_version,
+            lambda: self._write(compressed)
+        )
+
+    def finish(self):
+        """写出中央目录和结束记录"""
+        central_offset = self._offset
+        for record in self._central:
+            self._write(record)
+        self._write(_END_RECORD.pack(
+            b'PK\x05\x06', 0, 0, len(self._central), len(self._central),
+            self._offset - central_offset, central_offset, 0
+        ))
@@ -2,59 +2,270 @@ from PyPDF2 import PdfReader, PdfWriter
 from reportlab.pdfgen import canvas
 from reportlab.lib.colors import Color
 from io import BytesIO
-from .base import WatermarkBase
+from .base import WatermarkBase, EmbedResult
+from .registry import fingerprint
 import random
 import json
-import hashlib
+import mmap
 import os
-from PyPDF2.generic import DecodedStreamObject, EncodedStreamObject, NameObject, createStringObject, ArrayObject, DictionaryObject
+import shutil
+import time
+from contextlib import ExitStack
+from PyPDF2.generic import DecodedStreamObject, EncodedStreamObject, NameObject, createStringObject, ArrayObject, DictionaryObject, IndirectObject, NumberObject
+
+class IncrementalUpdateError(Exception):
+    """文档不适合增量更新（如已加密、交叉引用表无法定位），调用方应回退到完整重写"""
 
 class PDFWatermark(WatermarkBase):
-    def embed_watermark(self, file_path, watermark_data, password):
-        """在PDF文档中嵌入水印"""
+    # 快速提取模式下目录副本缺失或损坏时，最多检查的页面数
+    PAGE_SAMPLE_LIMIT = 16
+
+    def embed_watermark(self, file_path, watermark_data, password, incremental=True):
+        """在PDF文档中嵌入水印，incremental 为 True 时以增量更新方式追加到原文件末尾
+
+        返回 EmbedResult，其 output 在 file_path 为路径时是同目录下 processed_ 文件的路径，
+        为 bytes 时是 bytes，为文件对象时是定位到开头的临时文件对象。
+        """
         try:
-            reader = PdfReader(file_path)
-            writer = PdfWriter()
+            timestamp = time.time()
+            locations = []
+            timings = {}
             
             # 准备要嵌入的核心数据
             core_data = {
                 'content': watermark_data['content'],
                 'user': watermark_data['user']
             }
+            source = self._as_input(file_path)
+            output = self._open_output(file_path)
             
-            # 1. 在XMP元数据中嵌入
-            self._embed_in_xmp(writer, core_data)
+            if incremental:
+                try:
+                    with self._timed(timings, 'incremental'):
+                        self._embed_incremental(source, output, core_data, locations)
+                    return EmbedResult(self._finish_output(file_path, output),
+                                       locations, timings, timestamp, fingerprint(core_data))
+                except Exception as e:
+                    print(f"Incremental update unavailable, falling back: {str(e)}")
+                    self._reset_output(output)
+                    source = self._as_input(source)
+                    locations = []
             
-            # 2. 在文档目录中嵌入
-            self._embed_in_catalog(writer, core_data)
+            with self._timed(timings, 'load'):
+                reader = PdfReader(source)
+                writer = PdfWriter()
             
-            # 3. 复制并处理所有页面
-            for page in reader.pages:
-                # 复制原始页面
-                writer.add_page(page)
-                # 在页面结构中嵌入水印
-                self._embed_in_page_structure(writer.pages[-1], core_data)
+            with self._timed(timings, 'embed'):
+                # 1. 在XMP元数据中嵌入
+                with self._timed(timings, 'xmp'):
+                    self._embed_in_xmp(writer, core_data, locations)
+                
+                # 2. 在文档目录中嵌入
+                with self._timed(timings, 'catalog'):
+                    self._embed_in_catalog(writer, core_data, locations)
+                
+                # 3. 复制并处理所有页面
+                with self._timed(timings, 'pages'):
+                    for page in reader.pages:
+                        # 复制原始页面
+                        writer.add_page(page)
+                        # 在页面结构中嵌入水印
+                        self._embed_in_page_structure(writer.pages[-1], core_data)
+                locations.append(('pages', len(writer.pages)))
             
             # 保存文档
-            output_path = os.path.join(os.path.dirname(file_path), 
-                                     f'processed_{os.path.basename(file_path)}')
-            with open(output_path, 'wb') as output_file:
-                writer.write(output_file)
+            with self._timed(timings, 'save'):
+                if self._is_path(output):
+                    with open(output, 'wb') as output_file:
+                        writer.write(output_file)
+                else:
+                    writer.write(output)
             
-            return output_path
+            return EmbedResult(self._finish_output(file_path, output),
+                               locations, timings, timestamp, fingerprint(core_data))
             
         except Exception as e:
             print(f"Error in embed_watermark: {str(e)}")
             raise
 
-    def _embed_in_xmp(self, writer, core_data):
-        """在XMP元数据中嵌入水印"""
-        try:
-            # 生成唯一标识
-            xmp_id = hashlib.sha256(json.dumps(core_data).encode()).hexdigest()[:8]
+    def _embed_incremental(self, file_path, output, core_data, locations):
+        """复制原文件并追加一个增量更新节，只包含新的目录、XMP 元数据流和首页字典"""
+        with ExitStack() as stack:
+            if self._is_path(file_path):
+                source = stack.enter_context(open(file_path, 'rb'))
+            else:
+                source = file_path
+            reader = PdfReader(source)
+            if reader.is_encrypted:
+                raise IncrementalUpdateError("加密文档不支持增量更新")
             
-            # 创建XMP元数据
-            xmp = f"""<?xpacket begin='' id='{xmp_id}'?>
+            prev_xref, xref_is_stream = self._locate_last_xref(source)
+            trailer = reader.trailer
+            root_ref = trailer.raw_get('/Root')
+            if not isinstance(root_ref, IndirectObject):
+                raise IncrementalUpdateError("文档目录不是间接对象")
+            next_number = self._next_object_number(reader)
+            
+            # 1. XMP 元数据作为新的间接对象
+            metadata = DecodedStreamObject()
+            metadata[NameObject('/Type')] = NameObject('/Metadata')
+            metadata[NameObject('/Subtype')] = NameObject('/XML')
+            metadata.set_data(self._xmp_packet(core_data).encode('utf-8'))
+            metadata_ref = IndirectObject(next_number, 0, reader)
+            next_number += 1
+            
+            # 2. 文档目录的新版本（浅拷贝，原有引用保持不变）
+            catalog = DictionaryObject(root_ref.get_object())
+            catalog[NameObject('/Metadata')] = metadata_ref
+            catalog[NameObject('/WatermarkData')] = self._watermark_dict(core_data)
+            
+            objects = [(root_ref, catalog), (metadata_ref, metadata)]
+            
+            # 3. 只修改首页字典，提取时按页面顺序查找到第一处即可
+            page_ref = self._first_page_ref(catalog)
+            if page_ref is not None:
+                page = DictionaryObject(page_ref.get_object())
+                page[NameObject('/WatermarkData')] = self._watermark_dict(core_data)
+                objects.append((page_ref, page))
+            
+            source.seek(-1, os.SEEK_END)
+            needs_newline = source.read(1) not in (b'\n', b'\r')
+            
+            if self._is_path(file_path) and self._is_path(output):
+                # 原始字节由 copyfile 直接复制（Linux 上使用 sendfile）
+                shutil.copyfile(file_path, output)
+                output_file = stack.enter_context(open(output, 'ab'))
+            else:
+                source.seek(0)
+                output_file = output
+                shutil.copyfileobj(source, output_file)
+            
+            update = BytesIO()
+            if needs_newline:
+                update.write(b'\n')
+            base = output_file.tell()
+            
+            offsets = []
+            for ref, obj in objects:
+                offsets.append((ref.idnum, ref.generation, base + update.tell()))
+                update.write(f'{ref.idnum} {ref.generation} obj\n'.encode())
+                obj.write_to_stream(update, None)
+                update.write(b'\nendobj\n')
+            
+            # 4. 交叉引用节与文件尾，格式与原文件最后一节一致
+            new_trailer = DictionaryObject()
+            for key in ('/Root', '/Info', '/ID'):
+                if key in trailer:
+                    new_trailer[NameObject(key)] = trailer.raw_get(key)
+            new_trailer[NameObject('/Prev')] = NumberObject(prev_xref)
+            
+            xref_offset = base + update.tell()
+            if xref_is_stream:
+                self._write_xref_stream(update, offsets, new_trailer, next_number, xref_offset, reader)
+            else:
+                new_trailer[NameObject('/Size')] = NumberObject(next_number)
+                self._write_xref_table(update, offsets, new_trailer)
+            update.write(b'startxref\n%d\n%%%%EOF\n' % xref_offset)
+            output_file.write(update.getvalue())
+            
+            locations.append(('catalog', root_ref.idnum))
+            locations.append(('xmp', metadata_ref.idnum))
+            if page_ref is not None:
+                locations.append(('page', page_ref.idnum))
+
+    @staticmethod
+    def _next_object_number(reader):
+        """返回第一个未使用的对象号（交叉引用流的文件尾中可能没有 /Size）"""
+        if '/Size' in reader.trailer:
+            return int(reader.trailer['/Size'])
+        numbers = [num for table in reader.xref.values() for num in table]
+        numbers.extend(reader.xref_objStm)
+        if not numbers:
+            raise IncrementalUpdateError("无法确定对象数量")
+        return max(numbers) + 1
+
+    @staticmethod
+    def _locate_last_xref(source):
+        """返回最后一个交叉引用节的偏移量，以及它是否为交叉引用流"""
+        source.seek(0, os.SEEK_END)
+        size = source.tell()
+        source.seek(max(0, size - 2048))
+        tail = source.read()
+        pos = tail.rfind(b'startxref')
+        if pos == -1:
+            raise IncrementalUpdateError("未找到 startxref")
+        try:
+            offset = int(tail[pos + len(b'startxref'):].split()[0])
+        except (IndexError, ValueError):
+            raise IncrementalUpdateError("startxref 偏移量无效")
+        
+        source.seek(offset)
+        head = source.read(32).lstrip()
+        return offset, not head.startswith(b'xref')
+
+    @staticmethod
+    def _first_page_ref(catalog):
+        """沿页面树的第一个分支找到首页的间接引用，不展开整个页面树"""
+        node_ref = catalog.raw_get('/Pages') if '/Pages' in catalog else None
+        for _ in range(64):
+            if not isinstance(node_ref, IndirectObject):
+                return None
+            node = node_ref.get_object()
+            if '/Kids' not in node:
+                return node_ref
+            kids = node['/Kids']
+            if not kids:
+                return None
+            node_ref = kids[0]
+        return None
+
+    @staticmethod
+    def _write_xref_table(stream, offsets, trailer):
+        """写出传统交叉引用表，连续的对象号合并为同一小节"""
+        stream.write(b'xref\n')
+        entries = sorted(offsets)
+        start = 0
+        while start < len(entries):
+            end = start + 1
+            while end < len(entries) and entries[end][0] == entries[end - 1][0] + 1:
+                end += 1
+            stream.write(b'%d %d\n' % (entries[start][0], end - start))
+            for _, generation, offset in entries[start:end]:
+                stream.write(b'%010d %05d n \n' % (offset, generation))
+            start = end
+        stream.write(b'trailer\n')
+        trailer.write_to_stream(stream, None)
+        stream.write(b'\n')
+
+    @staticmethod
+    def _write_xref_stream(stream, offsets, trailer, number, xref_offset, reader):
+        """写出交叉引用流（原文件使用交叉引用流时，增量更新沿用同一格式）"""
+        entries = sorted(offsets + [(number, 0, xref_offset)])
+        width = max(4, (xref_offset.bit_length() + 7) // 8)
+        data = b''.join(
+            b'\x01' + offset.to_bytes(width, 'big') + generation.to_bytes(2, 'big')
+            for _, generation, offset in entries
+        )
+        
+        xref = DecodedStreamObject()
+        xref.update(trailer)
+        xref[NameObject('/Type')] = NameObject('/XRef')
+        xref[NameObject('/Size')] = NumberObject(number + 1)
+        xref[NameObject('/W')] = ArrayObject([NumberObject(1), NumberObject(width), NumberObject(2)])
+        xref[NameObject('/Index')] = ArrayObject(
+            [NumberObject(n) for num, _, _ in entries for n in (num, 1)]
+        )
+        xref.set_data(data)
+        
+        stream.write(f'{number} 0 obj\n'.encode())
+        xref.write_to_stream(stream, None)
+        stream.write(b'\nendobj\n')
+
+    def _xmp_packet(self, core_data):
+        """生成包含水印的 XMP 元数据包"""
+        # 生成唯一标识
+        xmp_id = fingerprint(core_data)[:8]
+        return f"""<?xpacket begin='' id='{xmp_id}'?>
 <x:xmpmeta xmlns:x='adobe:ns:meta/'>
     <rdf:RDF xmlns:rdf='http://www.w3.org/1999/02/22-rdf-syntax-ns#'>
         <rdf:Description rdf:about=''
@@ -64,6 +275,25 @@ class PDFWatermark(WatermarkBase):
     </rdf:RDF>
 </x:xmpmeta>
 <?xpacket end='r'?>"""
+
+    def _watermark_dict(self, core_data):
+        """生成目录和页面中嵌入的水印字典"""
+        # 生成唯一标识
+        watermark_id = fingerprint(core_data)[:8]
+        
+        # 创建自定义数据对象
+        custom_data = DictionaryObject()
+        custom_data[NameObject('/WatermarkID')] = createStringObject(watermark_id)
+        custom_data[NameObject('/Data')] = createStringObject(
+            self._hide_in_property(json.dumps(core_data))
+        )
+        return custom_data
+
+    def _embed_in_xmp(self, writer, core_data, locations):
+        """在XMP元数据中嵌入水印"""
+        try:
+            # 创建XMP元数据
+            xmp = self._xmp_packet(core_data)
             
             # 创建元数据流对象
             metadata = DecodedStreamObject()
@@ -72,27 +302,22 @@ class PDFWatermark(WatermarkBase):
             # 添加到文档目录
             writer._info = DictionaryObject()
             writer._info[NameObject('/Metadata')] = metadata
+            locations.append(('xmp', '/Info'))
             
         except Exception as e:
             print(f"Error embedding in XMP: {str(e)}")
 
-    def _embed_in_catalog(self, writer, core_data):
+    def _embed_in_catalog(self, writer, core_data, locations):
         """在文档目录中嵌入水印"""
         try:
-            # 生成唯一标识
-            catalog_id = hashlib.sha256(json.dumps(core_data).encode()).hexdigest()[:8]
-            
             # 创建自定义数据对象
-            custom_data = DictionaryObject()
-            custom_data[NameObject('/WatermarkID')] = createStringObject(catalog_id)
-            custom_data[NameObject('/Data')] = createStringObject(
-                self._hide_in_property(json.dumps(core_data))
-            )
+            custom_data = self._watermark_dict(core_data)
             
             # 添加到文档目录
             if not hasattr(writer, '_root_object'):
                 writer._root_object = DictionaryObject()
             writer._root_object[NameObject('/WatermarkData')] = custom_data
+            locations.append(('catalog', '/WatermarkData'))
             
         except Exception as e:
             print(f"Error embedding in catalog: {str(e)}")
@@ -100,15 +325,8 @@ class PDFWatermark(WatermarkBase):
     def _embed_in_page_structure(self, page, core_data):
         """在页面结构中嵌入水印"""
         try:
-            # 生成唯一标识
-            page_id = hashlib.sha256(json.dumps(core_data).encode()).hexdigest()[:8]
-            
             # 创建自定义数据对象
-            custom_data = DictionaryObject()
-            custom_data[NameObject('/WatermarkID')] = createStringObject(page_id)
-            custom_data[NameObject('/Data')] = createStringObject(
-                self._hide_in_property(json.dumps(core_data))
-            )
+            custom_data = self._watermark_dict(core_data)
             
             # 添加到页面字典
             page[NameObject('/WatermarkData')] = custom_data
@@ -116,10 +334,22 @@ class PDFWatermark(WatermarkBase):
         except Exception as e:
             print(f"Error embedding in page structure: {str(e)}")
 
-    def extract_watermark(self, file_path):
-        """从PDF文档中提取水印"""
+    def extract_watermark(self, file_path, lazy=True, page_limit=None):
+        """从PDF文档中提取水印，lazy 为 True 时内存映射文件并优先读取目录和XMP
+
+        file_path 也可以是 bytes 或可随机访问的文件对象。
+        """
+        if lazy:
+            try:
+                with self._timed(None, 'lazy', 'extract'):
+                    return self._extract_lazy(file_path, page_limit or self.PAGE_SAMPLE_LIMIT)
+            except Exception as e:
+                print(f"Error extracting watermark: {str(e)}")
+                return None
+        
         try:
-            reader = PdfReader(file_path)
+            with self._timed(None, 'load', 'extract'):
+                reader = PdfReader(self._as_input(file_path))
             watermark_data = None
             
             # 1. 从XMP元数据中提取
@@ -149,6 +379,63 @@ class PDFWatermark(WatermarkBase):
             print(f"Error extracting watermark: {str(e)}")
             return None
 
+    def _extract_lazy(self, file_path, page_limit):
+        """只解析文件尾、目录和XMP流；目录副本缺失或损坏时才按页面树抽样检查页面"""
+        if not self._is_path(file_path):
+            # bytes 和文件对象本身可随机访问，直接按需读取
+            return self._extract_lazy_from(PdfReader(self._as_input(file_path)), page_limit)
+        
+        with open(file_path, 'rb') as f, \
+                mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as view:
+            # PyPDF2 对路径参数会整体读入内存，传入 mmap 则按需分页读取
+            return self._extract_lazy_from(PdfReader(view), page_limit)
+
+    def _extract_lazy_from(self, reader, page_limit):
+        """按 XMP、目录、页面的顺序提取，目录副本有效时不访问页面对象"""
+        # 1. 从XMP元数据中提取
+        xmp_data = self._extract_from_xmp(reader)
+        
+        # 2. 从目录中提取
+        catalog_data = self._extract_from_catalog(reader)
+        if catalog_data:
+            # 验证数据一致性
+            if xmp_data and xmp_data != catalog_data:
+                return None
+            return catalog_data
+        
+        # 3. 目录副本不可用时，从前 page_limit 个页面中提取
+        page_data = self._extract_from_page_structure(reader, page_limit)
+        if page_data:
+            # 验证数据一致性
+            if xmp_data and xmp_data != page_data:
+                return None
+            return page_data
+        
+        return xmp_data
+
+    @staticmethod
+    def _iter_pages(reader, limit):
+        """沿 /Kids 深度优先遍历页面树，最多返回 limit 个页面，不构建完整页面列表"""
+        root = reader.trailer['/Root']
+        if '/Pages' not in root:
+            return
+        # 栈中保存未解析的引用，只有出栈时才读取对应对象
+        stack = [root.raw_get('/Pages')]
+        visited = set()
+        while stack and limit > 0:
+            ref = stack.pop()
+            if isinstance(ref, IndirectObject):
+                if ref.idnum in visited:
+                    continue
+                visited.add(ref.idnum)
+            node = ref.get_object()
+            if node.get('/Type') == '/Page' or '/Kids' not in node:
+                limit -= 1
+                yield node
+                continue
+            kids = node.raw_get('/Kids').get_object()
+            stack.extend(reversed(kids))
+
     def _extract_from_xmp(self, reader):
         """从XMP元数据中提取水印"""
         try:
@@ -182,10 +469,11 @@ class PDFWatermark(WatermarkBase):
             print(f"Error extracting from catalog: {str(e)}")
             return None
 
-    def _extract_from_page_structure(self, reader):
-        """从页面结构中提取水印"""
+    def _extract_from_page_structure(self, reader, page_limit=None):
+        """从页面结构中提取水印，指定 page_limit 时只检查页面树中的前若干页"""
         try:
-            for page in reader.pages:
+            pages = reader.pages if page_limit is None else self._iter_pages(reader, page_limit)
+            for page in pages:
                 if '/WatermarkData' in page:
                     watermark_data = page['/WatermarkData']
                     if '/Data' in watermark_data:
@@ -195,20 +483,3 @@ class PDFWatermark(WatermarkBase):
         except Exception as e:
             print(f"Error extracting from page structure: {str(e)}")
             return None
-
-    def _hide_in_property(self, text):
-        """将信息隐藏在属性值中"""
-        if not text:
-            return ''
-        # 使用特殊字符混淆数据
-        chars = list(text)
-        for i in range(len(chars)):
-            if i % 2 == 0:
-                chars.insert(i, '\u200b')
-        return ''.join(chars)
-
-    def _reveal_from_property(self, text):
-        """从属性值中提取信息"""
-        if not text:
-            return ''
-        return ''.join(c for c in text if c != '\u200b') 
\ No newline at end of file
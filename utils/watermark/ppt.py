@@ -2,47 +2,176 @@ from pptx import Presentation
 from pptx.oxml import parse_xml
 from pptx.oxml.ns import qn
 from pptx.oxml.xmlchemy import BaseOxmlElement
-from .base import WatermarkBase
+from .base import WatermarkBase, EmbedResult
+from .registry import fingerprint
+from .ooxml import OOXMLPatcher, OOXMLPatchError
+from lxml import etree
+import datetime
 import hashlib
 import json
-import os
+import time
+
+P_NS = 'http://schemas.openxmlformats.org/presentationml/2006/main'
+R_NS = 'http://schemas.openxmlformats.org/officeDocument/2006/relationships'
+CP_NS = 'http://schemas.openxmlformats.org/package/2006/metadata/core-properties'
+DC_NS = 'http://purl.org/dc/elements/1.1/'
+DCTERMS_NS = 'http://purl.org/dc/terms/'
+XSI_NS = 'http://www.w3.org/2001/XMLSchema-instance'
+RT_CORE_PROPERTIES = 'http://schemas.openxmlformats.org/package/2006/relationships/metadata/core-properties'
+RT_SLIDE_MASTER = 'http://schemas.openxmlformats.org/officeDocument/2006/relationships/slideMaster'
+CT_CORE_PROPERTIES = 'application/vnd.openxmlformats-package.core-properties+xml'
 
 class PPTWatermark(WatermarkBase):
-    def __init__(self):
-        super().__init__()
-        self.watermark_locations = []
+    def embed_watermark(self, file_path, watermark_data, password, patch=True):
+        """在PPT文档中嵌入水印，patch 为 True 时只重写被修改的 ZIP 成员
 
-    def embed_watermark(self, file_path, watermark_data, password):
-        """在PPT文档中嵌入水印"""
+        返回 EmbedResult，其 output 在 file_path 为路径时是同目录下 processed_ 文件的路径，
+        为 bytes 时是 bytes，为文件对象时是定位到开头的临时文件对象。
+        """
         try:
-            prs = Presentation(file_path)
+            timestamp = time.time()
+            locations = []
+            timings = {}
             
             # 准备要嵌入的核心数据
             core_data = {
                 'content': watermark_data['content'],
                 'user': watermark_data['user']
             }
+            source = self._as_input(file_path)
+            output = self._open_output(file_path)
             
-            # 1. 在演示文稿属性中嵌入
-            self._embed_in_properties(prs, core_data)
+            if patch:
+                try:
+                    with self._timed(timings, 'patch'):
+                        self._embed_by_patch(source, output, core_data, locations)
+                    return EmbedResult(self._finish_output(file_path, output),
+                                       locations, timings, timestamp, fingerprint(core_data))
+                except OOXMLPatchError as e:
+                    print(f"Patch embedding unavailable, falling back: {str(e)}")
+                    self._reset_output(output)
+                    source = self._as_input(source)
+                    locations = []
             
-            # 2. 在幻灯片布局中嵌入
-            self._embed_in_layouts(prs, core_data)
+            with self._timed(timings, 'load'):
+                prs = Presentation(source)
             
-            # 3. 在主题属性中嵌入
-            self._embed_in_theme(prs, core_data)
+            with self._timed(timings, 'embed'):
+                # 1. 在演示文稿属性中嵌入
+                with self._timed(timings, 'properties'):
+                    self._embed_in_properties(prs, core_data, locations)
+                
+                # 2. 在幻灯片布局中嵌入
+                with self._timed(timings, 'layouts'):
+                    self._embed_in_layouts(prs, core_data, locations)
+                
+                # 3. 在主题属性中嵌入
+                with self._timed(timings, 'theme'):
+                    self._embed_in_theme(prs, core_data, locations)
             
             # 保存文档
-            output_path = os.path.join(os.path.dirname(file_path), 
-                                     f'processed_{os.path.basename(file_path)}')
-            prs.save(output_path)
-            return output_path
+            with self._timed(timings, 'save'):
+                prs.save(output)
+            return EmbedResult(self._finish_output(file_path, output),
+                               locations, timings, timestamp, fingerprint(core_data))
             
         except Exception as e:
             print(f"Error in embed_watermark: {str(e)}")
             raise
 
-    def _embed_in_properties(self, prs, core_data):
+    def _embed_by_patch(self, source, output, core_data, locations):
+        """只修改 docProps/core.xml 和幻灯片布局部件，其余成员原样复制
+
+        完整路径的 _embed_in_theme 实际写不进主题（Package 没有 parts 属性），提取时也不读取主题，
+        因此这里不处理主题，两条路径输出的水印位置一致。
+        """
+        hidden = self._hide_in_property(json.dumps(core_data))
+        
+        with OOXMLPatcher(source) as package:
+            presentation = package.main_document_partname()
+            
+            # 1. 在演示文稿属性中嵌入
+            try:
+                self._patch_core_properties(package, hidden)
+                locations.append(('properties', 'comments'))
+                print(f"Embedded in properties: {core_data}")  # 调试信息
+            except OOXMLPatchError:
+                raise
+            except Exception as e:
+                print(f"Error embedding in properties: {str(e)}")
+            
+            # 2. 在幻灯片布局中嵌入（与 prs.slide_layouts 一致，只处理第一个母版的布局）
+            for layout in self._first_master_layouts(package, presentation):
+                root = package.parse_xml(layout)
+                c_sld = root.find(f'{{{P_NS}}}cSld')
+                name = c_sld.get('name', '') if c_sld is not None else ''
+                layout_id = self._layout_id(core_data, name)
+                root.set('customData', hidden)
+                root.set('id', layout_id)
+                package.write_xml(layout, root)
+                locations.append(('layout', layout_id))
+            print(f"Embedded in layouts: {core_data}")  # 调试信息
+            
+            package.save(output)
+
+    def _patch_core_properties(self, package, hidden):
+        """在 core.xml 的 dc:description 中写入数据，缺失时按 python-pptx 的默认值新建"""
+        if len(hidden) > 255:
+            # 与 python-pptx 的核心属性长度限制保持一致
+            raise ValueError(f"exceeded 255 char limit for property, got:\n\n'{hidden}'")
+        
+        targets = package.related_partnames('/', RT_CORE_PROPERTIES)
+        if targets:
+            partname = targets[0]
+            root = package.parse_xml(partname)
+        else:
+            partname = '/docProps/core.xml'
+            root = etree.Element(
+                f'{{{CP_NS}}}coreProperties',
+                nsmap={'cp': CP_NS, 'dc': DC_NS, 'dcterms': DCTERMS_NS, 'xsi': XSI_NS}
+            )
+            etree.SubElement(root, f'{{{DC_NS}}}title').text = 'PowerPoint Presentation'
+            etree.SubElement(root, f'{{{CP_NS}}}lastModifiedBy').text = 'python-pptx'
+            etree.SubElement(root, f'{{{CP_NS}}}revision').text = '1'
+            modified = etree.SubElement(root, f'{{{DCTERMS_NS}}}modified')
+            modified.set(f'{{{XSI_NS}}}type', 'dcterms:W3CDTF')
+            modified.text = datetime.datetime.now(datetime.timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')
+            package.ensure_content_type(partname, CT_CORE_PROPERTIES)
+            package.add_relationship('/', RT_CORE_PROPERTIES, partname)
+        
+        description = root.find(f'{{{DC_NS}}}description')
+        if description is None:
+            description = etree.SubElement(root, f'{{{DC_NS}}}description')
+        description.text = hidden
+        package.write_xml(partname, root)
+
+    @staticmethod
+    def _first_master_layouts(package, presentation):
+        """按 sldLayoutIdLst 顺序返回第一个幻灯片母版的布局部件名"""
+        root = package.parse_xml(presentation)
+        master_id = root.find(f'{{{P_NS}}}sldMasterIdLst/{{{P_NS}}}sldMasterId')
+        if master_id is None:
+            return []
+        master = package.relationship_targets(presentation).get(master_id.get(f'{{{R_NS}}}id'))
+        if master is None:
+            raise OOXMLPatchError("未找到幻灯片母版部件")
+        
+        master_targets = package.relationship_targets(master)
+        layouts = []
+        for layout_id in package.parse_xml(master).iterfind(
+                f'{{{P_NS}}}sldLayoutIdLst/{{{P_NS}}}sldLayoutId'):
+            layout = master_targets.get(layout_id.get(f'{{{R_NS}}}id'))
+            if layout is None:
+                raise OOXMLPatchError("未找到幻灯片布局部件")
+            layouts.append(layout)
+        return layouts
+
+    @staticmethod
+    def _layout_id(core_data, layout_name):
+        """生成布局的唯一标识"""
+        return hashlib.sha256((json.dumps(core_data) + str(layout_name)).encode()).hexdigest()[:8]
+
+    def _embed_in_properties(self, prs, core_data, locations):
         """在演示文稿属性中嵌入水印"""
         try:
             # 获取核心属性
@@ -50,33 +179,33 @@ class PPTWatermark(WatermarkBase):
             
             # 在注释中嵌入数据
             core_props.comments = self._hide_in_property(json.dumps(core_data))
+            locations.append(('properties', 'comments'))
             
             print(f"Embedded in properties: {core_data}")  # 调试信息
             
         except Exception as e:
             print(f"Error embedding in properties: {str(e)}")
 
-    def _embed_in_layouts(self, prs, core_data):
+    def _embed_in_layouts(self, prs, core_data, locations):
         """在幻灯片布局中嵌入水印"""
         try:
             # 遍历所有布局
             for layout in prs.slide_layouts:
                 # 生成唯一标识
-                layout_id = hashlib.sha256(
-                    (json.dumps(core_data) + str(layout.name)).encode()
-                ).hexdigest()[:8]
+                layout_id = self._layout_id(core_data, layout.name)
                 
                 # 在布局XML中嵌入信息
                 layout._element.set('customData', 
                     self._hide_in_property(json.dumps(core_data)))
                 layout._element.set('id', layout_id)
+                locations.append(('layout', layout_id))
             
             print(f"Embedded in layouts: {core_data}")  # 调试信息
             
         except Exception as e:
             print(f"Error embedding in layouts: {str(e)}")
 
-    def _embed_in_theme(self, prs, core_data):
+    def _embed_in_theme(self, prs, core_data, locations):
         """在演示文稿主题中嵌入水印"""
         try:
             # 获取主题部分
@@ -87,15 +216,17 @@ class PPTWatermark(WatermarkBase):
                     theme_element.set('customData', 
                         self._hide_in_property(json.dumps(core_data)))
                     theme_element.set('id', 
-                        hashlib.sha256(json.dumps(core_data).encode()).hexdigest()[:8])
+                        fingerprint(core_data)[:8])
+                    locations.append(('theme', part.partname))
             
         except Exception as e:
             print(f"Error embedding in theme: {str(e)}")
 
     def extract_watermark(self, file_path):
-        """从PPT文档中提取水印"""
+        """从PPT文档中提取水印，file_path 也可以是 bytes 或文件对象"""
         try:
-            prs = Presentation(file_path)
+            with self._timed(None, 'load', 'extract'):
+                prs = Presentation(self._as_input(file_path))
             watermark_data = None
             
             # 1. 从属性中提取
@@ -172,20 +303,3 @@ class PPTWatermark(WatermarkBase):
         except Exception as e:
             print(f"Error extracting from comments: {str(e)}")
             return None
-
-    def _hide_in_property(self, text):
-        """将信息隐藏在属性值中"""
-        if not text:
-            return ''
-        # 使用特殊字符混淆数据
-        chars = list(text)
-        for i in range(len(chars)):
-            if i % 2 == 0:
-                chars.insert(i, '\u200b')
-        return ''.join(chars)
-
-    def _reveal_from_property(self, text):
-        """从属性值中提取信息"""
-        if not text:
-            return ''
-        return ''.join(c for c in text if c != '\u200b') 
\ No newline at end of file
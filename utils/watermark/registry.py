@@ -0,0 +1,156 @@
+"""水印登记表：记录每次嵌入的指纹、接收人和输出文件哈希，泄露追踪时按索引直接查询
+
+指纹是水印核心数据 {content, user} 的 SHA-256，文档中嵌入的标识（rsid、WatermarkID 等）为其前 8 位；
+文件哈希是嵌入水印后输出文件的 SHA-256。原样泄露的文件只需计算哈希即可定位接收人，无需解析文档。
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+SHORT_ID_LENGTH = 8
+HASH_CHUNK_SIZE = 1024 * 1024
+# SQLite 单条语句的参数个数有上限，批量查询按此分组
+QUERY_BATCH_SIZE = 500
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS watermarks (
+    id INTEGER PRIMARY KEY,
+    fingerprint TEXT NOT NULL,
+    short_id TEXT NOT NULL,
+    file_hash TEXT,
+    user TEXT NOT NULL,
+    content TEXT NOT NULL,
+    filename TEXT,
+    ext TEXT,
+    created REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_watermarks_fingerprint ON watermarks (fingerprint);
+CREATE INDEX IF NOT EXISTS idx_watermarks_short_id ON watermarks (short_id);
+CREATE INDEX IF NOT EXISTS idx_watermarks_file_hash ON watermarks (file_hash);
+"""
+
+COLUMNS = ('fingerprint', 'short_id', 'file_hash', 'user', 'content', 'filename', 'ext', 'created')
+
+
+def fingerprint(core_data):
+    """水印核心数据的指纹（SHA-256 十六进制），与嵌入文档中的标识一致"""
+    return hashlib.sha256(json.dumps(core_data).encode()).hexdigest()
+
+
+def file_sha256(payload):
+    """bytes、路径或可定位文件对象内容的 SHA-256；文件对象读完后回到开头"""
+    hasher = hashlib.sha256()
+    if isinstance(payload, (bytes, bytearray, memoryview)):
+        hasher.update(payload)
+        return hasher.hexdigest()
+
+    if isinstance(payload, (str, os.PathLike)):
+        with open(payload, 'rb') as f:
+            while chunk := f.read(HASH_CHUNK_SIZE):
+                hasher.update(chunk)
+        return hasher.hexdigest()
+
+    payload.seek(0)
+    while chunk := payload.read(HASH_CHUNK_SIZE):
+        hasher.update(chunk)
+    payload.seek(0)
+    return hasher.hexdigest()
+
+
+class WatermarkRegistry:
+    """SQLite 登记表，WAL 模式下读写互不阻塞，每个线程使用独立连接
+
+    数据库文件在首次登记或查询时才创建，仅导入 app 不会在磁盘上留下文件。
+    """
+
+    def __init__(self, path):
+        self.path = os.path.abspath(path)
+        self._local = threading.local()
+        self._connections = []
+        self._lock = threading.Lock()
+        self._initialized = False
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.row_factory = sqlite3.Row
+            conn.execute('PRAGMA journal_mode=WAL')
+            # WAL 下 NORMAL 只在断电时可能丢失最后的事务，不会损坏数据库
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+            with self._lock:
+                if not self._initialized:
+                    with conn:
+                        conn.executescript(SCHEMA)
+                    self._initialized = True
+                self._connections.append(conn)
+        return conn
+
+    def record(self, core_data, file_hash=None, filename=None, ext=None, created=None):
+        """登记一次嵌入，返回指纹"""
+        return self.record_many([(core_data, file_hash, filename, ext, created)])[0]
+
+    def record_many(self, entries):
+        """在一个事务中登记多条 (core_data, file_hash, filename, ext, created)，返回各自的指纹"""
+        rows = []
+        for core_data, file_hash, filename, ext, created in entries:
+            value = fingerprint(core_data)
+            rows.append((value, value[:SHORT_ID_LENGTH], file_hash,
+                         core_data['user'], core_data['content'],
+                         filename, ext, created or time.time()))
+        with self._connect() as conn:
+            conn.executemany(
+                f"INSERT INTO watermarks ({', '.join(COLUMNS)}) "
+                f"VALUES ({', '.join('?' * len(COLUMNS))})",
+                rows
+            )
+        return [row[0] for row in rows]
+
+    def _lookup(self, column, values):
+        """按列批量查询，返回 {值: [记录, ...]}，没有记录的值不出现在结果中"""
+        values = list(dict.fromkeys(values))
+        found = {}
+        conn = self._connect()
+        for start in range(0, len(values), QUERY_BATCH_SIZE):
+            batch = values[start:start + QUERY_BATCH_SIZE]
+            rows = conn.execute(
+                f"SELECT {', '.join(COLUMNS)} FROM watermarks "
+                f"WHERE {column} IN ({', '.join('?' * len(batch))}) ORDER BY created",
+                batch
+            )
+            for row in rows:
+                found.setdefault(row[column], []).append(dict(row))
+        return found
+
+    def lookup_hashes(self, file_hashes):
+        """按输出文件哈希批量查询"""
+        return self._lookup('file_hash', [value.lower() for value in file_hashes])
+
+    def lookup_fingerprints(self, fingerprints):
+        """按指纹批量查询，既接受完整指纹，也接受文档中嵌入的 8 位标识"""
+        full = [value.lower() for value in fingerprints if len(value) > SHORT_ID_LENGTH]
+        short = [value.lower() for value in fingerprints if len(value) <= SHORT_ID_LENGTH]
+        found = self._lookup('fingerprint', full)
+        found.update(self._lookup('short_id', short))
+        return found
+
+    def lookup_hash(self, file_hash):
+        return self.lookup_hashes([file_hash]).get(file_hash.lower(), [])
+
+    def lookup_fingerprint(self, value):
+        return self.lookup_fingerprints([value]).get(value.lower(), [])
+
+    def close(self):
+        with self._lock:
+            connections, self._connections = self._connections, []
+        for conn in connections:
+            try:
+                conn.close()
+            except sqlite3.ProgrammingError:
+                # 其他线程创建的连接不能在本线程关闭，随线程结束释放
+                pass
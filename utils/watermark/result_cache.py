@@ -0,0 +1,225 @@
+"""按上传内容的 SHA-256 缓存水印提取结果
+
+同一文件被多次上传时直接返回之前的提取结果：内存中按条目数 LRU 淘汰，
+可选的磁盘层按总大小淘汰；同一内容的并发请求只执行一次解析，其余请求等待其结果。
+缓存的只是提取出的水印数据，验证时仍然每次用请求中的密码解密。
+"""
+import hashlib
+import json
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from ..metrics import METRICS
+from .registry import file_sha256
+
+# 提取结果的格式变化时递增，使旧的磁盘缓存失效
+CACHE_VERSION = 1
+
+
+class HashingSpool:
+    """上传文件的写入目标：写入时同步计算 SHA-256，其余操作转发给底层临时文件
+
+    stream 应为 SpooledTemporaryFile(max_size=max_memory)，写入的数据超过 max_memory 后溢出到磁盘。
+    """
+
+    def __init__(self, stream, max_memory):
+        self._stream = stream
+        self._hasher = hashlib.sha256()
+        self._max_memory = max_memory
+        self._written = 0
+
+    def write(self, data):
+        self._hasher.update(data)
+        self._written += len(data)
+        return self._stream.write(data)
+
+    @property
+    def sha256(self):
+        return self._hasher.hexdigest()
+
+    @property
+    def on_disk(self):
+        """数据是否已溢出到磁盘临时文件"""
+        return self._written > self._max_memory
+
+    def __getattr__(self, name):
+        return getattr(self._stream, name)
+
+    def __iter__(self):
+        return iter(self._stream)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stream.close()
+        return False
+
+
+def content_sha256(source):
+    """上传流在接收时已算出的哈希；其他输入（路径、bytes、文件对象）读取一遍计算"""
+    digest = getattr(source, 'sha256', None)
+    if isinstance(digest, str):
+        return digest
+    return file_sha256(source)
+
+
+def cache_key(ext, digest):
+    return f"{CACHE_VERSION}-{ext.lstrip('.')}-{digest}"
+
+
+class _Flight:
+    """一次正在进行的计算，等待者通过 event 获取其结果"""
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.value = None
+        self.error = None
+
+
+class ResultCache:
+    """两级缓存（内存 LRU + 可选磁盘），值须可序列化为 JSON"""
+
+    def __init__(self, max_entries=1024, directory=None, max_bytes=256 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.directory = os.path.abspath(directory) if directory else None
+        self.max_bytes = max_bytes
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._flights = {}
+        # 磁盘层索引：键 -> 文件大小，按最近使用排序
+        self._disk = OrderedDict()
+        self._disk_bytes = 0
+        if self.directory:
+            os.makedirs(self.directory, exist_ok=True)
+            self._load_disk_index()
+
+    def _load_disk_index(self):
+        entries = []
+        for name in os.listdir(self.directory):
+            if not name.endswith('.json'):
+                continue
+            try:
+                stat = os.stat(os.path.join(self.directory, name))
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, name[:-len('.json')], stat.st_size))
+        for _, key, size in sorted(entries):
+            self._disk[key] = size
+            self._disk_bytes += size
+
+    def _path(self, key):
+        return os.path.join(self.directory, f'{key}.json')
+
+    def get_or_compute(self, key, compute):
+        """返回缓存的值，未命中时调用 compute() 并缓存；compute 抛出的异常不会被缓存"""
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                METRICS.inc('watermark_result_cache_total', result='memory')
+                return self._memory[key]
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+
+        if not leader:
+            METRICS.inc('watermark_result_cache_total', result='coalesced')
+            flight.event.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.value
+
+        try:
+            found, value = self._read_disk(key)
+            if found:
+                METRICS.inc('watermark_result_cache_total', result='disk')
+            else:
+                METRICS.inc('watermark_result_cache_total', result='miss')
+                value = compute()
+                self._write_disk(key, value)
+            self._remember(key, value)
+            flight.value = value
+            return value
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._flights[key]
+            flight.event.set()
+
+    def _remember(self, key, value):
+        with self._lock:
+            self._memory[key] = value
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.max_entries:
+                self._memory.popitem(last=False)
+
+    def _read_disk(self, key):
+        if not self.directory:
+            return False, None
+        with self._lock:
+            if key not in self._disk:
+                return False, None
+            self._disk.move_to_end(key)
+        try:
+            with open(self._path(key), encoding='utf-8') as f:
+                value = json.load(f)
+            # 更新修改时间，重启后重建索引时保持最近使用顺序
+            os.utime(self._path(key))
+            return True, value
+        except (OSError, ValueError) as e:
+            print(f"Error reading result cache: {str(e)}")
+            self._forget_disk(key)
+            return False, None
+
+    def _write_disk(self, key, value):
+        if not self.directory:
+            return
+        try:
+            data = json.dumps(value, ensure_ascii=False).encode('utf-8')
+            # 先写临时文件再替换，其他进程不会读到写了一半的文件
+            fd, temp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(temp_path, self._path(key))
+        except (OSError, TypeError, ValueError) as e:
+            print(f"Error writing result cache: {str(e)}")
+            return
+
+        evicted = []
+        with self._lock:
+            self._disk_bytes += len(data) - self._disk.pop(key, 0)
+            self._disk[key] = len(data)
+            while self._disk_bytes > self.max_bytes and len(self._disk) > 1:
+                old_key, size = self._disk.popitem(last=False)
+                self._disk_bytes -= size
+                evicted.append(old_key)
+        for old_key in evicted:
+            try:
+                os.remove(self._path(old_key))
+            except OSError:
+                pass
+
+    def _forget_disk(self, key):
+        with self._lock:
+            self._disk_bytes -= self._disk.pop(key, 0)
+        try:
+            os.remove(self._path(key))
+        except OSError:
+            pass
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+            keys = list(self._disk)
+            self._disk.clear()
+            self._disk_bytes = 0
+        if self.directory:
+            for key in keys:
+                try:
+                    os.remove(self._path(key))
+                except OSError:
+                    pass
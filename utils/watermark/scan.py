@@ -0,0 +1,193 @@
+"""批量扫描目录树中的文档并提取水印，结果写入 JSONL，支持中断后续扫
+
+按扩展名选择处理器，在进程池中并行提取；每处理完一个文件就追加一行结果，
+再把该文件（路径、大小、修改时间）追加到检查点文件。重新运行同一命令时跳过检查点中已完成的文件，
+文件在两次运行之间被修改过则重新扫描。结果写入与检查点之间中断时，该文件可能出现两行结果。
+
+用法:
+    python -m utils.watermark.scan /mnt/share /data/leaks --output scan.jsonl --workers 8
+    python -m utils.watermark.scan /mnt/share --output scan.jsonl --registry uploads/watermarks.db
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from .handlers import HANDLER_SPECS, HandlerRegistry
+from .registry import WatermarkRegistry, file_sha256
+
+# 工作进程中的处理器和登记表，由 _init_worker 创建
+_handlers = None
+_registry = None
+
+
+def _init_worker(handler_specs, registry_path):
+    global _handlers, _registry
+    _handlers = HandlerRegistry(handler_specs)
+    if registry_path:
+        _registry = WatermarkRegistry(registry_path)
+    # 处理器会打印调试信息，避免与进度输出混在一起
+    sys.stdout = open(os.devnull, 'w')
+
+
+def _scan_file(path, ext):
+    """提取单个文件的水印，登记表中有该文件哈希时直接使用登记的结果"""
+    start = time.perf_counter()
+    result = {'path': path, 'ext': ext}
+    try:
+        result['size'] = os.path.getsize(path)
+        result['sha256'] = file_sha256(path)
+
+        # 1. 原样分发的文件按哈希查询登记表
+        records = _registry.lookup_hash(result['sha256']) if _registry is not None else []
+        if records:
+            record = records[-1]
+            result.update(status='found', source='registry',
+                          content=record['content'], user=record['user'],
+                          issued=record['created'])
+        else:
+            # 2. 解析文档提取水印
+            hidden_info = _handlers[ext].extract_watermark(path)
+            if hidden_info:
+                result.update(status='found', source='document',
+                              content=hidden_info.get('content', ''),
+                              user=hidden_info.get('user', ''))
+            else:
+                result['status'] = 'not_found'
+    except Exception as e:
+        result.update(status='error', error=str(e))
+    result['elapsed_ms'] = (time.perf_counter() - start) * 1000
+    return result
+
+
+def _checkpoint_key(path, stat):
+    return f'{path}\t{stat.st_size}\t{stat.st_mtime_ns}'
+
+
+def _load_checkpoint(path):
+    """读取检查点中已完成文件的键；最后一行可能因中断而不完整，忽略无法识别的行"""
+    done = set()
+    if not os.path.exists(path):
+        return done
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            if line.endswith('\n') and line.count('\t') == 2:
+                done.add(line[:-1])
+    return done
+
+
+def iter_files(roots, extensions):
+    """深度优先遍历目录，产出 (绝对路径, 扩展名, stat)，不跟随符号链接"""
+    stack = [os.path.abspath(root) for root in reversed(roots)]
+    while stack:
+        path = stack.pop()
+        try:
+            if os.path.isfile(path):
+                ext = os.path.splitext(path)[1].lower()
+                if ext in extensions:
+                    yield path, ext, os.stat(path)
+                continue
+            with os.scandir(path) as entries:
+                entries = sorted(entries, key=lambda entry: entry.name, reverse=True)
+        except OSError as e:
+            print(f"无法读取 {path}: {str(e)}", file=sys.stderr)
+            continue
+        for entry in entries:
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append(entry.path)
+                elif entry.is_file(follow_symlinks=False):
+                    ext = os.path.splitext(entry.name)[1].lower()
+                    if ext in extensions:
+                        yield entry.path, ext, entry.stat(follow_symlinks=False)
+            except OSError as e:
+                print(f"无法读取 {entry.path}: {str(e)}", file=sys.stderr)
+
+
+def scan(roots, output, checkpoint, workers=None, extensions=None, registry=None,
+         max_tasks=200, progress_every=500):
+    """扫描 roots 下的文档，返回本次运行的统计"""
+    extensions = set(extensions or HANDLER_SPECS)
+    specs = {ext: spec for ext, spec in HANDLER_SPECS.items() if ext in extensions}
+    workers = workers or os.cpu_count() or 1
+    done = _load_checkpoint(checkpoint)
+    stats = {'scanned': 0, 'skipped': 0, 'found': 0, 'not_found': 0, 'error': 0}
+    started = time.perf_counter()
+
+    pool = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                               initargs=(specs, registry), max_tasks_per_child=max_tasks)
+    pending = {}
+    with open(output, 'a', encoding='utf-8') as out, \
+            open(checkpoint, 'a', encoding='utf-8') as marks:
+
+        def collect(futures):
+            for future in futures:
+                key = pending.pop(future)
+                result = future.result()
+                # 先写结果再写检查点，保证检查点中的文件都有结果
+                out.write(json.dumps(result, ensure_ascii=False) + '\n')
+                out.flush()
+                marks.write(key + '\n')
+                marks.flush()
+                stats['scanned'] += 1
+                stats[result['status']] += 1
+                if stats['scanned'] % progress_every == 0:
+                    rate = stats['scanned'] / (time.perf_counter() - started)
+                    print(f"已扫描 {stats['scanned']} 个文件（跳过 {stats['skipped']}），"
+                          f"{rate:.1f} 个/秒", file=sys.stderr)
+
+        try:
+            for path, ext, stat in iter_files(roots, extensions):
+                key = _checkpoint_key(path, stat)
+                if key in done:
+                    stats['skipped'] += 1
+                    continue
+                # 限制排队的任务数，避免遍历大目录时积压大量 Future
+                if len(pending) >= workers * 4:
+                    finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    collect(finished)
+                pending[pool.submit(_scan_file, path, ext)] = key
+
+            while pending:
+                finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+                collect(finished)
+        finally:
+            # 中断时放弃尚未开始的任务，已完成的结果都已写入检查点
+            pool.shutdown(wait=True, cancel_futures=True)
+
+    stats['elapsed_s'] = time.perf_counter() - started
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('roots', nargs='+', help='要扫描的目录或文件')
+    parser.add_argument('--output', required=True, help='结果 JSONL 文件（追加写入）')
+    parser.add_argument('--checkpoint', help='检查点文件，默认为 <output>.checkpoint')
+    parser.add_argument('--workers', type=int, help='工作进程数，默认为 CPU 核数')
+    parser.add_argument('--ext', nargs='+', default=list(HANDLER_SPECS),
+                        help='只扫描这些扩展名，默认 .docx .pptx .pdf')
+    parser.add_argument('--registry', help='水印登记表路径，文件哈希命中时不再解析')
+    parser.add_argument('--max-tasks', type=int, default=200, help='工作进程处理多少个文件后重建')
+    args = parser.parse_args()
+
+    extensions = {ext.lower() if ext.startswith('.') else f'.{ext.lower()}' for ext in args.ext}
+    unsupported = extensions - set(HANDLER_SPECS)
+    if unsupported:
+        parser.error(f"不支持的扩展名: {', '.join(sorted(unsupported))}")
+    if args.registry and not os.path.exists(args.registry):
+        parser.error(f"登记表不存在: {args.registry}")
+
+    try:
+        stats = scan(args.roots, args.output, args.checkpoint or f'{args.output}.checkpoint',
+                     workers=args.workers, extensions=extensions, registry=args.registry,
+                     max_tasks=args.max_tasks)
+    except KeyboardInterrupt:
+        print('已中断，重新运行同一命令即可继续', file=sys.stderr)
+        sys.exit(130)
+    print(json.dumps(stats, ensure_ascii=False), file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
@@ -3,80 +3,158 @@ import docx.oxml as oxml
 from docx.shared import RGBColor, Pt
 from docx.oxml import parse_xml
 from docx.oxml.ns import nsdecls
-from .base import WatermarkBase
+from .base import WatermarkBase, EmbedResult
+from .registry import fingerprint
+from .ooxml import OOXMLPatcher, OOXMLPatchError
 import random
 import json
-import os
-import hashlib
+import time
+
+W_NS = 'http://schemas.openxmlformats.org/wordprocessingml/2006/main'
+RT_STYLES = 'http://schemas.openxmlformats.org/officeDocument/2006/relationships/styles'
+RT_WATERMARK = 'http://schemas.custom.org/watermark'
+CT_XML = 'application/xml'
 
 class WordWatermark(WatermarkBase):
-    def __init__(self):
-        super().__init__()
-        self.watermark_locations = []
+    def embed_watermark(self, file_path, watermark_data, password, patch=True):
+        """在Word文档中嵌入水印，patch 为 True 时只重写被修改的 ZIP 成员
 
-    def embed_watermark(self, file_path, watermark_data, password):
-        """在Word文档中嵌入水印"""
+        返回 EmbedResult，其 output 在 file_path 为路径时是同目录下 processed_ 文件的路径，
+        为 bytes 时是 bytes，为文件对象时是定位到开头的临时文件对象。
+        """
         try:
-            doc = Document(file_path)
+            timestamp = time.time()
+            locations = []
+            timings = {}
             
             # 准备要嵌入的核心数据
             core_data = {
                 'content': watermark_data['content'],
                 'user': watermark_data['user']
             }
+            source = self._as_input(file_path)
+            output = self._open_output(file_path)
             
-            # 1. 在文档样式中嵌入
-            self._embed_in_styles(doc, core_data)
-            
-            # 2. 在文档关系中嵌入
-            self._embed_in_rels(doc, core_data)
-            
-            # 3. 在自定义XML中嵌入
-            self._embed_in_custom_xml(doc, core_data)
+            if patch:
+                try:
+                    with self._timed(timings, 'patch'):
+                        self._embed_by_patch(source, output, core_data, locations)
+                    return EmbedResult(self._finish_output(file_path, output),
+                                       locations, timings, timestamp, fingerprint(core_data))
+                except OOXMLPatchError as e:
+                    print(f"Patch embedding unavailable, falling back: {str(e)}")
+                    self._reset_output(output)
+                    source = self._as_input(source)
+                    locations = []
+            
+            with self._timed(timings, 'load'):
+                doc = Document(source)
+            
+            with self._timed(timings, 'embed'):
+                # 1. 在文档样式中嵌入
+                with self._timed(timings, 'styles'):
+                    self._embed_in_styles(doc, core_data, locations)
+                
+                # 2. 在文档关系中嵌入
+                with self._timed(timings, 'rels'):
+                    self._embed_in_rels(doc, core_data, locations)
             
             # 保存文档
-            output_path = os.path.join(os.path.dirname(file_path), 
-                                     f'processed_{os.path.basename(file_path)}')
-            doc.save(output_path)
-            return output_path
+            with self._timed(timings, 'save'):
+                doc.save(output)
+            return EmbedResult(self._finish_output(file_path, output),
+                               locations, timings, timestamp, fingerprint(core_data))
             
         except Exception as e:
             print(f"Error in embed_watermark: {str(e)}")
             raise
 
-    def _embed_in_styles(self, doc, core_data):
+    def _embed_by_patch(self, source, output, core_data, locations):
+        """直接修改 styles.xml、关系和内容类型并新增 customXml 部件，其余成员原样复制，与完整解析路径的输出一致"""
+        with OOXMLPatcher(source) as package:
+            document = package.main_document_partname()
+            
+            # 1. 在文档样式中嵌入
+            try:
+                styles = package.related_partnames(document, RT_STYLES)
+                if not styles:
+                    raise OOXMLPatchError("文档缺少样式部件")
+                root = package.parse_xml(styles[0])
+                default_style = self._find_style(root, 'Normal')
+                if default_style is None:
+                    raise KeyError("no style with name 'Normal'")
+                rsid_data = self._style_watermark(core_data)
+                default_style.set(f'{{{W_NS}}}rsid', json.dumps(rsid_data))
+                package.write_xml(styles[0], root)
+                locations.append(('style', rsid_data['rsid']))
+            except OOXMLPatchError:
+                raise
+            except Exception as e:
+                print(f"Error embedding in styles: {str(e)}")
+            
+            # 2. 在文档关系中嵌入
+            partname = package.next_partname('/customXml/item%d.xml')
+            package.write(partname, self._rels_watermark_xml(core_data))
+            package.ensure_content_type(partname, CT_XML)
+            rel_id = package.add_relationship(document, RT_WATERMARK, partname)
+            locations.append(('rel', rel_id))
+            
+            package.save(output)
+
+    @staticmethod
+    def _find_style(styles_root, name):
+        """按名称查找样式元素，找不到时按样式 ID 查找（与 python-docx 一致）"""
+        for style in styles_root.iterfind(f'{{{W_NS}}}style'):
+            style_name = style.find(f'{{{W_NS}}}name')
+            if style_name is not None and style_name.get(f'{{{W_NS}}}val') == name:
+                return style
+        for style in styles_root.iterfind(f'{{{W_NS}}}style'):
+            if style.get(f'{{{W_NS}}}styleId') == name:
+                return style
+        return None
+
+    def _style_watermark(self, core_data):
+        """生成样式中嵌入的 rsid 数据"""
+        return {
+            'rsid': fingerprint(core_data)[:8],
+            'data': self._hide_in_property(json.dumps(core_data))
+        }
+
+    def _rels_watermark_xml(self, core_data):
+        """生成通过关系引用的自定义XML部件内容"""
+        custom_xml = f"""<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+            <w:watermark xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main">
+                <w:data>{self._hide_in_property(json.dumps(core_data))}</w:data>
+            </w:watermark>"""
+        return custom_xml.encode('utf-8')
+
+    def _embed_in_styles(self, doc, core_data, locations):
         """在文档样式中嵌入水印"""
         try:
             # 获取默认样式
             default_style = doc.styles['Normal']._element
             
             # 生成唯一的rsid值并存储完整数据
-            rsid_data = {
-                'rsid': hashlib.sha256(json.dumps(core_data).encode()).hexdigest()[:8],
-                'data': self._hide_in_property(json.dumps(core_data))
-            }
+            rsid_data = self._style_watermark(core_data)
             
             # 在样式属性中嵌入信息
             default_style.set('{http://schemas.openxmlformats.org/wordprocessingml/2006/main}rsid', 
                              json.dumps(rsid_data))
             
             # 记录位置
-            self.watermark_locations.append(('style', rsid_data['rsid']))
+            locations.append(('style', rsid_data['rsid']))
             
         except Exception as e:
             print(f"Error embedding in styles: {str(e)}")
 
-    def _embed_in_rels(self, doc, core_data):
+    def _embed_in_rels(self, doc, core_data, locations):
         """在文档关系中嵌入水印"""
         try:
             # 获取文档主要部分
             main_part = doc.part
             
             # 创建一个新的自定义XML部分，使用标准的 Office 命名空间
-            custom_xml = f"""<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
-            <w:watermark xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main">
-                <w:data>{self._hide_in_property(json.dumps(core_data))}</w:data>
-            </w:watermark>"""
+            custom_xml = self._rels_watermark_xml(core_data)
             
             # 使用 document_part 添加自定义XML部分
             from docx.opc.part import Part
@@ -90,7 +168,7 @@ class WordWatermark(WatermarkBase):
             part = Part(
                 uri,  # 使用 PackURI 对象
                 CT.XML,
-                custom_xml.encode('utf-8'),
+                custom_xml,
                 main_part.package  # 添加 package 引用
             )
             
@@ -98,52 +176,19 @@ class WordWatermark(WatermarkBase):
             main_part.package.parts.append(part)
             
             # 添加关系
-            rel_id = main_part.relate_to(part, 'http://schemas.custom.org/watermark')
+            rel_id = main_part.relate_to(part, RT_WATERMARK)
             
             # 记录位置
-            self.watermark_locations.append(('rel', rel_id))
+            locations.append(('rel', rel_id))
             
         except Exception as e:
             print(f"Error embedding in rels: {str(e)}")
 
-    def _embed_in_custom_xml(self, doc, core_data):
-        """在自定义XML中嵌入水印"""
-        try:
-            # 获取文档主要部分
-            main_part = doc.part
-            
-            # 创建自定义XML，使用标准的 Office 命名空间
-            custom_xml = f"""<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
-            <w:settings xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main">
-                <w:watermarkData>{self._hide_in_property(json.dumps(core_data))}</w:watermarkData>
-                <w:hash>{hashlib.sha256(json.dumps(core_data).encode()).hexdigest()}</w:hash>
-            </w:settings>"""
-            
-            # 使用 document_part 添加自定义XML部分
-            from docx.opc.part import Part
-            from docx.opc.constants import CONTENT_TYPE as CT
-            
-            # 创建新的部分
-            part = Part(
-                main_part.package.parts,  # 使用 parts 集合
-                '/customXml/item2.xml',
-                CT.XML,
-                custom_xml.encode('utf-8')
-            )
-            
-            # 添加到文档部分集合
-            main_part.package.parts.append(part)  # 使用 main_part 而不是 doc.part
-            
-            # 记录位置
-            self.watermark_locations.append(('xml', part.partname))
-            
-        except Exception as e:
-            print(f"Error embedding in custom xml: {str(e)}")
-
     def extract_watermark(self, file_path):
-        """从Word文档中提取水印"""
+        """从Word文档中提取水印，file_path 也可以是 bytes 或文件对象"""
         try:
-            doc = Document(file_path)
+            with self._timed(None, 'load', 'extract'):
+                doc = Document(self._as_input(file_path))
             watermark_data = None
             
             # 1. 从样式中提取
@@ -248,23 +293,6 @@ class WordWatermark(WatermarkBase):
             print(f"Error extracting from custom xml: {str(e)}")
             return None
 
-    def _hide_in_property(self, text):
-        """将信息隐藏在属性值中"""
-        if not text:
-            return ''
-        # 使用特殊字符混淆数据
-        chars = list(text)
-        for i in range(len(chars)):
-            if i % 2 == 0:
-                chars.insert(i, '\u200b')
-        return ''.join(chars)
-
-    def _reveal_from_property(self, text):
-        """从属性值中提取信息"""
-        if not text:
-            return ''
-        return ''.join(c for c in text if c != '\u200b')
-
     def _combine_watermark_parts(self, parts):
         """合并并验证水印部分"""
         if not parts:
@@ -0,0 +1,168 @@
+"""零宽字符编解码
+
+所有实现都基于查表 (str.translate / 预计算表) 和整体拼接，
+编码与解码的耗时与数据长度成线性关系。
+"""
+import re
+
+ZERO_WIDTH_SPACE = '\u200b'  # 零宽空格
+ZERO_WIDTH_NON_JOINER = '\u200c'  # 零宽非连接符
+ZERO_WIDTH_JOINER = '\u200d'  # 零宽连接符
+
+# 八进制编码使用的 8 个字符，顺序与 WatermarkCrypto.ZERO_WIDTH_CHARS 一致
+OCTAL_ALPHABET = '\u200b\u200c\u200d\u2060\u2061\u2062\u2063\u2064'
+
+# 十六进制编码使用的 16 个不可见字符，每个字符携带 4 位
+NIBBLE_ALPHABET = (
+    '\u200b\u200c\u200d\u2060\u2061\u2062\u2063\u2064'
+    '\u206a\u206b\u206c\u206d\u206e\u206f\ufeff\u034f'
+)
+
+_filters = {}
+_digit_tables = {}
+_char_tables = {}
+
+
+def _keep_only(text, alphabet):
+    """删除 text 中不属于 alphabet 的字符"""
+    pattern = _filters.get(alphabet)
+    if pattern is None:
+        pattern = _filters[alphabet] = re.compile('[^%s]+' % re.escape(alphabet))
+    return pattern.sub('', text)
+
+
+def _to_digits(text, alphabet, digits):
+    """将只含 alphabet 字符的 text 逐字符映射为 digits 中对应的数字字符"""
+    table = _digit_tables.get(alphabet)
+    if table is None:
+        low_bytes = bytes(ord(c) & 0xFF for c in alphabet)
+        if all(ord(c) < 0x10000 for c in alphabet) and len(set(low_bytes)) == len(alphabet):
+            # 各字符 UTF-16 低字节互不相同时，可直接在字节层面查表
+            table = bytes.maketrans(low_bytes, digits.encode())
+        else:
+            table = str.maketrans(alphabet, digits)
+        _digit_tables[alphabet] = table
+    if isinstance(table, bytes):
+        return text.encode('utf-16-le')[0::2].translate(table).decode('ascii')
+    return text.translate(table)
+
+
+def _from_digits(digits, digit_chars, alphabet):
+    """_to_digits 的逆过程，将数字字符映射回 alphabet 中的字符"""
+    table = _char_tables.get(alphabet)
+    if table is None:
+        high = {ord(c) >> 8 for c in alphabet}
+        if all(ord(c) < 0x10000 for c in alphabet) and len(high) == 1:
+            # 同一 UTF-16 高字节时，只需查表生成低字节再统一填充高字节
+            low_bytes = bytes(ord(c) & 0xFF for c in alphabet)
+            table = (bytes.maketrans(digit_chars.encode(), low_bytes), high.pop())
+        else:
+            table = str.maketrans(digit_chars, alphabet)
+        _char_tables[alphabet] = table
+    if isinstance(table, tuple):
+        low_table, high_byte = table
+        buffer = bytearray([high_byte]) * (2 * len(digits))
+        buffer[0::2] = digits.encode('ascii').translate(low_table)
+        return buffer.decode('utf-16-le')
+    return digits.translate(table)
+
+
+# ---- 二进制编码: 每个零宽字符表示 1 位 ----
+
+_LATIN1_BITS = {i: format(i, '08b') for i in range(256)}
+
+
+def text_to_bits(text):
+    """将每个字符转换为至少 8 位的二进制字符串 (format(ord(c), '08b'))"""
+    if not text or max(text) <= '\xff':
+        return text.translate(_LATIN1_BITS)
+    return ''.join(format(ord(c), '08b') for c in text)
+
+
+def encode_bits(bits, zero=ZERO_WIDTH_SPACE, one=ZERO_WIDTH_JOINER):
+    """将 '0'/'1' 组成的字符串转换为零宽字符"""
+    return _from_digits(bits, '01', zero + one)
+
+
+def decode_bits(text, zero=ZERO_WIDTH_SPACE, one=ZERO_WIDTH_JOINER):
+    """提取 text 中的零宽字符并还原为 '0'/'1' 字符串"""
+    return _to_digits(_keep_only(text, zero + one), zero + one, '01')
+
+
+def bits_to_bytes(bits):
+    """将位串转换为字节，不足 8 位的部分在末尾补 0"""
+    if not bits:
+        return b''
+    remainder = len(bits) % 8
+    if remainder:
+        bits += '0' * (8 - remainder)
+    return int(bits, 2).to_bytes(len(bits) // 8, 'big')
+
+
+# ---- 八进制编码: 每个字节用 8 个八进制位表示，每位一个零宽字符 ----
+
+_OCTAL_TO_ZW = str.maketrans('01234567', OCTAL_ALPHABET)
+_OCTAL_TABLE = [format(b, '08o').translate(_OCTAL_TO_ZW) for b in range(256)]
+
+
+def encode_octal(data):
+    """将字节编码为零宽字符，每个字节对应 8 个字符"""
+    return ''.join(map(_OCTAL_TABLE.__getitem__, data))
+
+
+def decode_octal(text):
+    """从 text 中提取八进制零宽字符并还原字节，末尾不完整的分组被忽略"""
+    digits = _to_digits(_keep_only(text, OCTAL_ALPHABET), OCTAL_ALPHABET, '01234567')
+    groups = len(digits) // 8
+    if not groups:
+        return b''
+    # 8 个八进制位恰好是 24 位，整体转换后每 3 个字节对应原来的一个分组
+    raw = int(digits[:groups * 8], 8).to_bytes(groups * 3, 'big')
+    if raw[0::3].count(0) != groups or raw[1::3].count(0) != groups:
+        raise ValueError("零宽字符数据中包含超出单字节范围的分组")
+    return raw[2::3]
+
+
+def count_octal(text):
+    """统计 text 中八进制零宽字符的数量"""
+    return len(_keep_only(text, OCTAL_ALPHABET))
+
+
+# ---- 十六进制编码: 每个零宽字符表示 4 位，每个字节对应 2 个字符 ----
+
+_NIBBLE_TABLE = [NIBBLE_ALPHABET[b >> 4] + NIBBLE_ALPHABET[b & 0xF] for b in range(256)]
+
+
+def encode_nibbles(data):
+    """将字节编码为零宽字符，每个字节对应 2 个字符"""
+    return ''.join(map(_NIBBLE_TABLE.__getitem__, data))
+
+
+def nibble_digits(text):
+    """提取 text 中的十六进制零宽字符，返回对应的十六进制数字串"""
+    return _to_digits(_keep_only(text, NIBBLE_ALPHABET), NIBBLE_ALPHABET, '0123456789abcdef')
+
+
+_ANY_ZERO_WIDTH = re.compile('[%s]' % re.escape(NIBBLE_ALPHABET))
+
+
+def contains_any(text):
+    """判断 text 中是否含有本模块使用的任一零宽字符（各编码的字符均包含在十六进制字母表中）"""
+    return _ANY_ZERO_WIDTH.search(text) is not None
+
+
+# ---- 属性值混淆: 在前半部分的每个字符前插入零宽空格 ----
+
+def interleave(text, mark=ZERO_WIDTH_SPACE):
+    """在 text 前一半（向上取整）的每个字符前插入 mark"""
+    if not text:
+        return ''
+    half = (len(text) + 1) // 2
+    return mark + mark.join(text[:half]) + text[half:]
+
+
+def strip(text, mark=ZERO_WIDTH_SPACE):
+    """删除 text 中所有的 mark"""
+    if not text:
+        return ''
+    return text.replace(mark, '')
@@ -0,0 +1,75 @@
+"""边生成边输出的 ZIP 打包：每个条目写入后立即产出字节，内存占用与单个文件块大小相当"""
+import os
+import zipfile
+
+DEFAULT_CHUNK_SIZE = 64 * 1024
+
+
+class _Sink:
+    """只写、不可定位的输出缓冲，zipfile 写入后由生成器取走"""
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def unique_name(name, used):
+    """同名条目追加序号，避免解压时互相覆盖；used 为已使用条目名的集合"""
+    if name not in used:
+        used.add(name)
+        return name
+    stem, ext = os.path.splitext(name)
+    index = 1
+    while f'{stem} ({index}){ext}' in used:
+        index += 1
+    name = f'{stem} ({index}){ext}'
+    used.add(name)
+    return name
+
+
+def iter_zip(entries, chunk_size=DEFAULT_CHUNK_SIZE, compression=zipfile.ZIP_STORED):
+    """逐条打包 entries 中的 (条目名, 文件路径或 bytes)，以生成器形式返回 ZIP 字节
+
+    entries 可以是生成器：只有上一个条目完全写出后才会取下一个，
+    因此调用方可以在 yield 之后安全地删除已写出的文件。条目名需由调用方保证唯一（见 unique_name）。
+    水印输出本身已是压缩格式，默认使用 ZIP_STORED 不再重复压缩。
+    """
+    sink = _Sink()
+    with zipfile.ZipFile(sink, 'w', compression=compression) as archive:
+        for name, source in entries:
+            info = zipfile.ZipInfo(name)
+            info.compress_type = compression
+            if isinstance(source, (bytes, bytearray)):
+                info.file_size = len(source)
+                with archive.open(info, 'w') as dest:
+                    dest.write(source)
+            else:
+                # 预先给出大小，zipfile 据此决定是否需要 ZIP64
+                info.file_size = os.path.getsize(source)
+                with open(source, 'rb') as src, archive.open(info, 'w') as dest:
+                    while True:
+                        chunk = src.read(chunk_size)
+                        if not chunk:
+                            break
+                        dest.write(chunk)
+                        data = sink.drain()
+                        if data:
+                            yield data
+            data = sink.drain()
+            if data:
+                yield data
+    # 关闭时写出中央目录
+    data = sink.drain()
+    if data:
+        yield data